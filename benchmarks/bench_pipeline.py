@@ -0,0 +1,629 @@
+"""
+Benchmarks the query, fetch, validation, mapping and execution stages end to end against
+local stand-ins of all services the client talks to:
+
+- a TPM serving the records of fdo_records.json (or of generate_fdos.py), with the URLs in the records pointed at the
+  stand-ins below (license URLs are kept, as the validation compares them literally),
+- a SPARQL endpoint answering the queries over graphs/FDO-Graph.ttl with rdflib,
+- the dh_api and mri_api operations, each in its own process, and
+- a content server returning a synthetic DICOM image for zenodo and b2share URLs and a
+  synthetic SKOS vocabulary (or the JSON the vocabulary APIs return) for all others.
+
+The report holds the records/s, requests/s, the p50/p99 latencies and the peak RSS of the
+client per stage, as JSON to compare between commits.
+
+Usage:
+    python benchmarks/bench_pipeline.py run --repeat 3 --output bench.json
+    python benchmarks/bench_pipeline.py compare before.json after.json --threshold 10
+"""
+import argparse
+import ast
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root_dir)
+
+# The operations of the records are served on these addresses by the example operation APIs
+OPERATION_ADDRESSES = {"127.0.0.1:5002": "mri_api", "127.0.0.1:5003": "dh_api"}
+URL_PATTERN = re.compile(r"https?://[^\s'\"<>]+")
+
+OPERATION_CHILD = '''
+import sys
+sys.path.insert(0, {path!r})
+from werkzeug.serving import run_simple
+import {module}
+run_simple("127.0.0.1", {port}, {module}.app, threaded=True)
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rewrite_urls(value, content_url, operation_urls):
+    """
+    Points the URLs in a record value at the stand-ins.
+
+    Args:
+        value (str, list or dict): The value.
+        content_url (str): The base URL of the content server, the original host is kept as first path segment.
+        operation_urls (dict): Maps the addresses of the operations to the base URLs of their stand-ins.
+
+    Returns:
+        The value with rewritten URLs.
+    """
+    if isinstance(value, str):
+        def replace(match):
+            parts = urlsplit(match.group(0))
+            base = operation_urls.get(parts.netloc, f"{content_url}/{parts.netloc}")
+            return base + parts.path + (f"?{parts.query}" if parts.query else "")
+        return URL_PATTERN.sub(replace, value)
+    if isinstance(value, list):
+        return [rewrite_urls(item, content_url, operation_urls) for item in value]
+    if isinstance(value, dict):
+        return {key: rewrite_urls(item, content_url, operation_urls) for key, item in value.items()}
+    return value
+
+
+def structure_values(value):
+    """
+    Parses the values of a record holding dictionaries as strings, as the TPM returns them as JSON objects.
+    """
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+    if isinstance(value, list):
+        return [structure_values(item) for item in value]
+    if isinstance(value, dict):
+        return {key: structure_values(item) for key, item in value.items()}
+    return value
+
+
+def synthetic_dicom(size):
+    """
+    Creates a DICOM file of an MR image with random 12 bit pixels.
+
+    Args:
+        size (int): The number of rows and columns.
+
+    Returns:
+        bytes: The DICOM file.
+    """
+    import numpy
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = MRImageStorage
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset = Dataset()
+    dataset.file_meta = file_meta
+    dataset.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    dataset.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    dataset.Modality = "MR"
+    dataset.Rows = dataset.Columns = size
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = "MONOCHROME2"
+    dataset.BitsAllocated = 16
+    dataset.BitsStored = 12
+    dataset.HighBit = 11
+    dataset.PixelRepresentation = 0
+    dataset.PixelData = numpy.random.default_rng(0).integers(0, 4096, (size, size), dtype=numpy.uint16).tobytes()
+    buffer = io.BytesIO()
+    try:
+        pydicom.dcmwrite(buffer, dataset, enforce_file_format=True)
+    except TypeError:
+        # pydicom < 3
+        pydicom.dcmwrite(buffer, dataset, write_like_original=False)
+    return buffer.getvalue()
+
+
+def synthetic_vocabulary(concepts, turtle=False):
+    """
+    Creates a SKOS concept scheme.
+
+    Args:
+        concepts (int): The number of concepts.
+        turtle (bool, optional): Serialize as Turtle instead of RDF/XML. Defaults to False.
+
+    Returns:
+        bytes: The serialized vocabulary.
+    """
+    scheme = "http://example.org/vocabulary"
+    if turtle:
+        lines = ["@prefix skos: <http://www.w3.org/2004/02/skos/core#> .",
+                 f"<{scheme}> a skos:ConceptScheme ."]
+        lines.extend(f'<{scheme}/c{index}> a skos:Concept ; skos:inScheme <{scheme}> ; skos:prefLabel "Concept {index}"@en .'
+                     for index in range(concepts))
+        return "\n".join(lines).encode()
+    lines = ['<?xml version="1.0" encoding="utf-8"?>',
+             '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:skos="http://www.w3.org/2004/02/skos/core#">',
+             f'<skos:ConceptScheme rdf:about="{scheme}"/>']
+    lines.extend(f'<skos:Concept rdf:about="{scheme}/c{index}"><skos:inScheme rdf:resource="{scheme}"/>'
+                 f'<skos:prefLabel xml:lang="en">Concept {index}</skos:prefLabel></skos:Concept>' for index in range(concepts))
+    lines.append('</rdf:RDF>')
+    return "\n".join(lines).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type, head=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+class TPMHandler(StandInHandler):
+    """
+    Serves the records like the PID endpoint of the TPM: GET /pids/<pid>.
+    """
+
+    def do_GET(self):
+        record = self.server.get_record(self.path[len("/pids/"):])
+        if record is None:
+            self.send_body(404, b'{"error": "Unknown PID"}', "application/json")
+        else:
+            self.send_body(200, record, "application/json")
+
+
+class SPARQLHandler(StandInHandler):
+    """
+    Answers SPARQL queries posted as form data with JSON results.
+    """
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+        try:
+            with self.server.lock:
+                body = self.server.graph.query(form["query"][0]).serialize(format="json")
+            self.send_body(200, body, "application/sparql-results+json")
+        except Exception as e:
+            self.send_body(400, str(e).encode(), "text/plain")
+
+
+class ContentHandler(StandInHandler):
+    """
+    Serves synthetic content for the original URLs, whose host is the first path segment.
+    """
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def respond(self, head):
+        parts = urlsplit(self.path)
+        host = parts.path.lstrip("/").split("/", 1)[0]
+        if "zenodo" in host or "b2share" in host:
+            self.send_body(200, self.server.dicom, "application/dicom", head)
+        elif parts.path.endswith("vocabularyStatistics"):
+            self.send_body(200, json.dumps({"concepts": {"count": self.server.concepts}}).encode(), "application/json", head)
+        elif parts.path.endswith(".json"):
+            self.send_body(200, b'{"prefLabel": {"de": "Synthetisch", "en": "Synthetic"}}', "application/json", head)
+        elif "turtle" in parts.query or parts.path.endswith(".ttl"):
+            self.send_body(200, self.server.turtle, "text/turtle", head)
+        else:
+            self.send_body(200, self.server.rdfxml, "application/rdf+xml", head)
+
+
+def load_records(path):
+    """
+    Loads the records served by the TPM stand-in.
+
+    JSON lines files, as written by generate_fdos.py, are indexed by the offset of each line and
+    read on request, so millions of records do not have to be held in memory.
+
+    Returns:
+        callable: Returns the record of a PID, None if there is none.
+    """
+    if not path.endswith(".jsonl"):
+        with open(path) as file:
+            records = json.load(file)
+        return records.get
+    offsets = {}
+    with open(path, "rb") as file:
+        offset = 0
+        for line in file:
+            # The PID is the first key of every line
+            offsets[json.loads(line)["pid"]] = offset
+            offset += len(line)
+    file = open(path, "rb")
+    file_lock = threading.Lock()
+
+    def lookup(pid):
+        if pid not in offsets:
+            return None
+        with file_lock:
+            file.seek(offsets[pid])
+            return json.loads(file.readline())
+
+    return lookup
+
+
+def serve(args):
+    """
+    Runs the TPM, SPARQL and content stand-ins until the process is terminated.
+    """
+    import rdflib
+
+    with open(os.path.join(root_dir, "configs/tpm_keys_config_path.json")) as file:
+        license_key = json.load(file)["license"]
+    lookup = load_records(args.records)
+    content_url = f"http://127.0.0.1:{args.content_port}"
+    operation_urls = {address: f"http://127.0.0.1:{port}"
+                      for address, port in zip(OPERATION_ADDRESSES, (args.mri_port, args.dh_port))}
+    prepared = {}
+    prepared_lock = threading.Lock()
+
+    def get_record(pid):
+        # Records are prepared once, on their first request
+        with prepared_lock:
+            if pid not in prepared:
+                record = lookup(pid)
+                if record is None:
+                    return None
+                record = structure_values(record)
+                record["entries"] = {key: values if key == license_key else rewrite_urls(values, content_url, operation_urls)
+                                     for key, values in record["entries"].items()}
+                prepared[pid] = json.dumps(record).encode()
+            return prepared[pid]
+
+    tpm_server = ThreadingHTTPServer(("127.0.0.1", args.tpm_port), TPMHandler)
+    tpm_server.get_record = get_record
+    sparql_server = ThreadingHTTPServer(("127.0.0.1", args.sparql_port), SPARQLHandler)
+    sparql_server.graph = rdflib.Graph()
+    sparql_server.graph.parse(args.graph)
+    sparql_server.lock = threading.Lock()
+    content_server = ThreadingHTTPServer(("127.0.0.1", args.content_port), ContentHandler)
+    content_server.dicom = synthetic_dicom(args.dicom_size)
+    content_server.concepts = args.concepts
+    content_server.rdfxml = synthetic_vocabulary(args.concepts)
+    content_server.turtle = synthetic_vocabulary(args.concepts, turtle=True)
+
+    for server in (tpm_server, sparql_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    content_server.serve_forever()
+
+
+class StandIns:
+    """
+    Starts the stand-in processes and stops them when the block is left.
+    """
+
+    def __init__(self, args, log_dir):
+        self.args = args
+        self.log_dir = log_dir
+        self.ports = {name: free_port() for name in ("tpm", "sparql", "content", "mri_api", "dh_api")}
+        self.processes = {}
+
+    def start(self, name, command):
+        log_file = open(os.path.join(self.log_dir, f"{name}.log"), "w")
+        self.processes[name] = (subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT), log_file)
+
+    def __enter__(self):
+        ports = self.ports
+        self.start("services", [sys.executable, os.path.abspath(__file__), "serve", "--records", self.args.records,
+                                "--graph", self.args.graph, "--tpm-port", str(ports["tpm"]),
+                                "--sparql-port", str(ports["sparql"]), "--content-port", str(ports["content"]),
+                                "--mri-port", str(ports["mri_api"]), "--dh-port", str(ports["dh_api"]),
+                                "--dicom-size", str(self.args.dicom_size), "--concepts", str(self.args.concepts)])
+        for module in ("mri_api", "dh_api"):
+            code = OPERATION_CHILD.format(path=os.path.join(root_dir, "example_operations"), module=module, port=ports[module])
+            self.start(module, [sys.executable, "-c", code])
+        self.wait({"services": ("tpm", "sparql", "content"), "mri_api": ("mri_api",), "dh_api": ("dh_api",)})
+        return self
+
+    def wait(self, expected, timeout=120):
+        deadline = time.monotonic() + timeout
+        for name, port_names in expected.items():
+            process, log_file = self.processes[name]
+            for port_name in port_names:
+                while process.poll() is None:
+                    try:
+                        socket.create_connection(("127.0.0.1", self.ports[port_name]), timeout=1).close()
+                        break
+                    except OSError:
+                        if time.monotonic() > deadline:
+                            raise RuntimeError(f"The {name} stand-in did not start within {timeout} s")
+                        time.sleep(0.1)
+            if process.poll() is not None:
+                log_file.flush()
+                with open(log_file.name) as log:
+                    tail = log.read()[-2000:]
+                if name == "services":
+                    raise RuntimeError(f"The service stand-ins failed to start:\n{tail}")
+                # The run continues, the requests to this operation fail and are counted as such
+                print(f"The {name} stand-in failed to start, its requests will fail:\n{tail}", file=sys.stderr)
+
+    def peak_rss(self):
+        """
+        Returns the peak RSS of the running stand-in processes in MiB (Linux only).
+        """
+        peaks = {}
+        for name, (process, _) in self.processes.items():
+            try:
+                with open(f"/proc/{process.pid}/status") as status:
+                    peaks[name] = next(int(line.split()[1]) / 1024 for line in status if line.startswith("VmHWM:"))
+            except (OSError, StopIteration):
+                peaks[name] = None
+        return peaks
+
+    def __exit__(self, exc_type, exc, traceback):
+        for process, log_file in self.processes.values():
+            process.terminate()
+        for process, log_file in self.processes.values():
+            process.wait()
+            log_file.close()
+        return False
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes, the peak so far where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class RSSSampler(threading.Thread):
+    """
+    Samples the RSS of the process and keeps the peak per stage with calls in progress.
+    """
+
+    def __init__(self, timer, interval=0.005):
+        super().__init__(daemon=True)
+        self.timer = timer
+        self.interval = interval
+        self.peak = 0
+        self.stage_peaks = dict.fromkeys(timer.stages, 0)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        rss = current_rss()
+        self.peak = max(self.peak, rss)
+        for name in self.timer.active():
+            self.stage_peaks[name] = max(self.stage_peaks[name], rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+def run_once(args, ports):
+    """
+    Runs the query and the pipeline once with freshly created services.
+
+    Returns:
+        dict: The summary of the run.
+    """
+    from fdo_batch import build_selection, instrument
+    from modules.sparql_service import SPARQLService
+    from modules.tpm_service import TPMService
+    from modules.record_mapper import RecordMapper
+    from modules.kernel_workflow import KernelWorkflow
+    from modules.query_processing import QueryProcessing
+    from modules.ops_executor import Ops_Executor
+    from modules.execution_cache import ExecutionCache
+    from modules.pipeline import Pipeline
+
+    tpm_keys_config_path = os.path.join(root_dir, "configs/tpm_keys_config_path.json")
+    sparql_service = SPARQLService(f"http://127.0.0.1:{ports['sparql']}/query")
+    tpm_service = TPMService({"local_records": False, "address": "", "pid_enpoint": f"http://127.0.0.1:{ports['tpm']}/pids/"})
+    cache = ExecutionCache(os.path.abspath(".execution_cache")) if args.cache else None
+    executor = Ops_Executor(max_workers=args.workers, per_host_limit=args.per_host_limit, cache=cache)
+    query_processing = QueryProcessing()
+    validator = KernelWorkflow(tpm_keys_config_path)
+    mapper = RecordMapper(tpm_keys_config_path)
+    pipeline = Pipeline(tpm_service, validator, mapper, executor)
+    timer = instrument(sparql_service, query_processing, tpm_service, validator, mapper, executor)
+
+    sampler = RSSSampler(timer)
+    sampler.start()
+    start = time.perf_counter()
+    results = sparql_service.execute_query(sparql_service.construct_query1(args.profiles))
+    if not isinstance(results, dict):
+        raise RuntimeError(results)
+    selection = build_selection("profiles", query_processing.restructure_query_result(results))
+    summary = pipeline.run("profiles", selection)
+    wall_time = time.perf_counter() - start
+    sampler.stop()
+
+    stages = []
+    for name, stats in timer.stages.items():
+        stage = stats.summary(wall_time)
+        stage["peak_rss_mb"] = round(sampler.stage_peaks[name] / 2 ** 20, 1) if sampler.stage_peaks[name] else None
+        stages.append(stage)
+    records = len(timer.stages["fetch"].latencies)
+    requests = len(timer.stages["execute"].latencies)
+    return {
+        "wall_s": round(wall_time, 3),
+        "operations": len(selection),
+        "records": records,
+        "records_per_s": round(records / wall_time, 2),
+        "requests": requests,
+        "requests_per_s": round(requests / wall_time, 2),
+        "succeeded": summary["succeeded"],
+        "failed": summary["failed"],
+        "skipped": summary["skipped"],
+        "peak_rss_mb": round(sampler.peak / 2 ** 20, 1),
+        "stages": stages
+    }
+
+
+def median_summary(runs):
+    """
+    Combines runs into their medians, per stage for the stage latencies, throughput and peak RSS.
+    """
+    def median(values):
+        values = [value for value in values if value is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    summary = {key: median(run[key] for run in runs)
+               for key in ("wall_s", "records_per_s", "requests_per_s", "peak_rss_mb")}
+    summary["stages"] = {stage["stage"]: {key: median(run_stages[stage["stage"]][key] for run_stages in
+                                                      ({item["stage"]: item for item in run["stages"]} for run in runs))
+                                          for key in ("throughput_per_s", "p50_ms", "p99_ms", "peak_rss_mb")}
+                         for stage in runs[0]["stages"]}
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root_dir, check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    args.records = os.path.abspath(args.records)
+    args.graph = os.path.abspath(args.graph)
+    output = os.path.abspath(args.output) if args.output else None
+    work_dir = tempfile.mkdtemp(prefix="fdo_bench_")
+    cwd = os.getcwd()
+    try:
+        with StandIns(args, work_dir) as stand_ins:
+            # Results and the request log are written to the working directory
+            os.chdir(work_dir)
+            runs = []
+            for index in range(args.repeat):
+                runs.append(run_once(args, stand_ins.ports))
+                print(f"run {index + 1}: {runs[-1]['records_per_s']} records/s, {runs[-1]['requests_per_s']} requests/s, "
+                      f"{runs[-1]['failed']} failed, peak RSS {runs[-1]['peak_rss_mb']} MiB", file=sys.stderr)
+            stand_in_rss = stand_ins.peak_rss()
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Kept the working directory {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: getattr(args, key) for key in ("records", "graph", "profiles", "repeat", "workers",
+                                                       "per_host_limit", "dicom_size", "concepts", "cache")},
+        "stand_ins_peak_rss_mb": stand_in_rss,
+        "runs": runs,
+        "summary": median_summary(runs)
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as file:
+            file.write(text + "\n")
+    print(text)
+    return 0
+
+
+def flatten(summary):
+    metrics = {key: value for key, value in summary.items() if key != "stages"}
+    for stage, values in summary["stages"].items():
+        metrics.update({f"{stage}.{key}": value for key, value in values.items()})
+    return metrics
+
+
+def compare(args):
+    """
+    Prints the change of the median metrics between two reports.
+
+    Returns:
+        int: 1 if a throughput dropped or a latency or RSS grew by more than the threshold, 0 otherwise.
+    """
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = flatten(json.load(before_file)["summary"]), flatten(json.load(after_file)["summary"])
+    regressions = []
+    print(f"{'metric':32}{'before':>14}{'after':>14}{'change':>10}")
+    for metric in before:
+        old, new = before[metric], after.get(metric)
+        if not old or new is None:
+            print(f"{metric:32}{str(old):>14}{str(new):>14}{'-':>10}")
+            continue
+        change = (new - old) / old * 100
+        print(f"{metric:32}{old:>14}{new:>14}{change:>+9.1f}%")
+        # Higher is better for throughputs, lower for durations, latencies and memory
+        worse = -change if metric.endswith("per_s") else change
+        if args.threshold is not None and worse > args.threshold:
+            regressions.append(metric)
+    if regressions:
+        print(f"Regressions above {args.threshold}%: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark.")
+    run_parser.add_argument("--records", default=os.path.join(root_dir, "fdo_records.json"), help="Records served by the TPM.")
+    run_parser.add_argument("--graph", default=os.path.join(root_dir, "graphs/FDO-Graph.ttl"), help="Graph queried by the SPARQL endpoint.")
+    run_parser.add_argument("--profiles", default="Medical_Imaging_Data_Type_Profile,Vocabulary_Type_Information_Profile",
+                            help="Comma-separated names of the profiles whose operations are run.")
+    run_parser.add_argument("--repeat", type=int, default=1, help="Number of runs, the summary holds their medians.")
+    run_parser.add_argument("--workers", type=int, default=8, help="Number of concurrent requests.")
+    run_parser.add_argument("--per-host-limit", type=int, default=4, help="Number of concurrent requests per host.")
+    run_parser.add_argument("--dicom-size", type=int, default=256, help="Rows and columns of the synthetic DICOM image.")
+    run_parser.add_argument("--concepts", type=int, default=200, help="Number of concepts of the synthetic vocabulary.")
+    run_parser.add_argument("--cache", action="store_true", help="Use the execution cache, later runs then measure cache hits.")
+    run_parser.add_argument("--keep", action="store_true", help="Keep the working directory with the results and stand-in logs.")
+    run_parser.add_argument("--output", help="Also write the report to this file.")
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports.")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, help="Fail if a metric got worse by more than this percentage.")
+
+    serve_parser = commands.add_parser("serve", help=argparse.SUPPRESS)
+    for option in ("--records", "--graph"):
+        serve_parser.add_argument(option, required=True)
+    for option in ("--tpm-port", "--sparql-port", "--content-port", "--mri-port", "--dh-port", "--dicom-size", "--concepts"):
+        serve_parser.add_argument(option, type=int, required=True)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    return {"run": run, "compare": compare, "serve": serve}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Compares the throughput of the former eval-based request dispatch with the
+structured request specifications sent through the shared session of the Ops_Executor.
+
+Both paths send the same POST requests to a local keep-alive HTTP server, so the
+measurement covers request construction, dispatch and connection handling only.
+
+Usage:
+    python benchmarks/bench_request_dispatch.py --requests 2000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from modules.ops_executor import Ops_Executor
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def legacy_request_string(url, data):
+    """
+    Builds a request string the way the former RecordMapper did.
+    """
+    return "requests.post('" + url + "'" + ", data=" + str(data) + ")"
+
+
+def run_eval_path(url, datas):
+    for data in datas:
+        request_string = legacy_request_string(url, data).replace("'", '"')
+        response = eval(request_string)
+        response.content
+
+
+def run_spec_path(url, datas):
+    executor = Ops_Executor()
+    for data in datas:
+        response = executor.send_request({"method": "POST", "url": url, "data": data})
+        response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000, help='Number of requests per path.')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/total_term_count'
+    datas = [{"base_url": "https://skosmos.loterre.fr/rest/v1/", "vocabulary_id": f"ADM{i}"} for i in range(args.requests)]
+
+    for name, path in (('eval', run_eval_path), ('spec', run_spec_path)):
+        start = time.perf_counter()
+        path(url, datas)
+        duration = time.perf_counter() - start
+        print(f'{name}: {args.requests} requests in {duration:.3f} s ({args.requests / duration:.1f} requests/s)')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
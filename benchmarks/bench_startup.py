@@ -0,0 +1,71 @@
+"""
+Measures the startup of the web application and of the MRI operation API.
+
+Each measurement runs in a fresh interpreter and reports the time to import the Flask
+application and the time of its first request, which includes any deferred imports and
+service construction.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5
+"""
+import argparse
+import json
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+import {module} as application
+imported = time.perf_counter()
+client = application.app.test_client()
+{request}
+first_request = time.perf_counter()
+assert response.status_code < 400, response.status_code
+print(json.dumps({{"import_s": imported - start, "first_request_s": first_request - imported}}))
+'''
+
+TARGETS = {
+    "user_interface": (root_dir, "response = client.get('/execute_query')"),
+    "mri_api": (os.path.join(root_dir, "example_operations"),
+                "response = client.post('/labeled_tensor_normalize', "
+                "data={{'tensor': (open({payload!r}, 'rb'), 'tensor_data.pkl')}}, content_type='multipart/form-data')")
+}
+
+
+def measure(module, payload_path):
+    path, request = TARGETS[module]
+    code = CHILD.format(path=path, module=module, request=request.format(payload=payload_path))
+    output = subprocess.run([sys.executable, '-c', code], cwd=path, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='Number of fresh interpreters per application.')
+    args = parser.parse_args()
+
+    import torch
+
+    with tempfile.NamedTemporaryFile(suffix='.pkl', delete=False) as payload:
+        pickle.dump((torch.randint(0, 255, (1, 64, 64)), torch.tensor(1)), payload)
+    try:
+        for module in TARGETS:
+            runs = [measure(module, payload.name) for _ in range(args.repeat)]
+            import_s = statistics.median(run["import_s"] for run in runs)
+            first_request_s = statistics.median(run["first_request_s"] for run in runs)
+            print(f'{module}: import {import_s * 1000:.1f} ms, first request {first_request_s * 1000:.1f} ms '
+                  f'(median of {args.repeat})')
+    finally:
+        os.remove(payload.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Compares the raw tensor format of modules/tensor_format.py with pickle.
+
+For each tensor shape and format, a fresh process measures
+
+- dump: serializing an (image, label) pair and writing it to a file, as an operation
+  writes its response,
+- load: loading the pair from the file, as a client or the next operation reads it, and
+- load_sum: loading the pair and reading all of its values,
+
+with the median time over the repetitions and the peak RSS growth of the process.
+
+Usage:
+    python benchmarks/bench_tensor_format.py --shapes 1x512x512,100x1x256x256 --repeat 5
+"""
+import argparse
+import json
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root_dir)
+
+FORMATS = ("pickle", "tensor")
+OPERATIONS = ("dump", "load", "load_sum")
+
+
+def memory_kb(field):
+    """
+    Returns a memory field of /proc/self/status in KiB, e.g. VmRSS or VmHWM.
+    """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def reset_peak_rss():
+    """
+    Resets VmHWM to the current RSS, so the setup of a measurement is not included in its peak.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def dump(pair, path, format):
+    from modules import tensor_format
+
+    with open(path, "wb") as file:
+        if format == "pickle":
+            file.write(pickle.dumps(pair))
+        else:
+            chunks, _ = tensor_format.encode(pair)
+            for chunk in chunks:
+                file.write(chunk)
+
+
+def load(path, format):
+    from modules import tensor_format
+
+    if format == "pickle":
+        with open(path, "rb") as file:
+            return pickle.load(file)
+    return tensor_format.load(path)
+
+
+def measure(args):
+    """
+    Runs one operation in this process and prints its timings and peak RSS growth as JSON.
+    """
+    import torch
+
+    shape = [int(size) for size in args.shape.split("x")]
+    pair = (torch.rand(shape), torch.tensor(1))
+    path = os.path.join(args.work_dir, f"pair.{args.format}")
+    dump(pair, path, args.format)
+    if args.operation != "dump":
+        del pair
+    reset_peak_rss()
+    baseline = memory_kb("VmRSS")
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        if args.operation == "dump":
+            dump(pair, path, args.format)
+        else:
+            loaded = load(path, args.format)
+            if args.operation == "load_sum":
+                loaded[0].sum()
+            del loaded
+        times.append(time.perf_counter() - start)
+    print(json.dumps({
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "peak_rss_growth_mb": round((memory_kb("VmHWM") - baseline) / 1024, 1),
+        "file_mb": round(os.path.getsize(path) / 2 ** 20, 1)
+    }))
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for shape in args.shapes.split(","):
+            for operation in OPERATIONS:
+                for format in FORMATS:
+                    output = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--measure", "--shape", shape, "--format", format,
+                         "--operation", operation, "--repeat", str(args.repeat), "--work-dir", work_dir],
+                        check=True, capture_output=True, text=True).stdout
+                    results.append(dict(shape=shape, operation=operation, format=format, **json.loads(output)))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'shape':18}{'operation':10}{'format':8}{'median_ms':>12}{'peak_rss_mb':>14}{'file_mb':>10}")
+    for result in results:
+        print(f"{result['shape']:18}{result['operation']:10}{result['format']:8}{result['median_ms']:>12}"
+              f"{result['peak_rss_growth_mb']:>14}{result['file_mb']:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shapes", default="1x512x512,100x1x256x256,100x1x512x512", help="Comma-separated image tensor shapes.")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--shape", help=argparse.SUPPRESS)
+    parser.add_argument("--format", choices=FORMATS, help=argparse.SUPPRESS)
+    parser.add_argument("--operation", choices=OPERATIONS, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.measure:
+        measure(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
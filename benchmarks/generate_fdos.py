@@ -0,0 +1,319 @@
+"""
+Generates synthetic FDO records and a matching FDO graph for scale tests.
+
+The shape is learned from the existing records and graph: every data FDO with a profile and
+the kernel attributes of configs/tpm_keys_config_path.json is a template, and the operations
+are resolved with the RecordMapper to check which templates provide the value types their
+access protocols require. Synthetic FDOs are copies of the templates with new PIDs, linked to
+copies of the template operations and profiles:
+
+- --operation-copies M creates M instances of every operation (the first is the original),
+- --fan-out K links every synthetic FDO to K of the M instances of each of its operations,
+- --profile-copies P spreads the synthetic FDOs over P instances of each profile (the first
+  keeps the original name, the others are suffixed with _1, _2, ...).
+
+The output contains the original records and graph, so existing profile and operation names
+keep working. Records are written as one JSON object (.json) or one record per line (.jsonl),
+the graph as N-Triples, both streamed so the memory use does not depend on the number of records.
+
+Usage:
+    python benchmarks/generate_fdos.py 100000 --records-out synthetic.jsonl --graph-out synthetic.nt --fan-out 2 --operation-copies 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root_dir)
+
+FDOO = "https://anonymized.org/FDO-Graph#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+# The kernel attributes the validation requires from data records
+KERNEL_KEYS = ("digitalObjectLocation", "dateCreated", "license", "checksum")
+
+
+def predicate(name):
+    return f"<{FDOO}{name}>"
+
+
+class Shape:
+    """
+    The templates learned from the existing records and graph.
+    """
+
+    def __init__(self, records, graph, tpm_keys_config_path):
+        """
+        Initializes the Shape object.
+
+        Args:
+            records (dict): The existing records by PID.
+            graph (rdflib.Graph): The existing FDO graph.
+            tpm_keys_config_path (str): The path to the TPM keys configuration file.
+        """
+        from rdflib import Literal, Namespace, RDF, RDFS
+        from modules.record_mapper import RecordMapper
+        from modules.tpm_service import TPMService
+
+        with open(tpm_keys_config_path) as file:
+            tpm_keys = json.load(file)
+        fdoo = Namespace(FDOO)
+        self.graph = graph
+        self.records = records
+        operations = set(graph.subjects(RDF.type, fdoo.Operation))
+        profiles = set(graph.subjects(RDF.type, fdoo.Profile))
+        label = {node: str(value) for node, value in graph.subject_objects(RDFS.label) if isinstance(value, Literal)}
+
+        # Operations: their PIDs and the value types their HTTP access protocols require
+        mapper = RecordMapper(tpm_keys_config_path)
+        converter = TPMService({"local_records": True, "local_records_dir": ""})
+        self.operations = {}
+        for node in sorted(operations):
+            record = records.get(label.get(node))
+            if record is None:
+                continue
+            entries = converter.convert_string_to_dict(json.loads(json.dumps(record["entries"])))
+            try:
+                plan = mapper.resolve_operation(entries, False).get("http")
+            except KeyError:
+                # Operations without an external record dependent access protocol
+                plan = None
+            self.operations[node] = {
+                "pid": label[node],
+                "value_types": mapper.required_value_types(plan) if plan else [],
+                "method": plan["method"] if plan else None
+            }
+
+        # Templates: data FDOs with a profile, a record and the kernel attributes
+        kernel_types = [tpm_keys[key] for key in KERNEL_KEYS]
+        self.templates = []
+        self.unsatisfied = {}
+        for node in sorted(set(graph.subjects(fdoo.hasProfile, None)) - operations):
+            record = records.get(label.get(node))
+            if record is None or any(key not in record["entries"] for key in kernel_types):
+                continue
+            template_operations = sorted(operation for operation in graph.objects(node, fdoo.hasOperation) if operation in self.operations)
+            for operation in template_operations:
+                if any(value_type not in record["entries"] for value_type in self.operations[operation]["value_types"]):
+                    self.unsatisfied[operation] = self.unsatisfied.get(operation, 0) + 1
+            self.templates.append({
+                "node": node,
+                "pid": label[node],
+                "profiles": sorted(graph.objects(node, fdoo.hasProfile)),
+                "operations": template_operations,
+                "entries": json.dumps(record["entries"])
+            })
+        self.profiles = sorted({profile for template in self.templates for profile in template["profiles"]} & profiles)
+
+    def describe(self):
+        """
+        Returns the learned shape as JSON serializable summary.
+        """
+        return {
+            "templates": len(self.templates),
+            "templates_per_profile": {str(profile)[len(FDOO):]: sum(profile in template["profiles"] for template in self.templates)
+                                      for profile in self.profiles},
+            "operations": {info["pid"]: {"name": str(node)[len(FDOO):], "method": info["method"], "value_types": info["value_types"],
+                                         "templates_missing_value_types": self.unsatisfied.get(node, 0)}
+                           for node, info in self.operations.items()}
+        }
+
+
+class Generator:
+    """
+    Writes the synthetic records and graph.
+    """
+
+    def __init__(self, shape, operation_copies=1, fan_out=1, profile_copies=1, pid_prefix="21.11152", seed=0):
+        if not 1 <= fan_out <= operation_copies:
+            raise ValueError("The fan-out must be between 1 and the number of operation copies")
+        self.shape = shape
+        self.operation_copies = operation_copies
+        self.fan_out = fan_out
+        self.profile_copies = profile_copies
+        self.pid_prefix = pid_prefix
+        self.random = random.Random(seed)
+        self.operation_pids = {node: [info["pid"]] + [self.new_pid() for _ in range(1, operation_copies)]
+                               for node, info in shape.operations.items()}
+
+    def new_pid(self):
+        return f"{self.pid_prefix}/{uuid.UUID(int=self.random.getrandbits(128), version=4)}"
+
+    def copy_node(self, node, index):
+        """
+        Returns the N-Triples term of the index-th instance of an operation or profile.
+        """
+        return node.n3() if index == 0 else f"<{node}_{index}>"
+
+    def write_graph_copies(self, write):
+        """
+        Writes the triples of the operation and profile instances beyond the originals.
+        """
+        graph = self.shape.graph
+        for node in self.shape.operations:
+            for index in range(1, self.operation_copies):
+                copy = self.copy_node(node, index)
+                for p, o in graph.predicate_objects(node):
+                    if str(p) == f"{FDOO}isOperationFor":
+                        continue
+                    if str(p) == RDFS_LABEL:
+                        write(f'{copy} {p.n3()} "{self.operation_pids[node][index]}" .\n')
+                    else:
+                        write(f"{copy} {p.n3()} {o.n3()} .\n")
+                for s, p in graph.subject_predicates(node):
+                    if str(p) != f"{FDOO}hasOperation":
+                        write(f"{s.n3()} {p.n3()} {copy} .\n")
+        for node in self.shape.profiles:
+            for index in range(1, self.profile_copies):
+                copy = self.copy_node(node, index)
+                for p, o in graph.predicate_objects(node):
+                    if str(p) == f"{FDOO}isProfileFor":
+                        continue
+                    if str(p) == RDFS_LABEL:
+                        write(f'{copy} {p.n3()} "{o}_{index}" .\n')
+                    else:
+                        write(f"{copy} {p.n3()} {o.n3()} .\n")
+                for s, p in graph.subject_predicates(node):
+                    if str(p) != f"{FDOO}hasProfile":
+                        write(f"{s.n3()} {p.n3()} {copy} .\n")
+
+    def fdo_triples(self, template):
+        """
+        Precomputes the N-Triples of a template FDO with placeholders for the synthetic FDO.
+
+        The links to operations and profiles depend on the index of the synthetic FDO and are
+        written by generate.
+
+        Returns:
+            str: The format string of the lines with {fdo} and {pid} placeholders.
+        """
+        graph = self.shape.graph
+        node = template["node"]
+        escape = lambda term: term.n3().replace("{", "{{").replace("}", "}}")  # noqa: E731
+        lines = []
+        for p, o in graph.predicate_objects(node):
+            if str(p) in (f"{FDOO}hasOperation", f"{FDOO}hasProfile"):
+                continue
+            if str(p) == RDFS_LABEL:
+                lines.append(f'{{fdo}} {escape(p)} "{{pid}}" .\n')
+            else:
+                lines.append(f"{{fdo}} {escape(p)} {escape(o)} .\n")
+        for s, p in graph.subject_predicates(node):
+            if str(p) not in (f"{FDOO}isOperationFor", f"{FDOO}isProfileFor"):
+                lines.append(f"{escape(s)} {escape(p)} {{fdo}} .\n")
+        return "".join(lines)
+
+    def generate(self, count, records_file, graph_file, jsonl=False, include_original=True, progress=None):
+        """
+        Writes the records and triples of the synthetic FDOs.
+
+        Args:
+            count (int): The number of synthetic FDOs.
+            records_file (file object): The text file the records are written to.
+            graph_file (file object): The text file the N-Triples are written to.
+            jsonl (bool, optional): Write one record per line instead of one JSON object. Defaults to False.
+            include_original (bool, optional): Also write the original records and graph. Defaults to True.
+            progress (callable, optional): Called with the number of written FDOs every 100000 FDOs. Defaults to None.
+        """
+        shape = self.shape
+        first = True
+
+        def write_record(pid, entries_json):
+            nonlocal first
+            pid_json = json.dumps(pid)
+            if jsonl:
+                records_file.write(f'{{"pid": {pid_json}, "entries": {entries_json}}}\n')
+            else:
+                records_file.write(f'{"{" if first else ","}\n{pid_json}: {{"pid": {pid_json}, "entries": {entries_json}}}')
+            first = False
+
+        if include_original:
+            for pid, record in shape.records.items():
+                write_record(pid, json.dumps(record["entries"]))
+            for s, p, o in shape.graph:
+                graph_file.write(f"{s.n3()} {p.n3()} {o.n3()} .\n")
+        for node, pids in self.operation_pids.items():
+            record = shape.records[pids[0]]
+            for pid in pids[1:]:
+                write_record(pid, json.dumps(record["entries"]))
+        self.write_graph_copies(graph_file.write)
+
+        templates = [(template, self.fdo_triples(template)) for template in shape.templates]
+        has_operation, is_operation_for = predicate("hasOperation"), predicate("isOperationFor")
+        has_profile, is_profile_for = predicate("hasProfile"), predicate("isProfileFor")
+        for index in range(count):
+            template, lines = templates[index % len(templates)]
+            pid = self.new_pid()
+            fdo = f"<{FDOO}synthetic_{index}>"
+            write_record(pid, template["entries"])
+            graph_file.write(lines.format(fdo=fdo, pid=pid))
+            profile_index = (index // len(templates)) % self.profile_copies
+            for profile in template["profiles"]:
+                copy = self.copy_node(profile, profile_index) if profile in shape.profiles else profile.n3()
+                graph_file.write(f"{fdo} {has_profile} {copy} .\n{copy} {is_profile_for} {fdo} .\n")
+            for operation in template["operations"]:
+                for offset in range(self.fan_out):
+                    copy = self.copy_node(operation, (index + offset) % self.operation_copies)
+                    graph_file.write(f"{fdo} {has_operation} {copy} .\n{copy} {is_operation_for} {fdo} .\n")
+            if progress is not None and (index + 1) % 100000 == 0:
+                progress(index + 1)
+        if not jsonl:
+            records_file.write("{}\n" if first else "\n}\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("count", type=int, help="Number of synthetic FDOs.")
+    parser.add_argument("--records-out", required=True, help="Output records, one JSON object (.json) or JSON lines (.jsonl).")
+    parser.add_argument("--graph-out", required=True, help="Output graph in N-Triples.")
+    parser.add_argument("--records", default=os.path.join(root_dir, "fdo_records.json"), help="Template records.")
+    parser.add_argument("--graph", default=os.path.join(root_dir, "graphs/FDO-Graph.ttl"), help="Template graph.")
+    parser.add_argument("--tpm-keys", default=os.path.join(root_dir, "configs/tpm_keys_config_path.json"), help="TPM keys configuration.")
+    parser.add_argument("--profiles", help="Comma-separated profile names, only their FDOs are used as templates.")
+    parser.add_argument("--operation-copies", type=int, default=1, help="Instances of every operation.")
+    parser.add_argument("--fan-out", type=int, default=1, help="Instances of each of its operations a synthetic FDO is linked to.")
+    parser.add_argument("--profile-copies", type=int, default=1, help="Instances of every profile the synthetic FDOs are spread over.")
+    parser.add_argument("--no-original", action="store_true", help="Do not include the original records and graph.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated PIDs.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    import rdflib
+
+    graph = rdflib.Graph()
+    graph.parse(args.graph)
+    with open(args.records) as file:
+        records = json.load(file)
+    shape = Shape(records, graph, args.tpm_keys)
+    if args.profiles:
+        names = args.profiles.split(",")
+        shape.templates = [template for template in shape.templates
+                           if any(str(profile)[len(FDOO):] in names for profile in template["profiles"])]
+        shape.profiles = [profile for profile in shape.profiles if str(profile)[len(FDOO):] in names]
+    if not shape.templates:
+        print("No template FDOs found", file=sys.stderr)
+        return 2
+    print(json.dumps(shape.describe(), indent=2), file=sys.stderr)
+
+    generator = Generator(shape, args.operation_copies, args.fan_out, args.profile_copies, seed=args.seed)
+    start = time.perf_counter()
+
+    def progress(written):
+        print(f"{written} FDOs ({written / (time.perf_counter() - start):.0f}/s)", file=sys.stderr)
+
+    buffer_size = 1024 * 1024
+    with open(args.records_out, "w", buffering=buffer_size) as records_file, open(args.graph_out, "w", buffering=buffer_size) as graph_file:
+        generator.generate(args.count, records_file, graph_file, jsonl=args.records_out.endswith(".jsonl"),
+                           include_original=not args.no_original, progress=progress)
+    print(f"Wrote {args.count} synthetic FDOs in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
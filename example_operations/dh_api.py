@@ -4,14 +4,193 @@ import skosify
 import io
 import logging
 import json
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+import codecs
+import re
+from urllib.parse import urljoin
+from xml.etree import ElementTree
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from itertools import chain
 from tempfile import NamedTemporaryFile
 import os
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import FileWrapper
 
 app = Flask(__name__)
-# Configure logging to capture output
-log_capture = io.StringIO()
-logging.basicConfig(stream=log_capture, level=logging.INFO)
+
+# The on-disk cache of downloaded vocabularies, shared by all workers using the same directory
+VOCABULARY_CACHE_DIR = os.environ.get('DH_API_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dh_api_vocabulary_cache'))
+VOCABULARY_MIME_TYPES = {
+    'rdfxml': 'application/rdf+xml',
+    'turtle': 'text/turtle'
+}
+DOWNLOAD_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+SKOS_CONCEPT = "http://www.w3.org/2004/02/skos/core#Concept"
+SKOS_CONCEPT_TAG = "{http://www.w3.org/2004/02/skos/core#}Concept"
+RDF_NS = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDF_TYPE = RDF_NS + "type"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+# The tokens of Turtle. Tokens close to the end of the buffer are only accepted once no
+# further chunk can extend them, e.g. 1.5 into 1.5e+3 or "" into a long string.
+TURTLE_LOOKAHEAD = 16
+TURTLE_SPACE = r"(?:\s+|\#[^\n]*)*"
+TURTLE_TOKEN = re.compile(TURTLE_SPACE + r"""(?:
+    (?P<string>"{3}(?:[^"\\]|\\.|"(?!""))*"{3}|'{3}(?:[^'\\]|\\.|'(?!''))*'{3}|"(?:[^"\\\n\r]|\\.)*"|'(?:[^'\\\n\r]|\\.)*')
+  | (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<lang>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+  | (?P<datatype>\^\^)
+  | (?P<bnode>_:[\w\-.]*[\w\-])
+  | (?P<number>[+-]?(?:\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?))
+  | (?P<name>(?:[^\W\d][\w\-.]*)?:(?:(?:[\w\-:%]|\\.)(?:(?:[\w\-.:%]|\\.)*(?:[\w\-:%]|\\.))?)?|[A-Za-z]+)
+  | (?P<punctuation>[;,.\[\]()])
+)""", re.VERBOSE)
+TURTLE_END = re.compile(TURTLE_SPACE + r"\Z")
+
+# The processes running skosify, 0 to run it in the request thread
+SKOS_WORKERS = int(os.environ.get('DH_API_SKOS_WORKERS', os.cpu_count() or 1))
+# The number of skosify results kept by content hash of the uploaded vocabulary
+SKOS_MEMO_SIZE = int(os.environ.get('DH_API_SKOS_MEMO_SIZE', 128))
+
+_skos_pool = None
+_skos_memo = OrderedDict()
+_skos_lock = threading.Lock()
+
+
+class VocabularyCache:
+    """
+    An on-disk cache of downloaded vocabularies, keyed by base URL, vocabulary ID and format.
+
+    Each entry is a body file and a metadata file with the ETag and Last-Modified validators of
+    the download. Both are replaced atomically, the body first, so an entry never pairs a body
+    with validators of a newer version, and workers sharing the directory see complete entries only.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Initializes the VocabularyCache object.
+
+        Args:
+            cache_dir (str): The directory holding the entries.
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, base_url: str, vocabulary_id: str, format: str) -> str:
+        return hashlib.sha256(json.dumps([base_url, vocabulary_id, format]).encode()).hexdigest()
+
+    def body_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.body")
+
+    def lookup(self, key: str) -> dict:
+        """
+        Returns the validators of an entry, or None if the vocabulary is not cached.
+        """
+        try:
+            with open(os.path.join(self.cache_dir, f"{key}.json")) as file:
+                entry = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry if os.path.exists(self.body_path(key)) else None
+
+    @staticmethod
+    def validators(entry: dict) -> dict:
+        """
+        Builds the headers of a conditional GET revalidating an entry.
+        """
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read(self, key: str) -> bytes:
+        with open(self.body_path(key), 'rb') as file:
+            return file.read()
+
+    def open_body(self, key: str) -> FileWrapper:
+        """
+        Opens the cached body of an entry as an iterable over its chunks.
+        """
+        return FileWrapper(open(self.body_path(key), 'rb'), CHUNK_SIZE)
+
+    def put(self, key: str, content: bytes, headers):
+        """
+        Stores a downloaded vocabulary with the validators of its response headers.
+        """
+        deque(self.tee(key, [content], headers), maxlen=0)
+
+    def tee(self, key: str, chunks, headers):
+        """
+        Writes the chunks of a download into the cache while yielding them.
+
+        The entry is only stored once all chunks were written, a download that fails or whose
+        client disconnects leaves the cache unchanged.
+
+        Args:
+            key (str): The key of the entry.
+            chunks (iterable): The chunks of the body.
+            headers (dict): The response headers holding the validators.
+
+        Yields:
+            bytes: The chunks.
+        """
+        temp_path = os.path.join(self.cache_dir, f".{key}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            with open(temp_path, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            os.replace(temp_path, self.body_path(key))
+            entry = {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+            entry = {name: value if isinstance(value, str) else None for name, value in entry.items()}
+            metadata_path = os.path.join(self.cache_dir, f"{key}.json")
+            with open(temp_path, 'w') as file:
+                json.dump(entry, file)
+            os.replace(temp_path, metadata_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+_vocabulary_cache = None
+
+
+def vocabulary_cache() -> VocabularyCache:
+    """
+    Returns the vocabulary cache, created on first use.
+    """
+    global _vocabulary_cache
+    if _vocabulary_cache is None:
+        _vocabulary_cache = VocabularyCache(VOCABULARY_CACHE_DIR)
+    return _vocabulary_cache
+
+
+def request_vocabulary(base_url: str, vocabulary_id: str, format: str) -> tuple:
+    """
+    Requests a vocabulary in a format, conditionally if it is cached.
+
+    Args:
+        base_url (str): The base URL of the API.
+        vocabulary_id (str): The ID of the vocabulary.
+        format (str): The format, a key of VOCABULARY_MIME_TYPES.
+
+    Returns:
+        tuple: The streamed response and the cache key, and whether the cached entry is still valid.
+    """
+    api_url = f"{base_url}{vocabulary_id}/data?format={VOCABULARY_MIME_TYPES[format]}"
+    cache = vocabulary_cache()
+    key = cache.key(base_url, vocabulary_id, format)
+    entry = cache.lookup(key)
+    response = requests.get(api_url, headers=cache.validators(entry), stream=True, timeout=DOWNLOAD_TIMEOUT)
+    return response, key, entry is not None and response.status_code == 304
 
 
 def get_total_term_count(base_url: str, vocabulary_id: str) -> int:
@@ -50,6 +229,9 @@ def download_rdf_content(base_url: str, vocabulary_id: str) -> tuple:
     """
     Downloads the vocabulary in RDF/XML or turtle format.
 
+    Cached vocabularies are revalidated with their ETag or Last-Modified date and read from the
+    cache if they did not change.
+
     Args:
         base_url (str): The base URL of the API.
         vocabulary_id (str): The ID of the vocabulary.
@@ -57,24 +239,399 @@ def download_rdf_content(base_url: str, vocabulary_id: str) -> tuple:
     Returns:
         tuple: The content of the vocabulary and its MIME type if successful, else (None, None).
     """
-    mime_types = {
-        'rdfxml': 'application/rdf+xml',
-        'turtle': 'text/turtle'
-    }
-    api_url = f"{base_url}{vocabulary_id}/data?format={}"
-    for mime_type in ['rdfxml', 'turtle']:
+    cache = vocabulary_cache()
+    for format in ['rdfxml', 'turtle']:
+        try:
+            response, key, cached = request_vocabulary(base_url, vocabulary_id, format)
+            with response:
+                if cached:
+                    return cache.read(key), VOCABULARY_MIME_TYPES[format]
+                response.raise_for_status()
+
+                if response.content:
+                    cache.put(key, response.content, response.headers)
+                    return response.content, VOCABULARY_MIME_TYPES[format]
+
+        except requests.HTTPError as e:
+            print(f"Error with MIME type '{VOCABULARY_MIME_TYPES[format]}': {e}")
+    return None, None
+
+
+def stream_rdf_content(base_url: str, vocabulary_id: str) -> tuple:
+    """
+    Streams the vocabulary in RDF/XML or turtle format.
+
+    The chunks are relayed as they arrive and written to the cache at the same time. Cached
+    vocabularies are revalidated and streamed from the cache if they did not change.
+
+    Args:
+        base_url (str): The base URL of the API.
+        vocabulary_id (str): The ID of the vocabulary.
+
+    Returns:
+        tuple: An iterator over the content of the vocabulary and its MIME type if successful, else (None, None).
+    """
+    cache = vocabulary_cache()
+    for format in ['rdfxml', 'turtle']:
         try:
-            response = requests.get(api_url.format(mime_types[mime_type]))
+            response, key, cached = request_vocabulary(base_url, vocabulary_id, format)
+            if cached:
+                response.close()
+                return cache.open_body(key), VOCABULARY_MIME_TYPES[format]
             response.raise_for_status()
 
-            if response.content:
-                return response.content, mime_types[mime_type]
+            # The first chunk shows whether the vocabulary is empty, as for the buffered download
+            chunks = (chunk for chunk in response.iter_content(CHUNK_SIZE) if chunk)
+            first_chunk = next(chunks, None)
+            if first_chunk is None:
+                response.close()
+                continue
+            return relay(cache.tee(key, chain([first_chunk], chunks), response.headers), response), VOCABULARY_MIME_TYPES[format]
 
         except requests.HTTPError as e:
-            print(f"Error with MIME type '{mime_types[mime_type]}': {e}")
+            response.close()
+            print(f"Error with MIME type '{VOCABULARY_MIME_TYPES[format]}': {e}")
     return None, None
 
 
+def relay(chunks, response):
+    """
+    Yields the chunks of a streamed download and closes the response afterwards, also if the
+    client disconnects.
+    """
+    try:
+        yield from chunks
+    finally:
+        chunks.close()
+        response.close()
+
+
+class ConceptCounter:
+    """
+    Collects the distinct skos:Concept subjects and the languages of a vocabulary.
+
+    The subjects are kept as 64-bit digests, so the memory grows with the number of concepts
+    but not with the size of the vocabulary file.
+    """
+
+    def __init__(self):
+        self.subjects = set()
+        self.anonymous = 0
+        self.languages = set()
+
+    def add(self, subject: str):
+        """
+        Records a concept, None for a blank node without label.
+        """
+        if subject is None:
+            self.anonymous += 1
+        else:
+            self.subjects.add(hashlib.blake2b(subject.encode(), digest_size=8).digest())
+
+    def result(self) -> dict:
+        return {"concepts": len(self.subjects) + self.anonymous, "languages": sorted(self.languages)}
+
+
+def node_subject(element) -> str:
+    """
+    Returns the subject of an RDF/XML node element, None for a blank node without label.
+    """
+    about = element.get(f"{{{RDF_NS}}}about")
+    if about is not None:
+        return about
+    if element.get(f"{{{RDF_NS}}}ID") is not None:
+        return "#" + element.get(f"{{{RDF_NS}}}ID")
+    if element.get(f"{{{RDF_NS}}}nodeID") is not None:
+        return "_:" + element.get(f"{{{RDF_NS}}}nodeID")
+    return None
+
+
+def count_rdfxml_concepts(chunks) -> dict:
+    """
+    Counts the skos:Concepts of an RDF/XML vocabulary in one streaming pass.
+
+    Concepts are skos:Concept node elements and nodes with an rdf:type property or attribute
+    referring to skos:Concept. Elements are cleared when they end, so the parsed tree never
+    holds more than the open elements.
+
+    Args:
+        chunks (iterable): The vocabulary in chunks of bytes.
+
+    Returns:
+        dict: The number of concepts and the sorted xml:lang values.
+    """
+    counter = ConceptCounter()
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    # The kind and subject of each open element
+    stack = []
+    root = None
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            parser.close()
+        else:
+            parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == "end":
+                stack.pop()
+                element.clear()
+                if len(stack) == 1:
+                    # Drops the ended top-level nodes from the root
+                    root.clear()
+                continue
+            if root is None:
+                root = element
+            language = element.get(XML_LANG)
+            if language:
+                counter.languages.add(language)
+            parent_kind, parent_subject = stack[-1] if stack else (None, None)
+            if parent_kind is None and element.tag == f"{{{RDF_NS}}}RDF":
+                kind, subject = "rdf", None
+            elif parent_kind in (None, "rdf", "property", "collection"):
+                kind, subject = "node", node_subject(element)
+                if element.tag == SKOS_CONCEPT_TAG or element.get(f"{{{RDF_NS}}}type") == SKOS_CONCEPT:
+                    counter.add(subject)
+            elif parent_kind in ("node", "resource"):
+                parse_type = element.get(f"{{{RDF_NS}}}parseType")
+                kind = {"Resource": "resource", "Literal": "literal", "Collection": "collection"}.get(parse_type, "property")
+                subject = None
+                if element.tag == f"{{{RDF_NS}}}type" and element.get(f"{{{RDF_NS}}}resource") == SKOS_CONCEPT:
+                    counter.add(parent_subject)
+            else:
+                kind, subject = "literal", None
+            stack.append((kind, subject))
+    return counter.result()
+
+
+def iter_turtle_tokens(chunks):
+    """
+    Splits a Turtle document into tokens while it is read.
+
+    Args:
+        chunks (iterable): The document in chunks of bytes.
+
+    Yields:
+        tuple: The kind (a group name of TURTLE_TOKEN) and the text of each token.
+
+    Raises:
+        ValueError: If the document contains an invalid token.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    for chunk in chain(chunks, [None]):
+        end_of_input = chunk is None
+        buffer = buffer[position:] + decoder.decode(chunk or b"", final=end_of_input)
+        position = 0
+        limit = len(buffer) if end_of_input else len(buffer) - TURTLE_LOOKAHEAD
+        tokens = []
+        for match in iter(TURTLE_TOKEN.scanner(buffer).match, None):
+            kind, end = match.lastgroup, match.end()
+            value = match.group(kind)
+            # An empty string followed by a quote is the start of a long string
+            if end > limit or (not end_of_input and value in ('""', "''") and buffer[end:end + 1] == value[0]):
+                break
+            tokens.append((kind, value))
+            position = end
+        yield from tokens
+    if not TURTLE_END.match(buffer, position):
+        raise ValueError(f"Invalid Turtle near {buffer[position:position + 40].strip()!r}")
+
+
+def count_turtle_concepts(chunks) -> dict:
+    """
+    Counts the skos:Concepts of a Turtle vocabulary in one streaming pass.
+
+    The tokens are followed through predicate and object lists, blank node property lists and
+    collections, holding only the current statement and the enclosing blank nodes. Concepts
+    are the subjects of rdf:type statements with skos:Concept as object.
+
+    Args:
+        chunks (iterable): The vocabulary in chunks of bytes.
+
+    Returns:
+        dict: The number of concepts and the sorted language tags of the literals.
+    """
+    counter = ConceptCounter()
+    prefixes = {}
+    base = ""
+    # The subject, predicate and state to return to after each open blank node or collection
+    stack = []
+    subject = predicate = None
+    state = "subject"
+    directive = None
+    previous_kind = None
+    skip_datatype = False
+
+    def resolve(kind, value):
+        if kind == "iri":
+            return urljoin(base, value[1:-1]) if base else value[1:-1]
+        if kind == "name" and ":" in value:
+            prefix, local = value.split(":", 1)
+            return prefixes.get(prefix, prefix + ":") + local.replace("\\", "")
+        if kind == "name" and value == "a":
+            return RDF_TYPE
+        return value if kind == "bnode" else None
+
+    for kind, value in iter_turtle_tokens(chunks):
+        if directive is not None:
+            # @prefix and @base end with a dot, PREFIX and BASE after their arguments
+            name, arguments, sparql_style = directive
+            if kind in ("name", "iri"):
+                arguments.append((kind, value))
+            if (sparql_style and len(arguments) == (2 if name == "prefix" else 1)) or (not sparql_style and value == "."):
+                if name == "prefix" and len(arguments) == 2:
+                    prefixes[arguments[0][1][:-1]] = resolve(*arguments[1])
+                elif name == "base" and arguments:
+                    base = resolve(*arguments[0])
+                directive = None
+            continue
+        if skip_datatype:
+            skip_datatype = False
+        elif kind == "punctuation":
+            if value == ",":
+                state = "object"
+            elif value == ";":
+                state = "predicate"
+            elif value == ".":
+                state = "subject"
+            elif value in "[(":
+                if state == "subject":
+                    # A blank node or collection as subject is followed by its predicates
+                    stack.append((None, None, "predicate"))
+                else:
+                    stack.append((subject, predicate, "collection" if state == "collection" else "object_end"))
+                if value == "[":
+                    subject, state = None, "predicate"
+                else:
+                    state = "collection"
+            elif stack:
+                subject, predicate, state = stack.pop()
+        elif kind == "lang":
+            if state == "subject" and value.lower() in ("@prefix", "@base"):
+                directive = (value[1:].lower(), [], False)
+            elif previous_kind == "string":
+                counter.languages.add(value[1:])
+        elif kind == "datatype":
+            skip_datatype = True
+        elif state == "subject":
+            if kind == "name" and value.upper() in ("PREFIX", "BASE"):
+                directive = (value.lower(), [], True)
+            else:
+                subject, state = resolve(kind, value), "predicate"
+        elif state == "predicate":
+            predicate, state = resolve(kind, value), "object"
+        elif state == "object":
+            if predicate == RDF_TYPE and resolve(kind, value) == SKOS_CONCEPT:
+                counter.add(subject)
+            state = "object_end"
+        previous_kind = kind
+    return counter.result()
+
+
+def count_concepts(chunks, format: str = None) -> dict:
+    """
+    Counts the skos:Concepts of a vocabulary and reports its languages, in one streaming pass
+    without building a graph.
+
+    Args:
+        chunks (iterable): The vocabulary in chunks of bytes.
+        format (str, optional): 'rdfxml' or 'turtle'. Detected from the first bytes if not given.
+
+    Returns:
+        dict: The number of concepts and the sorted languages.
+    """
+    chunks = iter(chunks)
+    if format is None:
+        # The format is detected from the first bytes, however the vocabulary is chunked
+        head = []
+        for chunk in chunks:
+            head.append(chunk)
+            if sum(map(len, head)) >= 256:
+                break
+        chunks = chain(head, chunks)
+        start = b"".join(head).lstrip(b"\xef\xbb\xbf \t\r\n")
+        is_xml = start.startswith((b"<?xml", b"<!")) or re.match(rb"<[\w.\-]+(?::[\w.\-]+)?[\s>/]", start)
+        format = "rdfxml" if is_xml else "turtle"
+    return count_rdfxml_concepts(chunks) if format == "rdfxml" else count_turtle_concepts(chunks)
+
+
+def count_local_terms(base_url: str, vocabulary_id: str) -> dict:
+    """
+    Counts the concepts of a vocabulary held in the download cache.
+
+    Args:
+        base_url (str): The base URL of the API.
+        vocabulary_id (str): The ID of the vocabulary.
+
+    Returns:
+        dict: The number of concepts and the languages if the vocabulary is cached, else None.
+    """
+    cache = vocabulary_cache()
+    for format in ['rdfxml', 'turtle']:
+        key = cache.key(base_url, vocabulary_id, format)
+        if cache.lookup(key) is not None:
+            with open(cache.body_path(key), 'rb') as file:
+                return count_concepts(iter(lambda: file.read(CHUNK_SIZE), b''), format)
+    return None
+
+
+def count_remote_terms(base_url: str, vocabulary_id: str) -> dict:
+    """
+    Downloads a vocabulary into the cache and counts its concepts while it arrives.
+
+    Args:
+        base_url (str): The base URL of the API.
+        vocabulary_id (str): The ID of the vocabulary.
+
+    Returns:
+        dict: The number of concepts and the languages if the download succeeded, else None.
+    """
+    rdf_content, content_type = stream_rdf_content(base_url, vocabulary_id)
+    if rdf_content is None:
+        return None
+    format = 'rdfxml' if content_type == VOCABULARY_MIME_TYPES['rdfxml'] else 'turtle'
+    try:
+        return count_concepts(rdf_content, format)
+    finally:
+        # Closes the response and finishes the cache entry
+        rdf_content.close()
+
+
+def init_skos_worker():
+    """
+    Lets the root logger of a skosify process pass the INFO findings of skosify to capture_logs.
+
+    skosify reports through the root logger, so it is only configured in the entry points and
+    importing the module leaves the logging of the importer unchanged. The null handler keeps
+    the module-level logging functions from adding a console handler.
+    """
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    if not root_logger.handlers:
+        root_logger.addHandler(logging.NullHandler())
+
+
+@contextmanager
+def capture_logs():
+    """
+    Captures the log messages emitted by the current thread, so concurrent jobs do not see
+    each other's messages.
+
+    Yields:
+        io.StringIO: The captured messages.
+    """
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    thread_id = threading.get_ident()
+    handler.addFilter(lambda record: record.thread == thread_id)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    try:
+        yield stream
+    finally:
+        root_logger.removeHandler(handler)
+
+
 def convert_to_skos_rdfxml(file_name: str) -> str:
     """
     Converts a turtle file to SKOS RDF/XML format.
@@ -91,9 +648,10 @@ def convert_to_skos_rdfxml(file_name: str) -> str:
         rdf_xml_content = voc.serialize(format='xml')
         return rdf_xml_content
 
-    except Exception as e:
+    except (Exception, SystemExit) as e:
+        # skosify exits on unreadable input, which must not end a skosify process
         print(f"Conversion failed: {e}")
-        return jsonify({"error": "Failed to convert from turtle to rdf/xml"}), 400
+        return None
 
 
 def skos_rdf_validate(file_name: str) -> str:
@@ -104,24 +662,121 @@ def skos_rdf_validate(file_name: str) -> str:
         file_name (str): The name of the RDF/XML file.
 
     Returns:
-        str: The validation output if successful, else None.
+        str: The warnings of skosify, empty for a clean vocabulary, if the validation succeeded, else None.
     """
     try:
-        log_capture.truncate(0)  # Clear the existing captured logs
-        # Convert the input file to SKOS RDF/XML format
-        voc = skosify.skosify(file_name)
-        voc.serialize(destination="/dev/null", format='xml')
-        output = log_capture.getvalue()  # Retrieve the captured logs from skosify
+        # Convert the input file to SKOS RDF/XML format, with the logs of skosify as output
+        with capture_logs() as logs:
+            voc = skosify.skosify(file_name)
+            voc.serialize(destination=os.devnull, format='xml')
+        output = logs.getvalue()
         print("Validation successfully performed")
         return output
     except SystemExit as systemexit:
         if systemexit.code == 1:
-            # Do something if 'test' exits with sys.exit(1)
             print("Validation failed")
-            jsonify({"Verification failed"}), 400
+        return None
     except Exception as e:
         print(f"Validation failed: {e}")
-        jsonify({"Verification failed"}), 400
+        return None
+
+
+def skos_pool():
+    """
+    Returns the process pool running skosify, started on first use, or None if skosify runs
+    in the request thread.
+    """
+    global _skos_pool
+    if SKOS_WORKERS < 1:
+        return None
+    with _skos_lock:
+        if _skos_pool is None:
+            _skos_pool = ProcessPoolExecutor(max_workers=SKOS_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=init_skos_worker)
+    return _skos_pool
+
+
+def run_skos_job(job, uploaded_file, suffix: str):
+    """
+    Runs a skosify job on an uploaded vocabulary, in the skosify processes if they are enabled.
+
+    The results are memoized by job and content hash of the upload, so an identical
+    vocabulary returns the earlier result, or waits for the running job, without running
+    skosify again.
+
+    Args:
+        job (callable): convert_to_skos_rdfxml or skos_rdf_validate.
+        uploaded_file (FileStorage): The uploaded vocabulary.
+        suffix (str): The file extension skosify recognizes the format by.
+
+    Returns:
+        str: The result of the job.
+    """
+    # The upload is hashed while it is saved
+    digest = hashlib.sha256()
+    with NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        for chunk in iter(lambda: uploaded_file.stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            temp_file.write(chunk)
+    key = (job.__name__, digest.hexdigest())
+
+    try:
+        with _skos_lock:
+            future = _skos_memo.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                _skos_memo[key] = future
+                if len(_skos_memo) > SKOS_MEMO_SIZE:
+                    _skos_memo.popitem(last=False)
+            else:
+                _skos_memo.move_to_end(key)
+
+        if owner:
+            future.add_done_callback(lambda _: forget_failed_skos_job(key, future))
+            try:
+                future.set_result(call_skos_job(job, temp_file.name))
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+    finally:
+        os.remove(temp_file.name)
+
+
+def call_skos_job(job, file_name: str):
+    """
+    Runs a skosify job in the skosify processes, or in the request thread if they are disabled.
+    """
+    pool = skos_pool()
+    if pool is None:
+        return job(file_name)
+    try:
+        return pool.submit(job, file_name).result()
+    except BrokenProcessPool:
+        # A crashed process breaks the pool, the next job starts a new one
+        reset_skos_pool(pool)
+        raise
+
+
+def reset_skos_pool(pool):
+    """
+    Discard a broken skosify pool.
+    """
+    global _skos_pool
+    with _skos_lock:
+        if _skos_pool is pool:
+            _skos_pool = None
+    pool.shutdown(wait=False)
+
+
+def forget_failed_skos_job(key: tuple, future: Future):
+    """
+    Removes a job that raised an exception from the memo, so the next upload runs it again.
+    """
+    if future.exception() is not None:
+        with _skos_lock:
+            if _skos_memo.get(key) is future:
+                del _skos_memo[key]
 
 
 def search_skohub(vocabulary_domain: str) -> str:
@@ -179,17 +834,9 @@ def convert_turtle():
         file_ext = os.path.splitext(filename)[1].lower()
         if file_ext in ['.rdf', '.xml', '.n3']:
             return jsonify({"message": "No ttl file uploaded"}), 400
-        # Create a temporary file to save the uploaded file
-        with NamedTemporaryFile(delete=False, suffix='.ttl') as temp_file:
-            uploaded_file.save(temp_file)
-            temp_file_path = temp_file.name
-
         try:
-            # Now pass this temporary file path to the conversion function
-            rdf_xml_content = convert_to_skos_rdfxml(temp_file_path)
-
-            # After conversion, remove the temporary file
-            os.remove(temp_file_path)
+            # The upload is converted in a skosify process, or taken from an earlier identical upload
+            rdf_xml_content = run_skos_job(convert_to_skos_rdfxml, uploaded_file, '.ttl')
 
             if rdf_xml_content:
                 response = Response(rdf_xml_content, status=200, mimetype='application/rdf+xml')
@@ -200,8 +847,6 @@ def convert_turtle():
                 return jsonify({"message": "Failed to convert from turtle to rdf/xml"}), 400
 
         except Exception as e:
-            # Remove the temporary file in case of an exception
-            os.remove(temp_file_path)
             return jsonify({"error": str(e)}), 500
 
     return jsonify({"message": "No file uploaded"}), 400
@@ -213,11 +858,24 @@ def total_term_count():
     vocabulary_id = request.form.get('vocabulary_id')
 
     if base_url and vocabulary_id:
-        total_count = get_total_term_count(base_url, vocabulary_id)
+        # Vocabularies held in the cache are counted offline, others are downloaded and
+        # counted if the API provides no statistics
+        try:
+            counts = count_local_terms(base_url, vocabulary_id)
+            if counts is None:
+                total_count = get_total_term_count(base_url, vocabulary_id)
+                if total_count is None:
+                    counts = count_remote_terms(base_url, vocabulary_id)
+        except (ValueError, ElementTree.ParseError) as e:
+            return jsonify({"error": f"Failed to parse the vocabulary: {e}"}), 400
+        if counts is not None:
+            total_count = counts["concepts"]
         print(total_count)
         if total_count is not None:
             content = f"The total 'count' value from '{base_url}' is: {total_count} terms"
             response = Response(content, status=200, mimetype='text/plain')
+            if counts is not None:
+                response.headers['Languages'] = ', '.join(counts["languages"])
             response.headers['Message'] = 'Successfully retrieve term count.'
             response.headers['Content-Disposition'] = 'attachment; filename="total_count.txt"'
             return response
@@ -232,7 +890,7 @@ def total_term_count():
 def download_content():
     base_url = request.form.get('base_url')
     vocabulary_id = request.form.get('vocabulary_id')
-    rdf_content, content_type = download_rdf_content(base_url, vocabulary_id)
+    rdf_content, content_type = stream_rdf_content(base_url, vocabulary_id)
     if rdf_content:
         file_extension = '.rdf' if content_type == 'application/rdf+xml' else '.ttl'
         response = Response(rdf_content, status=200, mimetype=content_type)
@@ -246,27 +904,20 @@ def download_content():
 @app.route('/skos_verify', methods=['POST'])
 def skos_verify():
     uploaded_file = request.files['vocabulary_id']
+    output = None
     if uploaded_file:
-        # Create a temporary file to save the uploaded file
-        with NamedTemporaryFile(delete=False, suffix='.rdf') as temp_file:
-            uploaded_file.save(temp_file)
-            temp_file_path = temp_file.name
-        print(temp_file_path)
-        output = skos_rdf_validate(temp_file_path)
-
-    if output:
-        output_json = json.dumps({"file": temp_file_path, "valid": True})
-        os.remove(temp_file_path)
-        # Return with 200 OK status for successful validation
-        return jsonify({"success": True, "message": "Validation performed"}), 200
-        response = Response(output_json, status=200, mimetype="application/json")
-        response.headers['Content-Disposition'] = 'attachment; filename="file.json"'
-        response.headers['Message'] = 'Vocabulary successfully downloaded.'
-        return response
+        # The upload is validated in a skosify process, or taken from an earlier identical upload
+        output = run_skos_job(skos_rdf_validate, uploaded_file, '.rdf')
+
+    if output is not None:
+        # Return with 200 OK status for successful validation, also without warnings
+        return jsonify({"success": True, "warnings": output, "message": "Validation performed"}), 200
     else:
         # Return with 400 Bad Request status for failed validation
         return jsonify({"success": False, "warnings": output, "message": "Validation failed"}), 400
 
 
 if __name__ == '__main__':
+    # Also passes the INFO findings of skosify jobs run in the request thread to capture_logs
+    logging.basicConfig(level=logging.INFO)
     app.run(port=5003, debug=True)
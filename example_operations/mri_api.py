@@ -1,21 +1,464 @@
 from flask import Flask, request, jsonify, Response
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import requests
-import pydicom
-import torch
+import importlib
+import multiprocessing
+import threading
+import tempfile
+import sqlite3
+import hashlib
+import time
+import json
 import io
+import os
+import sys
 import pickle
-from torchvision import transforms
-import torchvision.transforms.functional as TF
-from torchvision.transforms import functional as F
+
+# The tensor wire format is shared with the client framework
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import tensor_format
+
+
+class _LazyModule:
+    """
+    A stand-in for a module that is imported on first attribute access.
+
+    torch, torchvision and pydicom take seconds to import, which delayed every worker boot
+    even though they are only needed once a conversion is requested.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+
+pydicom = _LazyModule("pydicom")
+numpy = _LazyModule("numpy")
+torch = _LazyModule("torch")
+transforms = _LazyModule("torchvision.transforms")
+TF = _LazyModule("torchvision.transforms.functional")
+F = TF
+nn_functional = _LazyModule("torch.nn.functional")
 app = Flask(__name__)
 
+# The format of the returned tensors if the request does not choose one, "tensor" or "pickle".
+# Pickle stays the default for clients that do not negotiate the format.
+DEFAULT_TENSOR_FORMAT = os.environ.get('MRI_API_TENSOR_FORMAT', 'pickle')
+# Concurrent downloads of a batch and the processes decoding DICOM files, 0 to decode in the request thread
+DOWNLOAD_WORKERS = int(os.environ.get('MRI_API_DOWNLOAD_WORKERS', 16))
+DECODE_WORKERS = int(os.environ.get('MRI_API_DECODE_WORKERS', os.cpu_count() or 1))
+DOWNLOAD_TIMEOUT = 60
+# The on-disk cache of downloaded DICOM files, shared by all workers using the same directory
+CACHE_DIR = os.environ.get('MRI_API_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'mri_api_dicom_cache'))
+# The maximum size of the cached files in bytes, 0 disables the cache
+CACHE_MAX_BYTES = int(os.environ.get('MRI_API_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# Seconds a cached file is used without revalidating it with the source
+CACHE_MAX_AGE = float(os.environ.get('MRI_API_CACHE_MAX_AGE', 3600))
+# The processes running resize, normalize and augment, 0 to run them in the request thread
+TRANSFORM_WORKERS = int(os.environ.get('MRI_API_TRANSFORM_WORKERS', 0))
+# The intra-op threads of torch per transform process, by default the cores divided among the processes
+TORCH_THREADS = int(os.environ.get('MRI_API_TORCH_THREADS', 0))
+# The tensors are passed to and from the transform processes as files in this directory
+SHARED_MEMORY_DIR = os.environ.get('MRI_API_SHARED_MEMORY_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+CONTRAST_LABELS = {'T1-weighted': 1, 'T2-weighted': 2, 'PD-weighted': 3}
+
+_session = None
+_decode_pool = None
+_pool_lock = threading.Lock()
+_cache = None
+_transform_pool = None
+
+
+class DicomSourceError(Exception):
+    """
+    A DICOM source that could not be downloaded, with the message returned to the client.
+    """
+
+
+class DicomCache:
+    """
+    An on-disk cache of downloaded DICOM files, shared by all processes using the same directory.
+
+    The files are stored content-addressed under their SHA-256 digest and indexed by URI with the
+    ETag and Last-Modified validators of their download. Entries validated within max_age seconds
+    are used without contacting the source, older ones are revalidated with a conditional GET.
+    The least recently used entries are evicted once the stored files exceed max_bytes. The hit
+    counters are kept in the index, so they cover all workers.
+    """
+
+    def __init__(self, cache_dir, max_bytes, max_age):
+        """
+        Initializes the DicomCache object.
+
+        Args:
+            cache_dir (str): The directory holding the index and the files.
+            max_bytes (int): The maximum size of the stored files in bytes.
+            max_age (float): The seconds an entry is used without revalidation.
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.objects_dir = os.path.join(self.cache_dir, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), timeout=30, check_same_thread=False)
+        with self.connection:
+            # The workers write to the index concurrently
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'uri TEXT PRIMARY KEY, sha256 TEXT, size INTEGER, etag TEXT, last_modified TEXT, validated REAL, accessed REAL)'
+            )
+            self.connection.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+
+    def object_path(self, sha256):
+        """
+        Returns the path of a file in the content-addressed store.
+        """
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def lookup(self, uri):
+        """
+        Looks up the entry of a URI.
+
+        Args:
+            uri (str): The URI of the DICOM file.
+
+        Returns:
+            dict or None: The entry with its digest, validators and whether it is fresh, None if not cached.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT sha256, etag, last_modified, validated FROM entries WHERE uri = ?', (uri,)).fetchone()
+        if row is None:
+            return None
+        sha256, etag, last_modified, validated = row
+        return {'uri': uri, 'sha256': sha256, 'etag': etag, 'last_modified': last_modified,
+                'fresh': time.time() - validated < self.max_age}
+
+    @staticmethod
+    def validators(entry):
+        """
+        Builds the headers of a conditional GET revalidating an entry.
+        """
+        headers = {}
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, entry, revalidated=False):
+        """
+        Reads the file of an entry and counts the hit.
+
+        Args:
+            entry (dict): The entry returned by lookup.
+            revalidated (bool, optional): The source confirmed the entry, which is valid for
+                another max_age seconds. Defaults to False.
+
+        Returns:
+            bytes or None: The file, None if it was removed in the meantime, which also drops the entry.
+        """
+        try:
+            with open(self.object_path(entry['sha256']), 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            with self.lock, self.connection:
+                self.connection.execute('DELETE FROM entries WHERE uri = ? AND sha256 = ?', (entry['uri'], entry['sha256']))
+            return None
+        now = time.time()
+        with self.lock, self.connection:
+            if revalidated:
+                self.connection.execute('UPDATE entries SET accessed = ?, validated = ? WHERE uri = ?', (now, now, entry['uri']))
+            else:
+                self.connection.execute('UPDATE entries SET accessed = ? WHERE uri = ?', (now, entry['uri']))
+            self.count('revalidated' if revalidated else 'hits')
+        return content
+
+    def store(self, uri, content, etag=None, last_modified=None):
+        """
+        Stores a downloaded file, counts the miss and evicts the least recently used entries
+        exceeding the size limit.
+
+        Args:
+            uri (str): The URI of the DICOM file.
+            content (bytes): The file.
+            etag (str, optional): The ETag of the download. Defaults to None.
+            last_modified (str, optional): The Last-Modified header of the download. Defaults to None.
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        object_path = self.object_path(sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            # Written under a temporary name, so other workers never read a partial file
+            temp_path = f'{object_path}.{os.getpid()}.{threading.get_ident()}.part'
+            with open(temp_path, 'wb') as file:
+                file.write(content)
+            os.replace(temp_path, object_path)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (uri, sha256, len(content), etag, last_modified, now, now))
+            self.count('misses')
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the stored files fit the size limit.
+        Called with the lock held, inside a transaction.
+        """
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for uri, sha256, size in self.connection.execute('SELECT uri, sha256, size FROM entries ORDER BY accessed').fetchall():
+            self.connection.execute('DELETE FROM entries WHERE uri = ?', (uri,))
+            if self.connection.execute('SELECT 1 FROM entries WHERE sha256 = ?', (sha256,)).fetchone() is None:
+                # The file is shared by entries of identical content, it is removed with the last one
+                try:
+                    os.remove(self.object_path(sha256))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    return
+
+    def count(self, name):
+        """
+        Increments a hit counter, inside a transaction.
+        """
+        self.connection.execute('INSERT INTO stats VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1', (name,))
+
+    def stats(self):
+        """
+        Returns the hit counters of all workers and the size of the cache.
+
+        Returns:
+            dict: The hits, revalidated hits, misses, hit rate, number of entries and stored bytes.
+        """
+        with self.lock:
+            counters = dict(self.connection.execute('SELECT name, value FROM stats'))
+            entries, size = self.connection.execute(
+                'SELECT COUNT(*), (SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)) FROM entries').fetchone()
+        hits, revalidated, misses = counters.get('hits', 0), counters.get('revalidated', 0), counters.get('misses', 0)
+        lookups = hits + revalidated + misses
+        return {'hits': hits, 'revalidated': revalidated, 'misses': misses,
+                'hit_rate': (hits + revalidated) / lookups if lookups else None,
+                'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
+
+
+def dicom_cache():
+    """
+    Get the DICOM cache of this process, opened on first use.
+
+    Returns:
+        DicomCache or None: The cache, None if it is disabled.
+    """
+    global _cache
+    if CACHE_MAX_BYTES <= 0:
+        return None
+    with _pool_lock:
+        # Forked workers open their own connection to the index
+        if _cache is None or _cache[0] != os.getpid():
+            _cache = (os.getpid(), DicomCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE))
+    return _cache[1]
+
+
+def download_session():
+    """
+    Get the session downloading the DICOM sources, with one pooled connection per download worker.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    with _pool_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=DOWNLOAD_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def decode_pool():
+    """
+    Get the process pool decoding DICOM files, started on first use.
+
+    The workers are spawned instead of forked, as forking a process that already runs torch
+    threads can deadlock.
+
+    Returns:
+        ProcessPoolExecutor or None: The pool, None if decoding runs in the request thread.
+    """
+    global _decode_pool
+    if DECODE_WORKERS < 1:
+        return None
+    with _pool_lock:
+        if _decode_pool is None:
+            _decode_pool = ProcessPoolExecutor(max_workers=DECODE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _decode_pool
+
+
+def init_transform_worker(threads):
+    """
+    Limit the torch threads of a transform process, so the processes together use each core once.
+    """
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only possible before the first parallel torch operation of the process
+        pass
+
+
+def transform_pool():
+    """
+    Get the process pool running the tensor transforms, started on first use.
+
+    Returns:
+        ProcessPoolExecutor or None: The pool, None if the transforms run in the request thread.
+    """
+    global _transform_pool
+    if TRANSFORM_WORKERS < 1:
+        return None
+    with _pool_lock:
+        if _transform_pool is None:
+            threads = TORCH_THREADS or max(1, (os.cpu_count() or 1) // TRANSFORM_WORKERS)
+            _transform_pool = ProcessPoolExecutor(max_workers=TRANSFORM_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=init_transform_worker, initargs=(threads,))
+    return _transform_pool
+
+
+def fetch_dicom(uri):
+    """
+    Download a DICOM source.
+
+    The Content-Type is checked on the GET response before its body is read, so no separate
+    HEAD request is needed. Downloads are kept in the DICOM cache, fresh entries are read from
+    disk and older ones are revalidated with their ETag or Last-Modified date.
+
+    Args:
+        uri (str): The URI of the DICOM file on Zenodo or B2SHARE.
+
+    Returns:
+        bytes: The DICOM file.
+
+    Raises:
+        DicomSourceError: If the URI is not supported, not a DICOM file or the download failed.
+    """
+    if 'zenodo' not in uri and 'b2share' not in uri:
+        raise DicomSourceError('Image conversion failed.')
+    cache = dicom_cache()
+    entry = cache.lookup(uri) if cache is not None else None
+    if entry is not None and entry['fresh']:
+        content = cache.read(entry)
+        if content is not None:
+            return content
+        entry = None
+    try:
+        with download_session().get(uri, stream=True, timeout=DOWNLOAD_TIMEOUT, headers=cache.validators(entry) if cache else None) as response:
+            if entry is not None and response.status_code == 304:
+                content = cache.read(entry, revalidated=True)
+                if content is not None:
+                    return content
+                # Removed since the lookup, the entry is dropped and the file downloaded again
+                return fetch_dicom(uri)
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+            if 'dicom' not in content_type and 'octet-stream' not in content_type:
+                raise DicomSourceError('URI does not point to a DICOM file based on Content-Type')
+            content = response.content
+    except requests.RequestException as e:
+        raise DicomSourceError(f'Error downloading the DICOM file: {e}')
+    if cache is not None:
+        cache.store(uri, content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return content
+
+
+def decode_dicom(content):
+    """
+    Decode the pixel data of a DICOM file, run in the decode processes.
+
+    Args:
+        content (bytes): The DICOM file.
+
+    Returns:
+        numpy.ndarray: The pixel array.
+    """
+    return pydicom.dcmread(io.BytesIO(content), force=True).pixel_array
+
+
+def response_format():
+    """
+    Choose the format of the returned tensors from the request.
+
+    Clients choose the raw tensor format with the form field or query parameter format=tensor
+    or the Accept header application/x-fdo-tensor, and pickle with format=pickle or the Accept
+    header application/x-python-pickle. Other requests get DEFAULT_TENSOR_FORMAT.
+
+    Returns:
+        str: Either "tensor" or "pickle".
+    """
+    requested = request.values.get('format')
+    if requested in ('tensor', 'pickle'):
+        return requested
+    accept = request.headers.get('Accept', '')
+    if tensor_format.MEDIA_TYPE in accept:
+        return 'tensor'
+    if tensor_format.PICKLE_MEDIA_TYPE in accept:
+        return 'pickle'
+    return DEFAULT_TENSOR_FORMAT
+
+
+def tensor_response(tensors, message):
+    """
+    Serialize tensors in the format chosen by the request.
+
+    The raw format is streamed from the tensor memory in slices, without building the whole
+    body in memory first.
+
+    Args:
+        tensors (tuple): The tensors, e.g. the image and label tensor.
+        message (str): The message header of the response.
+
+    Returns:
+        Response: The serialized tensors.
+    """
+    if response_format() == 'pickle':
+        response = Response(pickle.dumps(tensors), status=200, mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = 'attachment; filename="tensor_data.pkl"'
+    else:
+        chunks, size = tensor_format.encode(tensors, names=('image', 'label'))
+        response = Response(tensor_format.iter_bytes(chunks), status=200, mimetype=tensor_format.MEDIA_TYPE, direct_passthrough=True)
+        response.content_length = size
+        response.headers['Content-Disposition'] = 'attachment; filename="tensor_data.tensor"'
+    response.headers['Message'] = message
+    return response
+
+
 @app.route('/dicom_to_labelled_tensor', methods=['POST'])
 def dicom_to_labelled_tensor():
     """
     Convert DICOM image to labelled tensor.
 
     Returns:
-        Response: Serialized labelled tensor as a pickle file.
+        Response: Serialized labelled tensor, in the raw tensor format or as pickle file.
     """
     # Access data from form data
     uri = request.form.get('uri')
@@ -23,83 +466,178 @@ def dicom_to_labelled_tensor():
 
     if not uri or not contrast:
         return jsonify({'error': 'Missing URI or contrast'}), 400
-
-    if 'zenodo' in uri or 'b2share' in uri:
-        download_url = uri
-    else:
+    if contrast not in CONTRAST_LABELS:
         return jsonify({'error': 'Image conversion failed.'}), 400
-    
+
     try:
-        head_response = requests.head(download_url)
-        content_type = head_response.headers.get('Content-Type', '')
-        if 'dicom' not in content_type and 'octet-stream' not in content_type:
-            return jsonify({'error': 'URI does not point to a DICOM file based on Content-Type'}), 400
-    except requests.RequestException as e:
-        return jsonify({'error': f'Error making HEAD request: {e}'}), 400
-
-    response = requests.get(download_url)
-    response.raise_for_status()
-
-    dicom_data = pydicom.dcmread(io.BytesIO(response.content), force=True)
-    pixel_array = dicom_data.pixel_array
-    if contrast == 'T1-weighted':
-        label = 1
-    elif contrast == 'T2-weighted':
-        label = 2
-    elif contrast == 'PD-weighted':
-        label = 3
-    else:
-        return jsonify({'error': 'Image conversion failed.'}), 400
+        content = fetch_dicom(uri)
+    except DicomSourceError as e:
+        return jsonify({'error': str(e)}), 400
+
+    pixel_array = decode_dicom(content)
+    label = CONTRAST_LABELS[contrast]
 
     pixel_tensor = torch.tensor(pixel_array)
     pixel_tensor = pixel_tensor.unsqueeze(0)
     label_tensor = torch.tensor(label)
 
     result = (pixel_tensor, label_tensor)
-    serialized_data = pickle.dumps(result)
+    return tensor_response(result, 'Image successfully converted.')
+
+
+@app.route('/dicom_to_labelled_tensor_batch', methods=['POST'])
+def dicom_to_labelled_tensor_batch():
+    """
+    Convert a series of DICOM images to one stacked labelled tensor set.
+
+    The URIs are given as repeated uri form fields or as JSON list {"uri": [...], "contrast": ...},
+    with either one contrast for all images or one contrast per image. The images are downloaded
+    concurrently and decoded in the decode processes while the remaining downloads run.
+
+    Images that cannot be downloaded or decoded are left out and listed with their index and
+    error in the Failed-Items header.
+
+    Returns:
+        Response: The images of shape (N, 1, H, W) and the labels of shape (N,), in the raw tensor
+        format or as pickle file.
+    """
+    body = request.get_json(silent=True) or {}
+    uris = body.get('uri') if body else request.form.getlist('uri')
+    contrasts = body.get('contrast') if body else request.form.getlist('contrast')
+    if isinstance(contrasts, str):
+        contrasts = [contrasts]
+    if not uris or not isinstance(uris, list) or not contrasts or len(contrasts) not in (1, len(uris)):
+        return jsonify({'error': 'Missing URIs or contrasts, give one contrast or one per URI'}), 400
+    if len(contrasts) == 1:
+        contrasts = contrasts * len(uris)
+    if any(contrast not in CONTRAST_LABELS for contrast in contrasts):
+        return jsonify({'error': 'Image conversion failed.'}), 400
 
-    response = Response(serialized_data, status=200, mimetype='application/octet-stream')
-    response.headers['Content-Disposition'] = 'attachment; filename="tensor_data.pkl"'
-    response.headers['Message'] = 'Image successfully converted.'
+    pool = decode_pool()
+    failed = []
+    decoded = []
+    with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(uris))) as downloads:
+        for index, download in enumerate([downloads.submit(fetch_dicom, uri) for uri in uris]):
+            try:
+                content = download.result()
+            except DicomSourceError as e:
+                failed.append({'index': index, 'uri': uris[index], 'error': str(e)})
+                continue
+            decoded.append((index, pool.submit(decode_dicom, content) if pool is not None else None, content))
+
+    pixel_arrays, labels = [], []
+    for index, future, content in decoded:
+        try:
+            pixel_arrays.append(future.result() if future is not None else decode_dicom(content))
+            labels.append(CONTRAST_LABELS[contrasts[index]])
+        except Exception as e:
+            failed.append({'index': index, 'uri': uris[index], 'error': f'Error decoding the DICOM file: {e}'})
+    if not pixel_arrays:
+        return jsonify({'error': 'No image could be converted.', 'failed': failed}), 400
+    if len({pixel_array.shape for pixel_array in pixel_arrays}) > 1:
+        return jsonify({'error': 'The images differ in size and cannot be stacked.', 'failed': failed}), 400
+
+    pixel_tensor = torch.from_numpy(numpy.stack(pixel_arrays)).unsqueeze(1)
+    label_tensor = torch.tensor(labels)
+    response = tensor_response((pixel_tensor, label_tensor), 'Images successfully converted.')
+    if failed:
+        response.headers['Failed-Items'] = json.dumps(sorted(failed, key=lambda item: item['index']))
     return response
 
-def augment_images(label_tensor, image_tensor):
+def rotation_grids(angles, height, width):
+    """
+    Build the sampling grids rotating images counter-clockwise around their center, like
+    torchvision's rotate, for all angles at once.
+
+    Args:
+        angles (torch.Tensor): The angles in degrees.
+        height (int): The image height.
+        width (int): The image width.
+
+    Returns:
+        torch.Tensor: The grids of shape (angles, height, width, 2) for grid_sample.
+    """
+    # The matrices are computed in double precision like torchvision's, so the sampled pixels match
+    radians = torch.deg2rad(angles.to(torch.float64))
+    cos, sin = torch.cos(radians), torch.sin(radians)
+    # The transposed inverse rotation matrices, scaled to the normalized coordinates of grid_sample
+    theta = torch.stack([torch.stack([cos, sin], dim=-1), torch.stack([-sin, cos], dim=-1)], dim=1).to(torch.float32)
+    theta /= torch.tensor([0.5 * width, 0.5 * height])
+    # The pixel centers relative to the image center, with a column of ones for the translation
+    base_grid = torch.ones(height, width, 3)
+    base_grid[..., 0] = torch.linspace(-width * 0.5 + 0.5, width * 0.5 - 0.5, width)
+    base_grid[..., 1] = torch.linspace(-height * 0.5 + 0.5, height * 0.5 - 0.5, height).unsqueeze(-1)
+    translation = torch.zeros(len(angles), 1, 2)
+    return torch.matmul(base_grid.view(1, height * width, 3), torch.cat([theta, translation], dim=1)).view(len(angles), height, width, 2)
+
+
+def iter_rotations(image_tensor, angles, dtype=None, chunk_size=16):
+    """
+    Rotate an image tensor by all angles, a chunk of angles per batched grid_sample pass.
+
+    All images (the leading dimensions) are rotated in the same pass, as channels of one sample
+    per angle. Nearest-neighbour sampling keeps the pixel values, so integer tensors are exact.
+
+    Args:
+        image_tensor (torch.Tensor): Image tensor with the height and width as last dimensions.
+        angles (torch.Tensor): The angles in degrees.
+        dtype (torch.dtype, optional): The dtype of the rotated images. Defaults to the input dtype.
+        chunk_size (int, optional): The number of angles per pass. Defaults to 16.
+
+    Yields:
+        torch.Tensor: The rotated images of a chunk, of shape (chunk, *image_tensor.shape).
+    """
+    shape = image_tensor.shape
+    height, width = shape[-2:]
+    dtype = dtype or image_tensor.dtype
+    # float32 represents integers up to 2^24 exactly, larger integer types are rotated in double precision
+    compute_dtype = torch.float64 if image_tensor.dtype in (torch.int32, torch.int64, torch.float64) else torch.float32
+    planes = image_tensor.reshape(1, -1, height, width).to(compute_dtype)
+    for start in range(0, len(angles), chunk_size):
+        chunk = angles[start:start + chunk_size]
+        grid = rotation_grids(chunk, height, width).to(compute_dtype)
+        rotated = nn_functional.grid_sample(planes.expand(len(chunk), -1, -1, -1), grid, mode='nearest',
+                                            padding_mode='zeros', align_corners=False)
+        yield rotated.to(dtype).view(len(chunk), *shape)
+
+
+def augment_images(label_tensor, image_tensor, angle_count=100, dtype=None, chunk_size=16):
     """
     Augment images by rotating them and replicating the label tensor.
 
     Args:
         label_tensor (torch.Tensor): Label tensor.
         image_tensor (torch.Tensor): Image tensor.
+        angle_count (int, optional): The number of angles between 0 and 360 degrees. Defaults to 100.
+        dtype (torch.dtype, optional): The dtype of the augmented images. Defaults to the input dtype.
+        chunk_size (int, optional): The number of angles rotated per pass. Defaults to 16.
 
     Returns:
-        tuple: Stacked augmented image tensors and stacked label tensors.
+        tuple: The augmented image tensors of shape (angle_count, *image_tensor.shape) and the
+        label tensors of shape (angle_count, *label_tensor.shape).
     """
-    augmented_image_tensors = []
-    augmented_label_tensors = []
-    # Define rotation parameters
-    angles = torch.linspace(0, 360, 100)
-
-    # Handling batches of images
-    for i in range(image_tensor.size(0)):  # Iterate through each image in the batch
-        single_image_tensor = image_tensor[i]
-
-        # Ensure the tensor has a channel dimension
-        if single_image_tensor.dim() == 2:  # Grayscale image without channel dimension
-            single_image_tensor = single_image_tensor.unsqueeze(0)  # Add channel dimension
-            
-        for angle in angles:
-        # Rotate the image
-            rotated_image = F.rotate(image_tensor, angle.item())
-            # Add the rotated image tensor to the list
-            augmented_image_tensors.append(rotated_image)
-            
-            # Assuming label_tensor should be replicated for each image
-            augmented_label_tensors.append(label_tensor.clone())
+    angles = torch.linspace(0, 360, angle_count)
+    augmented_images = torch.empty((angle_count, *image_tensor.shape), dtype=dtype or image_tensor.dtype)
+    start = 0
+    for rotated in iter_rotations(image_tensor, angles, dtype, chunk_size):
+        augmented_images[start:start + len(rotated)] = rotated
+        start += len(rotated)
+    augmented_labels = label_tensor.unsqueeze(0).expand(angle_count, *label_tensor.shape).clone()
+    return (augmented_images, augmented_labels)
+
+
+@app.route('/dicom_cache_stats', methods=['GET'])
+def dicom_cache_stats():
+    """
+    Report the hit rate and size of the DICOM cache, counted over all workers.
 
-    # Stack all augmented tensors into a single tensor
-    stacked_image_tensors = torch.stack(augmented_image_tensors, dim=0)
-    stacked_label_tensors = torch.stack(augmented_label_tensors, dim=0)
-    return (stacked_image_tensors, stacked_label_tensors)
+    Returns:
+        Response: The statistics as JSON.
+    """
+    cache = dicom_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(cache.stats(), enabled=True))
 
 
 @app.route('/labeled_tensor_augment', methods=['POST'])
@@ -107,8 +645,13 @@ def labeled_tensor_augment():
     """
     Augment labeled tensor by rotating the image tensor.
 
+    The form fields or query parameters angles (default 100), dtype (e.g. float16, default the
+    input dtype) and chunk (the angles rotated per pass, default 16) configure the augmentation.
+    With stream=1 the raw tensor format is streamed chunk by chunk, computed in the server
+    process instead of a transform process.
+
     Returns:
-        Response: Serialized augmented labeled tensor as a pickle file.
+        Response: Serialized augmented labeled tensor, in the raw tensor format or as pickle file.
     """
     if 'tensor' not in request.files:
         return jsonify({'error': 'Image augmentation failed.'}), 400
@@ -117,46 +660,108 @@ def labeled_tensor_augment():
     if file.filename == '':
         return jsonify({'error': 'Image augmentation failed.'}), 400
 
-    # Read the pickle file and extract the tuple
     try:
-        image_tensor, label_tensor = pickle.load(file.stream)
+        angle_count, chunk_size, dtype = augment_options()
+    except (ValueError, AttributeError):
+        return jsonify({'error': 'Invalid angles, chunk or dtype.'}), 400
+
+    # Read the raw tensor or pickle file and augment the tuple, a streamed augmentation runs while the response is sent
+    stream = stream_requested()
+    try:
+        if stream:
+            image_tensor, label_tensor = tensor_format.load_stream(file.stream)
+        else:
+            result_tuple = run_transform('augment', file, angle_count=angle_count, dtype=dtype, chunk_size=chunk_size)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-    result_tuple = augment_images(label_tensor, image_tensor)
+    if stream:
+        return stream_augment_response(image_tensor, label_tensor, angle_count, dtype, chunk_size, 'Image successfully augmented.')
+    return tensor_response(result_tuple, 'Image successfully augmented.')
+
+
+def augment_options():
+    """
+    Read the augmentation parameters angles, chunk and dtype from the request.
+
+    Returns:
+        tuple: The number of angles, the angles per pass and the dtype, None for the input dtype.
+
+    Raises:
+        ValueError: If a parameter is invalid.
+    """
+    angle_count = int(request.values.get('angles', 100))
+    chunk_size = int(request.values.get('chunk', 16))
+    dtype = getattr(torch, request.values['dtype']) if 'dtype' in request.values else None
+    if angle_count < 1 or chunk_size < 1 or (dtype is not None and not isinstance(dtype, torch.dtype)):
+        raise ValueError
+    return angle_count, chunk_size, dtype
+
+
+def stream_requested():
+    """
+    Check whether the request asks for the augmented tensors to be streamed chunk by chunk,
+    which applies to the raw tensor format only.
+    """
+    return request.values.get('stream') in ('1', 'true') and response_format() == 'tensor'
+
 
-    serialized_data = pickle.dumps(result_tuple)
+def stream_augment_response(image_tensor, label_tensor, angle_count, dtype, chunk_size, message):
+    """
+    Augment a labeled tensor while streaming the result in the raw tensor format.
+
+    The rotated chunks are written as soon as they are computed instead of being stacked
+    first, so the augmentation runs in the server process while the response is sent.
+
+    Args:
+        image_tensor (torch.Tensor): Image tensor.
+        label_tensor (torch.Tensor): Label tensor.
+        angle_count (int): The number of angles between 0 and 360 degrees.
+        dtype (torch.dtype): The dtype of the augmented images, None for the input dtype.
+        chunk_size (int): The number of angles rotated per pass.
+        message (str): The message header of the response.
 
-    response = Response(serialized_data, status=200, mimetype='application/octet-stream')
-    response.headers['Message'] = 'Image successfully augmented.'
-    response.headers['Content-Disposition'] = 'attachment; filename="tensor_data.pkl"'
+    Returns:
+        Response: The streamed augmented labeled tensor.
+    """
+    angles = torch.linspace(0, 360, angle_count)
+    dtype = dtype or image_tensor.dtype
+    labels = label_tensor.unsqueeze(0).expand(angle_count, *label_tensor.shape).clone()
+    specs = [('image', torch.empty(0, dtype=dtype).numpy().dtype, (angle_count, *image_tensor.shape)),
+             ('label', labels.numpy().dtype, labels.shape)]
+    _, _, size = tensor_format.layout(specs)
+    body = tensor_format.encode_parts(specs, [iter_rotations(image_tensor, angles, dtype, chunk_size), [labels]])
+    response = Response(body, status=200, mimetype=tensor_format.MEDIA_TYPE, direct_passthrough=True)
+    response.content_length = size
+    response.headers['Content-Disposition'] = 'attachment; filename="tensor_data.tensor"'
+    response.headers['Message'] = message
     return response
 
 
-def normalize_standardize_image(image_tensor):
+def normalize_standardize_image(image_tensor, in_place=False):
     """
     Normalize and standardize the image tensor.
 
     Args:
         image_tensor (torch.Tensor): Image tensor.
+        in_place (bool, optional): Normalize a float32 tensor in its own memory instead of a
+            copy. Defaults to False.
 
     Returns:
         torch.Tensor: Normalized and standardized image tensor.
     """
-    # Convert image tensor to floating point
-    
-    image_tensor = image_tensor.to(torch.float32)
-    print(image_tensor)
+    # Convert image tensor to floating point, into a copy unless the input may be overwritten
+    image_tensor = image_tensor.to(torch.float32, copy=not in_place)
     # Check the number of dimensions of the tensor
     if image_tensor.dim() == 3:  # For single grayscale image (H, W)
         image_tensor = image_tensor.unsqueeze(0)  # Convert to (1, H, W)
     elif image_tensor.dim() == 2:  # For single grayscale image without channel dimension
         image_tensor = image_tensor.unsqueeze(0).unsqueeze(0)  # Convert to (1, 1, H, W)
 
-    # Check if the image tensor is normalized
-    image_tensor = image_tensor / 255
+    # The tensor is scaled and standardized in place, without further intermediate tensors
+    image_tensor.div_(255)
     # Define the normalization transform
-    normalize = transforms.Normalize(mean=[0.5], std=[0.5])
+    normalize = transforms.Normalize(mean=[0.5], std=[0.5], inplace=True)
     normalized_image_tensor = normalize(image_tensor)
 
     return normalized_image_tensor
@@ -167,7 +772,7 @@ def labeled_tensor_normalize():
     Normalize and standardize the labeled tensor.
 
     Returns:
-        Response: Serialized normalized labeled tensor as a pickle file.
+        Response: Serialized normalized labeled tensor, in the raw tensor format or as pickle file.
     """
     if 'tensor' not in request.files:
         return jsonify({'error': 'Image normalization and standardization failed.'}), 400
@@ -176,25 +781,13 @@ def labeled_tensor_normalize():
     if file.filename == '':
         return jsonify({'error': 'Image normalization and standardization failed.'}), 400
 
-    # Read the pickle file and extract the tuple
+    # Read the raw tensor or pickle file and normalize and standardize the image tensor
     try:
-        image_tensor, label_tensor = pickle.load(file.stream)
+        normalized_tuple = run_transform('normalize', file)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-    # Normalize and standardize the image tensor
-    normalized_image_tensor = normalize_standardize_image(image_tensor)
-
-    # Create a new tuple with the label and normalized image tensors
-    normalized_tuple = (normalized_image_tensor, label_tensor)
-
-    # Convert the normalized tuple to a JSON string
-    serialized_data = pickle.dumps(normalized_tuple)
-
-    response = Response(serialized_data, status=200, mimetype='application/octet-stream')
-    response.headers['Message'] = 'Image successfully normalized and standardized.'
-    response.headers['Content-Disposition'] = 'attachment; filename="tensor_data.pkl"'
-    return response
+    return tensor_response(normalized_tuple, 'Image successfully normalized and standardized.')
 
 
 @app.route('/labeled_tensor_resize', methods=['POST'])
@@ -203,7 +796,7 @@ def labelled_tensor_resize():
     Resize the image tensor in the labeled tensor.
 
     Returns:
-        Response: Serialized resized labeled tensor as a pickle file.
+        Response: Serialized resized labeled tensor, in the raw tensor format or as pickle file.
     """
     if 'tensor' not in request.files:
         return jsonify({'error': 'Image resizing failed.'}), 400
@@ -212,34 +805,195 @@ def labelled_tensor_resize():
     if file.filename == '':
         return jsonify({'error': 'Image resizing failed.'}), 400
 
-    # Read the pickle file and extract the tuple
+    # Read the raw tensor or pickle file and resize the image tensor
     try:
-        image_tensor, label_tensor = pickle.load(file.stream)
+        output_tuple = run_transform('resize', file)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    return tensor_response(output_tuple, 'Image successfully resized.')
+
 
+def resize_image(image_tensor, size=(256, 256)):
+    """
+    Resize the image tensor.
+
+    Args:
+        image_tensor (torch.Tensor): Image tensor, a single image or a batch of images.
+        size (tuple, optional): The height and width. Defaults to (256, 256).
+
+    Returns:
+        torch.Tensor: Resized image tensor.
+    """
     # Check if the tensor is a single image or a batch of images
     if image_tensor.dim() == 3:  # Single image
         image_tensor = image_tensor.unsqueeze(0)  # Add batch dimension
 
-    # Resize the image tensor to 256x256 using OpenCV
-    resize_transform = transforms.Resize((256, 256))
+    resize_transform = transforms.Resize(size)
     resized_image = resize_transform(image_tensor)
 
-     # Remove the batch dimension if it was a single image
+    # Remove the batch dimension if it was a single image
     if resized_image.shape[0] == 1:
         resized_image = resized_image.squeeze(0)
+    return resized_image
 
-    # Create the output tuple with the label tensor and resized image tensor
-    output_tuple = (resized_image, label_tensor)
-    
-    # Convert the normalized tuple to a JSON string
-    serialized_data = pickle.dumps(output_tuple)
 
-    response = Response(serialized_data, status=200, mimetype='application/octet-stream')
-    response.headers['Message'] = 'Image successfully resized.'
-    response.headers['Content-Disposition'] = 'attachment; filename="tensor_data.pkl"'
-    return response
+PREPROCESS_STEPS = ('resize', 'normalize', 'augment')
+
+
+@app.route('/labeled_tensor_preprocess', methods=['POST'])
+def labeled_tensor_preprocess():
+    """
+    Resize, normalize and augment a labeled tensor in one request.
+
+    The form field or query parameter steps lists the steps in their order, e.g.
+    resize,normalize,augment. Each step works like its endpoint and takes its parameters: size
+    (e.g. 256 or 128x256) for resize, and angles, dtype, chunk and stream for augment. The
+    tensor is read and serialized once and the steps pass it on in memory, with the
+    normalization working in place.
+
+    Returns:
+        Response: Serialized preprocessed labeled tensor, in the raw tensor format or as pickle file.
+    """
+    if 'tensor' not in request.files:
+        return jsonify({'error': 'Image preprocessing failed.'}), 400
+
+    file = request.files['tensor']
+    if file.filename == '':
+        return jsonify({'error': 'Image preprocessing failed.'}), 400
+
+    steps = [step.strip() for step in request.values.get('steps', '').split(',') if step.strip()]
+    if not steps or any(step not in PREPROCESS_STEPS for step in steps):
+        return jsonify({'error': f'Invalid steps, give a comma-separated list of {", ".join(PREPROCESS_STEPS)}.'}), 400
+    try:
+        size = tuple(int(length) for length in request.values.get('size', '256').split('x'))
+        if len(size) not in (1, 2) or min(size) < 1:
+            raise ValueError
+        size = size * (3 - len(size))
+        angle_count, chunk_size, dtype = augment_options()
+    except (ValueError, AttributeError):
+        return jsonify({'error': 'Invalid size, angles, chunk or dtype.'}), 400
+
+    # A streamed augmentation runs while the response is sent, after the other steps
+    stream = steps[-1] == 'augment' and stream_requested()
+    try:
+        image_tensor, label_tensor = run_transform('preprocess', file, steps=steps[:-1] if stream else steps, size=size,
+                                                   angle_count=angle_count, dtype=dtype, chunk_size=chunk_size)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    message = 'Image successfully preprocessed.'
+    if stream:
+        return stream_augment_response(image_tensor, label_tensor, angle_count, dtype, chunk_size, message)
+    return tensor_response((image_tensor, label_tensor), message)
+
+
+def preprocess(image_tensor, label_tensor, steps, size=(256, 256), angle_count=100, dtype=None, chunk_size=16):
+    """
+    Apply resize, normalize and augment steps to a labeled tensor in the given order.
+
+    Args:
+        image_tensor (torch.Tensor): Image tensor, normalized in place.
+        label_tensor (torch.Tensor): Label tensor.
+        steps (list): The names of the steps.
+        size (tuple, optional): The height and width of resize. Defaults to (256, 256).
+        angle_count (int, optional): The number of angles of augment. Defaults to 100.
+        dtype (torch.dtype, optional): The dtype of the augmented images. Defaults to the input dtype.
+        chunk_size (int, optional): The number of angles rotated per pass. Defaults to 16.
+
+    Returns:
+        tuple: The preprocessed image and label tensor.
+    """
+    for step in steps:
+        if step == 'resize':
+            image_tensor = resize_image(image_tensor, size)
+        elif step == 'normalize':
+            image_tensor = normalize_standardize_image(image_tensor, in_place=True)
+        else:
+            image_tensor, label_tensor = augment_images(label_tensor, image_tensor, angle_count, dtype, chunk_size)
+    return image_tensor, label_tensor
+
+
+# The transforms of uploaded labeled tensors, called with the image and label tensor and the options.
+# The uploaded tensors are owned by the request, so they are normalized in place.
+TRANSFORMS = {
+    'resize': lambda image_tensor, label_tensor, size=(256, 256): (resize_image(image_tensor, size), label_tensor),
+    'normalize': lambda image_tensor, label_tensor: (normalize_standardize_image(image_tensor, in_place=True), label_tensor),
+    'augment': lambda image_tensor, label_tensor, **options: augment_images(label_tensor, image_tensor, **options),
+    'preprocess': preprocess,
+}
+
+
+def transform_job(name, input_path, output_path, options):
+    """
+    Run a transform in a transform process, from a tensor file to a tensor file in shared memory.
+
+    Args:
+        name (str): The name of the transform in TRANSFORMS.
+        input_path (str): The uploaded raw tensor or pickle file.
+        output_path (str): The file the result is written to in the raw tensor format.
+        options (dict): The parameters of the transform.
+    """
+    # The input is memory-mapped copy-on-write, so it is read without a copy and may be modified
+    image_tensor, label_tensor = tensor_format.load(input_path)
+    chunks, _ = tensor_format.encode(TRANSFORMS[name](image_tensor, label_tensor, **options), names=('image', 'label'))
+    with open(output_path, 'wb') as file:
+        for chunk in chunks:
+            file.write(chunk)
+
+
+def run_transform(name, file, **options):
+    """
+    Apply a transform to an uploaded labeled tensor, in a transform process if they are enabled.
+
+    The upload is saved to a file in shared memory, which the transform process maps, and the
+    result is mapped from the file the process writes, so the tensors are neither pickled nor
+    sent through a pipe.
+
+    Args:
+        name (str): The name of the transform in TRANSFORMS.
+        file (FileStorage): The uploaded raw tensor or pickle file.
+        **options: The parameters of the transform.
+
+    Returns:
+        tuple: The transformed image and label tensor.
+    """
+    pool = transform_pool()
+    if pool is None:
+        image_tensor, label_tensor = tensor_format.load_stream(file.stream)
+        return TRANSFORMS[name](image_tensor, label_tensor, **options)
+
+    paths = []
+    try:
+        for _ in range(2):
+            descriptor, path = tempfile.mkstemp(prefix='mri_api_', suffix='.tensor', dir=SHARED_MEMORY_DIR)
+            os.close(descriptor)
+            paths.append(path)
+        input_path, output_path = paths
+        file.save(input_path)
+        try:
+            pool.submit(transform_job, name, input_path, output_path, options).result()
+        except BrokenProcessPool:
+            # A crashed process breaks the pool, the next request starts a new one
+            reset_transform_pool(pool)
+            raise
+        # The mapping stays valid after the file is removed
+        return tensor_format.load(output_path)
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+def reset_transform_pool(pool):
+    """
+    Discard a broken transform pool.
+    """
+    global _transform_pool
+    with _pool_lock:
+        if _transform_pool is pool:
+            _transform_pool = None
+    pool.shutdown(wait=False)
+
 
 if __name__ == '__main__':
     app.run(port=5002)
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""
+Runs the query, fetch, validation, mapping and execution steps for profiles or attributes
+from the command line, without Flask or Redis, and prints a throughput and latency summary
+per stage.
+
+In workflow mode, the names are target operations. The operations they depend on are run
+first, with the intermediate outputs passed on in memory instead of through the result folders.
+
+Usage:
+    python fdo_batch.py profiles Vocabulary_Type_Information_Profile --workers 16
+    python fdo_batch.py attributes labelled_image_tensor --operations 21.11152/0dede1eb-9ecc-4696-a7c1-d388def7124f
+    python fdo_batch.py workflow FDO_Ops_labelled_image_tensor_resize_256 --profiles Medical_Imaging_Data_Type_Profile
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from modules.sparql_service import SPARQLService
+from modules.tpm_service import TPMService
+from modules.record_mapper import RecordMapper
+from modules.kernel_workflow import KernelWorkflow
+from modules.query_processing import QueryProcessing
+from modules.ops_executor import Ops_Executor
+from modules.execution_cache import ExecutionCache
+from modules.ingest_manifest import IngestManifest
+from modules.pipeline import Pipeline
+from modules.workflow_runner import WorkflowRunner
+from modules.tracing import Tracer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class StageStats:
+    """
+    Collects the latencies of the calls of one pipeline stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def add(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def summary(self, wall_time):
+        """
+        Summarizes the latencies.
+
+        Args:
+            wall_time (float): The duration of the whole run in seconds.
+
+        Returns:
+            dict: The number of calls, their busy time, the calls per second of the run and
+            the 50th, 95th and 99th percentile and maximum latency in milliseconds.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3) if latencies else None
+
+        return {
+            "stage": self.name,
+            "calls": len(latencies),
+            "busy_s": round(sum(latencies), 3),
+            "throughput_per_s": round(len(latencies) / wall_time, 2) if wall_time else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else None
+        }
+
+
+class StageTimer:
+    """
+    Times the calls of service methods per stage.
+
+    The time of a stage excludes the time of other stages called within it, e.g. the fetching
+    and validation of the FDOs while the mapper consumes them, so the stages add up to the
+    time actually spent.
+    """
+
+    def __init__(self, names):
+        self.stages = {name: StageStats(name) for name in names}
+        self.local = threading.local()
+        # The number of calls in progress per stage, across threads
+        self.in_progress = dict.fromkeys(names, 0)
+        self.lock = threading.Lock()
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def active(self):
+        """
+        Returns the names of the stages with calls in progress.
+        """
+        with self.lock:
+            return [name for name, calls in self.in_progress.items() if calls]
+
+    def measure(self, name, call):
+        stack = self.stack()
+        stack.append(0.0)
+        with self.lock:
+            self.in_progress[name] += 1
+        start = time.perf_counter()
+        try:
+            return call()
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.in_progress[name] -= 1
+            nested = stack.pop()
+            self.stages[name].add(elapsed - nested)
+            if stack:
+                stack[-1] += elapsed
+
+    def wrap(self, name, obj, method):
+        """
+        Replaces a method of an object by a timed version.
+        """
+        function = getattr(obj, method)
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            return self.measure(name, lambda: function(*args, **kwargs))
+
+        setattr(obj, method, timed)
+
+    def wrap_generator(self, name, obj, method):
+        """
+        Replaces a generator method of an object by a version timing each produced item.
+        """
+        function = getattr(obj, method)
+        missing = object()
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            iterator = self.measure(name, lambda: iter(function(*args, **kwargs)))
+            while True:
+                item = self.measure(name, lambda: next(iterator, missing))
+                if item is missing:
+                    return
+                yield item
+
+        setattr(obj, method, timed)
+
+
+def instrument(sparql_service, query_processing, tpm_service, validator, mapper, executor):
+    """
+    Times the query, fetch, validate, map and execute stages of the given services.
+
+    Returns:
+        StageTimer: The timer holding the latencies per stage.
+    """
+    timer = StageTimer(["query", "fetch", "validate", "map", "execute"])
+    timer.wrap("query", sparql_service, "execute_query")
+    timer.wrap("query", query_processing, "restructure_query_result")
+    timer.wrap("fetch", tpm_service, "get_record")
+    timer.wrap("validate", validator, "validate")
+    timer.wrap_generator("map", mapper, "iter_many")
+    timer.wrap("map", mapper, "map_to_request")
+    timer.wrap("execute", executor, "execute")
+    timer.wrap("execute", executor, "fetch")
+    return timer
+
+
+def build_selection(mode, structured_data, input_dir=".", operations=None):
+    """
+    Selects the operations of restructured query results, like the selection pages do.
+
+    Args:
+        mode (str): Either "profiles" or "attributes".
+        structured_data (dict): The results restructured by QueryProcessing.
+        input_dir (str, optional): The directory holding the attribute folders. Defaults to ".".
+        operations (list, optional): The names or PIDs of the operations to select. Defaults to None (all).
+
+    Returns:
+        dict: Maps operation PIDs to (output type, inputs) pairs as expected by Pipeline.run.
+    """
+    selection = {}
+    if mode == "profiles":
+        # profile -> operation name -> operation PID -> output type -> output label -> FDOs
+        for operation_names in structured_data.values():
+            for operation_name, operation_pids in operation_names.items():
+                for operation_pid, output_types in operation_pids.items():
+                    if operations and operation_name not in operations and operation_pid not in operations:
+                        continue
+                    for output_type, output_labels in output_types.items():
+                        for fdos in output_labels.values():
+                            _, selected = selection.setdefault(operation_pid, (output_type, []))
+                            selected.extend(fdo for fdo in fdos if fdo not in selected)
+    else:
+        # attribute -> operation name -> operation PID -> output type -> output labels
+        for attribute, operation_names in structured_data.items():
+            local_dir = os.path.abspath(os.path.join(input_dir, attribute))
+            if not os.path.isdir(local_dir):
+                print(f"Skipping {attribute}: {local_dir} is not a directory", file=sys.stderr)
+                continue
+            for operation_name, operation_pids in operation_names.items():
+                for operation_pid, output_types in operation_pids.items():
+                    if operations and operation_name not in operations and operation_pid not in operations:
+                        continue
+                    for output_type in output_types:
+                        selection[operation_pid] = (output_type, [local_dir])
+    return selection
+
+
+def workflow_fdos(dag, structured_data):
+    """
+    Selects the FDOs of the operations at the start of a workflow from restructured profile query results.
+
+    Args:
+        dag (dict): The DAG created by WorkflowRunner.build_dag.
+        structured_data (dict): The profile query results restructured by QueryProcessing.
+
+    Returns:
+        list: The PIDs of the FDOs.
+    """
+    roots = [pid for pid, node in dag.items() if not node["requires"]]
+    fdos = {}
+    for _, selected in build_selection("profiles", structured_data, operations=roots).values():
+        fdos.update(dict.fromkeys(selected))
+    return list(fdos)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['profiles', 'attributes', 'workflow'],
+                        help='Query operations by profile or by attribute names, or run the workflow of target operations.')
+    parser.add_argument('names', help='Comma-separated profile, attribute or target operation names.')
+    parser.add_argument('--operations', help='Comma-separated names or PIDs of the operations to run (default: all found).')
+    parser.add_argument('--input-dir', default='.', help='Directory holding the attribute folders in attribute mode.')
+    parser.add_argument('--profiles', help='Comma-separated profile names whose FDOs the workflow runs on in workflow mode.')
+    parser.add_argument('--fdos', help='Comma-separated PIDs of further FDOs the workflow runs on in workflow mode.')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent requests.')
+    parser.add_argument('--per-host-limit', type=int, default=4, help='Number of concurrent requests per host.')
+    parser.add_argument('--timeout', type=float, default=300, help='Timeout of a request in seconds.')
+    parser.add_argument('--cache-dir', default=os.path.join(current_dir, '.execution_cache'), help='Directory of the execution cache.')
+    parser.add_argument('--no-cache', action='store_true', help='Do not look up or store results in the execution cache.')
+    parser.add_argument('--refresh', action='store_true', help='Execute the operations even if cached results exist, and on all files in attribute mode.')
+    parser.add_argument('--manifest', default=os.path.join(current_dir, '.ingest_manifest', 'manifest.sqlite'),
+                        help='Manifest of the local files processed in attribute mode.')
+    parser.add_argument('--no-manifest', action='store_true', help='Process all files in attribute mode, without reading or updating the manifest.')
+    parser.add_argument('--config', default=os.path.join(current_dir, 'configs/services.json'), help='Services configuration file.')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+    parser.add_argument('--verbose', action='store_true', help='Print the status of each item.')
+    parser.add_argument('--trace', metavar='PATH', help='Write the spans of the run as Chrome trace JSON to PATH.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.config, 'r') as services_config_file:
+        services_config = json.load(services_config_file)
+    tpm_keys_config_path = os.path.join(current_dir, "configs/tpm_keys_config_path.json")
+
+    sparql_service = SPARQLService(services_config["graph_db"])
+    tpm_service = TPMService(services_config["tpm"])
+    cache = None if args.no_cache else ExecutionCache(args.cache_dir)
+    executor = Ops_Executor(timeout=args.timeout, max_workers=args.workers, per_host_limit=args.per_host_limit, cache=cache)
+    query_processing = QueryProcessing()
+    validator = KernelWorkflow(tpm_keys_config_path)
+    mapper = RecordMapper(tpm_keys_config_path)
+    manifest = None if args.no_manifest else IngestManifest(args.manifest, workers=args.workers)
+    pipeline = Pipeline(tpm_service, validator, mapper, executor, manifest)
+
+    timer = instrument(sparql_service, query_processing, tpm_service, validator, mapper, executor)
+
+    start = time.perf_counter()
+    if args.mode == 'workflow':
+        results = sparql_service.execute_query(sparql_service.construct_dependency_query(args.names))
+        if not isinstance(results, dict):
+            print(results, file=sys.stderr)
+            return 2
+        selection = WorkflowRunner.build_dag(results)
+        fdos = args.fdos.split(',') if args.fdos else []
+        if args.profiles:
+            results = sparql_service.execute_query(sparql_service.construct_query1(args.profiles))
+            if not isinstance(results, dict):
+                print(results, file=sys.stderr)
+                return 2
+            fdos = list(dict.fromkeys(fdos + workflow_fdos(selection, query_processing.restructure_query_result(results))))
+        if not selection or not fdos:
+            print("No operations or FDOs found", file=sys.stderr)
+            return 2
+    else:
+        if args.mode == 'profiles':
+            results = sparql_service.execute_query(sparql_service.construct_query1(args.names))
+        else:
+            results = sparql_service.execute_query(sparql_service.construct_query2(args.names))
+        if not isinstance(results, dict):
+            print(results, file=sys.stderr)
+            return 2
+        structured_data = query_processing.restructure_query_result(results)
+        operations = args.operations.split(',') if args.operations else None
+        selection = build_selection(args.mode, structured_data, args.input_dir, operations)
+        if not selection:
+            print("No operations found", file=sys.stderr)
+            return 2
+
+    unchanged = 0
+
+    def on_event(event):
+        nonlocal unchanged
+        unchanged += event.get("unchanged", 0)
+        if args.verbose and event["type"] == "item":
+            print(f"{event['status']:8} {event['operation']} {event['item']} {event.get('path') or event.get('error') or ''}", file=sys.stderr)
+
+    tracer = Tracer("fdo_batch") if args.trace else None
+    with tracer.activate() if tracer is not None else contextlib.nullcontext():
+        if args.mode == 'workflow':
+            summary = WorkflowRunner(tpm_service, validator, mapper, executor).run_workflow(
+                selection, fdos, refresh=args.refresh, on_event=on_event)
+        else:
+            summary = pipeline.run(args.mode, selection, refresh=args.refresh, on_event=on_event)
+    wall_time = time.perf_counter() - start
+    if tracer is not None:
+        with open(args.trace, 'w') as trace_file:
+            json.dump(tracer.to_chrome_trace(), trace_file)
+
+    summary["operations"] = len(selection)
+    if args.mode == 'attributes':
+        summary["unchanged"] = unchanged
+    summary["wall_s"] = round(wall_time, 3)
+    summary["items_per_s"] = round((summary["succeeded"] + summary["failed"]) / wall_time, 2) if wall_time else None
+    summary["stages"] = [stats.summary(wall_time) for stats in timer.stages.values()]
+    if cache is not None:
+        summary["cache_hits"], summary["cache_misses"] = cache.hits, cache.misses
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{summary['operations']} operations: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+              f"{summary['skipped']} skipped" + (f", {summary['unchanged']} unchanged files" if "unchanged" in summary else "") +
+              f" in {summary['wall_s']} s ({summary['items_per_s']} items/s)")
+        columns = ("calls", "busy_s", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+        print(f"{'stage':10}" + "".join(f"{column:>18}" for column in columns))
+        for stage in summary["stages"]:
+            print(f"{stage['stage']:10}" + "".join(f"{'-' if stage[column] is None else stage[column]:>18}" for column in columns))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import threading
+
+from modules.metrics import REGISTRY, timed
+from modules import tracing
+
+CACHE_LOOKUPS = REGISTRY.counter("fdo_execution_cache_lookups_total", "Lookups in the execution cache.", ("result",))
+
+
+def hit_ratio():
+    hits, misses = CACHE_LOOKUPS.value(result="hit"), CACHE_LOOKUPS.value(result="miss")
+    return hits / (hits + misses) if hits + misses else None
+
+
+REGISTRY.gauge_function("fdo_execution_cache_hit_ratio", "Share of execution cache lookups that were hits.", hit_ratio)
+
+
+class ExecutionCache:
+    """
+    A memo store for operation executions.
+
+    Executions are keyed by the operation PID, the identity of the input (the FDO PID or the
+    content hash of the local input files) and the hash of the request specification. The
+    produced files are kept in a content-addressed object store, so identical outputs are only
+    stored once, and are linked back into the result folders on a cache hit.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Initializes the ExecutionCache object.
+
+        Args:
+            cache_dir (str): The directory holding the index and the object store.
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.objects_dir = os.path.join(self.cache_dir, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS executions ("
+                "key TEXT PRIMARY KEY, operation_pid TEXT, input_id TEXT, spec_hash TEXT, "
+                "filename TEXT, sha256 TEXT, size INTEGER, created REAL)"
+            )
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def file_digest(path, chunk_size=1024 * 1024):
+        """
+        Computes the SHA-256 digest of a file.
+
+        Args:
+            path (str): The path of the file.
+            chunk_size (int, optional): The size of the chunks in bytes. Defaults to 1 MiB.
+
+        Returns:
+            str: The hexadecimal digest.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def reference_digest(self, reference):
+        """
+        Computes the SHA-256 digest of a file reference of a request specification.
+
+        Args:
+            reference (dict): The file reference, holding either a path or the content, and optionally its digest.
+
+        Returns:
+            str: The hexadecimal digest.
+        """
+        if "sha256" in reference:
+            # Computed beforehand, e.g. by the ingest manifest
+            return reference["sha256"]
+        if "content" not in reference:
+            return self.file_digest(reference["path"])
+        content = reference["content"]
+        if getattr(content, "sha256", None) is not None:
+            return content.sha256
+        return hashlib.sha256(content if isinstance(content, bytes) else content.read()).hexdigest()
+
+    def make_key(self, operation_pid, input_name, request_spec):
+        """
+        Builds the memo key of an execution.
+
+        The input is identified by the content hashes of the files or contents uploaded by the request,
+        or by the input name (the FDO PID) if the request does not upload files. File paths
+        are left out of the request hash, so moved or renamed inputs still hit the cache.
+
+        Args:
+            operation_pid (str): The PID of the operation.
+            input_name (str): The name of the input, i.e. the FDO PID in profile mode.
+            request_spec (dict): The request specification.
+
+        Returns:
+            tuple: The key, the input identity and the request hash.
+        """
+        files = request_spec.get("files") or {}
+        if files:
+            input_id = ",".join(f"{key}=sha256:{self.reference_digest(reference)}" for key, reference in sorted(files.items()))
+        else:
+            input_id = input_name
+        hashed_spec = dict(request_spec, files={key: reference.get("mode", "rb") for key, reference in files.items()})
+        spec_hash = hashlib.sha256(json.dumps(hashed_spec, sort_keys=True, default=str).encode()).hexdigest()
+        key = hashlib.sha256(json.dumps([operation_pid, input_id, spec_hash]).encode()).hexdigest()
+        return key, input_id, spec_hash
+
+    def object_path(self, sha256):
+        """
+        Returns the path of an object in the content-addressed store.
+        """
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    @timed("cache")
+    @tracing.traced("cache.get")
+    def get(self, key, folder_name):
+        """
+        Looks up an execution and places its output in a folder.
+
+        Args:
+            key (str): The memo key.
+            folder_name (str): The folder the output is placed in.
+
+        Returns:
+            dict or None: The path, file name, size and digest of the output if cached, None otherwise.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT filename, sha256, size FROM executions WHERE key = ?", (key,)).fetchone()
+            if row is None or not os.path.exists(self.object_path(row[1])):
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                tracing.annotate(hit=False)
+                return None
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+        tracing.annotate(hit=True)
+        filename, sha256, size = row
+        path = os.path.join(folder_name, filename)
+        if not (os.path.exists(path) and os.path.samefile(path, self.object_path(sha256))):
+            os.makedirs(folder_name, exist_ok=True)
+            self.link(self.object_path(sha256), path)
+        return {"path": path, "filename": filename, "sha256": sha256, "size": size}
+
+    @timed("cache")
+    @tracing.traced("cache.put")
+    def put(self, key, operation_pid, input_id, spec_hash, path, sha256, size):
+        """
+        Stores the output of an execution.
+
+        Args:
+            key (str): The memo key.
+            operation_pid (str): The PID of the operation.
+            input_id (str): The identity of the input.
+            spec_hash (str): The hash of the request specification.
+            path (str): The path of the produced file.
+            sha256 (str): The SHA-256 digest of the produced file.
+            size (int): The size of the produced file in bytes.
+        """
+        object_path = self.object_path(sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            self.link(path, object_path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO executions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, operation_pid, input_id, spec_hash, os.path.basename(path), sha256, size, time.time())
+            )
+
+    def link(self, source, destination):
+        """
+        Hard links a file to a new path, falling back to a copy across file systems.
+        The destination is replaced atomically.
+        """
+        temp_path = os.path.join(os.path.dirname(destination), f".{os.path.basename(destination)}.{os.getpid()}.{threading.get_ident()}.link")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, destination)
@@ -0,0 +1,141 @@
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.execution_cache import ExecutionCache
+from modules.metrics import timed
+from modules import tracing
+
+
+class LocalFile:
+    """
+    A file of an attribute input directory, as found by a directory scan.
+    """
+    __slots__ = ("name", "path", "size", "mtime_ns", "sha256")
+
+    def __init__(self, name, path, size, mtime_ns, sha256=None):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sha256 = sha256
+
+
+def scan_directory(local_dir):
+    """
+    Lists the files of a directory with their size and modification time.
+
+    The stat results of os.scandir are used, so no further system call is needed per file on
+    most platforms. Subdirectories and hidden files, e.g. partially written outputs, are left out.
+
+    Args:
+        local_dir (str): The directory to scan.
+
+    Returns:
+        list: The LocalFile objects, sorted by name.
+    """
+    files = []
+    with os.scandir(local_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            files.append(LocalFile(entry.name, entry.path, stat.st_size, stat.st_mtime_ns))
+    files.sort(key=lambda file: file.name)
+    return files
+
+
+class IngestManifest:
+    """
+    Remembers which local input files an operation has processed successfully.
+
+    Files are identified by their path, size, modification time and content hash. A file is
+    processed again if it is new or if its size or modification time changed and its content
+    hash differs from the recorded one, so unchanged files of a directory are skipped without
+    being read.
+    """
+
+    def __init__(self, path, workers=8):
+        """
+        Initializes the IngestManifest object.
+
+        Args:
+            path (str): The path of the SQLite file holding the manifest.
+            workers (int, optional): The number of files hashed concurrently. Defaults to 8.
+        """
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.connection:
+            # Files are recorded one by one as their results arrive, WAL keeps these commits cheap
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "operation_pid TEXT, path TEXT, size INTEGER, mtime_ns INTEGER, sha256 TEXT, processed REAL, "
+                "PRIMARY KEY (operation_pid, path))"
+            )
+
+    @timed("manifest")
+    @tracing.traced("manifest.changed")
+    def changed(self, operation_pid, files, refresh=False):
+        """
+        Selects the files an operation has not processed in their current state.
+
+        The content hashes of the selected files are computed concurrently and set on the files.
+        Files whose modification time changed but whose content did not are updated in the
+        manifest and left out.
+
+        Args:
+            operation_pid (str): The PID of the operation.
+            files (list): The LocalFile objects of the input directory.
+            refresh (bool, optional): Select all files. Defaults to False.
+
+        Returns:
+            tuple: The selected files and the number of unchanged files.
+        """
+        with self.lock:
+            known = {path: (size, mtime_ns, sha256) for path, size, mtime_ns, sha256 in self.connection.execute(
+                "SELECT path, size, mtime_ns, sha256 FROM files WHERE operation_pid = ?", (operation_pid,))}
+        candidates = [file for file in files if refresh or known.get(file.path, (None, None))[:2] != (file.size, file.mtime_ns)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for file, sha256 in zip(candidates, pool.map(lambda file: ExecutionCache.file_digest(file.path), candidates)):
+                file.sha256 = sha256
+
+        selected, touched = [], []
+        for file in candidates:
+            if not refresh and file.path in known and known[file.path][2] == file.sha256:
+                touched.append(file)
+            else:
+                selected.append(file)
+        self.record(operation_pid, *touched)
+        tracing.annotate(files=len(files), selected=len(selected))
+        return selected, len(files) - len(selected)
+
+    def record(self, operation_pid, *files):
+        """
+        Records that an operation processed files.
+
+        Args:
+            operation_pid (str): The PID of the operation.
+            *files (LocalFile): The processed files, with their content hashes.
+        """
+        if not files:
+            return
+        processed = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                [(operation_pid, file.path, file.size, file.mtime_ns, file.sha256, processed) for file in files]
+            )
+
+    def forget(self, operation_pid, file):
+        """
+        Removes a file from the manifest, so it is processed again by the next run.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM files WHERE operation_pid = ? AND path = ?", (operation_pid, file.path))
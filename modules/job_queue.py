@@ -0,0 +1,272 @@
+import json
+import time
+import uuid
+import threading
+import contextlib
+
+from modules.tracing import Tracer, span
+
+
+class JobQueue:
+    """
+    A job queue backed by Redis and processed by a pool of worker threads.
+
+    Each job is stored as Redis hash with its status, counters and result, and its progress
+    events are appended to a Redis list, so the state of a job outlives the request that
+    submitted it. Running jobs are refreshed with a heartbeat, and jobs whose heartbeat stopped,
+    e.g. because the server was restarted during the job, are queued again. The Redis client
+    is expected to decode responses.
+    """
+
+    def __init__(self, redis_client, handler, prefix="fdo_jobs", workers=2, ttl=7 * 24 * 3600,
+                 heartbeat_interval=10, heartbeat_timeout=60):
+        """
+        Initializes the JobQueue object.
+
+        Args:
+            redis_client (Redis): The Redis client.
+            handler (callable): Called as handler(payload, on_event) to process a job. Its
+                return value is stored as result of the job and must be JSON serializable.
+            prefix (str, optional): The prefix of the Redis keys. Defaults to "fdo_jobs".
+            workers (int, optional): The number of worker threads. Defaults to 2.
+            ttl (int, optional): The seconds a finished job is kept. Defaults to one week.
+            heartbeat_interval (float, optional): The seconds between the heartbeats of running
+                jobs and the checks for stale jobs. Defaults to 10.
+            heartbeat_timeout (float, optional): The seconds after the last heartbeat a running
+                job is considered abandoned and queued again. Defaults to 60.
+        """
+        self.redis_client = redis_client
+        self.handler = handler
+        self.prefix = prefix
+        self.workers = workers
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.threads = []
+        self.threads_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.monitor_thread = None
+        # The jobs processed by the workers of this process
+        self.running = set()
+        self.running_lock = threading.Lock()
+
+    def job_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}"
+
+    def events_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}:events"
+
+    def trace_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}:trace"
+
+    def running_key(self):
+        return f"{self.prefix}:running"
+
+    def enqueue(self, payload):
+        """
+        Submits a job.
+
+        Args:
+            payload (dict): The JSON serializable payload passed to the handler.
+
+        Returns:
+            str: The ID of the job.
+        """
+        job_id = uuid.uuid4().hex
+        self.redis_client.hset(self.job_key(job_id), mapping={
+            "status": "queued",
+            "payload": json.dumps(payload),
+            "created": time.time(),
+            "total": 0,
+            "processed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "skipped": 0
+        })
+        self.redis_client.rpush(f"{self.prefix}:queue", job_id)
+        self.start()
+        return job_id
+
+    def start(self):
+        """
+        Starts the worker threads and the heartbeat thread if they are not running yet.
+
+        Jobs queued before a restart are taken up as soon as the workers run, so the application
+        calls this at startup and not only when a job is submitted.
+        """
+        with self.threads_lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            if self.workers > 0 and (self.monitor_thread is None or not self.monitor_thread.is_alive()):
+                self.monitor_thread = threading.Thread(target=self.monitor, daemon=True)
+                self.monitor_thread.start()
+
+    def stop(self):
+        """
+        Stops the worker threads after their current job.
+        """
+        self.stopped.set()
+
+    def work(self):
+        """
+        Takes jobs from the queue until the queue is stopped.
+        """
+        while not self.stopped.is_set():
+            item = self.redis_client.blpop(f"{self.prefix}:queue", timeout=1)
+            if item is not None:
+                self.process(item[1])
+
+    def monitor(self):
+        """
+        Refreshes the heartbeats of the running jobs and requeues stale jobs until the queue is stopped.
+        """
+        while not self.stopped.is_set():
+            self.beat()
+            self.recover()
+            self.stopped.wait(self.heartbeat_interval)
+
+    def beat(self):
+        """
+        Refreshes the heartbeats of the jobs processed by this process.
+        """
+        with self.running_lock:
+            job_ids = list(self.running)
+        for job_id in job_ids:
+            self.redis_client.hset(self.job_key(job_id), "heartbeat", time.time())
+
+    def recover(self):
+        """
+        Queues the running jobs again whose heartbeat is older than heartbeat_timeout. Their
+        counters and progress events are reset, so the job status page replays only the new run.
+
+        Returns:
+            list: The IDs of the requeued jobs.
+        """
+        requeued = []
+        for job_id in self.redis_client.smembers(self.running_key()):
+            with self.running_lock:
+                if job_id in self.running:
+                    continue
+            heartbeat = self.redis_client.hget(self.job_key(job_id), "heartbeat")
+            if heartbeat is not None and time.time() - float(heartbeat) < self.heartbeat_timeout:
+                continue
+            # Only the process removing the job from the running set requeues it
+            if not self.redis_client.srem(self.running_key(), job_id) or heartbeat is None:
+                continue
+            self.redis_client.hset(self.job_key(job_id), mapping={
+                "status": "queued", "total": 0, "processed": 0, "succeeded": 0, "failed": 0, "skipped": 0
+            })
+            # The job starts over, so the events of the abandoned run would be counted twice
+            self.redis_client.delete(self.events_key(job_id))
+            self.redis_client.rpush(f"{self.prefix}:queue", job_id)
+            requeued.append(job_id)
+        return requeued
+
+    def process(self, job_id):
+        """
+        Processes a job and records its progress and result.
+
+        If the payload has a true "trace" entry, the spans of the job are recorded and stored
+        as Chrome trace, see get_trace.
+
+        Args:
+            job_id (str): The ID of the job.
+        """
+        job_key = self.job_key(job_id)
+        payload = json.loads(self.redis_client.hget(job_key, "payload"))
+        with self.running_lock:
+            self.running.add(job_id)
+        now = time.time()
+        self.redis_client.hset(job_key, mapping={"status": "running", "started": now, "heartbeat": now})
+        self.redis_client.sadd(self.running_key(), job_id)
+        try:
+            self.run_handler(job_id, payload)
+        finally:
+            self.redis_client.srem(self.running_key(), job_id)
+            with self.running_lock:
+                self.running.discard(job_id)
+
+    def run_handler(self, job_id, payload):
+        """
+        Runs the handler of a job and stores its progress, result and trace.
+
+        Args:
+            job_id (str): The ID of the job.
+            payload (dict): The payload of the job.
+        """
+        job_key = self.job_key(job_id)
+
+        def on_event(event):
+            if event["type"] in ("operation", "expanded"):
+                self.redis_client.hincrby(job_key, "total", event["inputs"])
+            elif event["type"] == "item":
+                self.redis_client.hincrby(job_key, "processed", 1)
+                if event["status"] == "success":
+                    self.redis_client.hincrby(job_key, "succeeded", 1)
+                elif event["status"] == "failed":
+                    self.redis_client.hincrby(job_key, "failed", 1)
+                else:
+                    self.redis_client.hincrby(job_key, "skipped", 1)
+            self.redis_client.rpush(self.events_key(job_id), json.dumps(event))
+
+        tracer = Tracer(f"job {job_id}") if payload.get("trace") else None
+        try:
+            with tracer.activate() if tracer is not None else contextlib.nullcontext(), span("job", job=job_id):
+                result = self.handler(payload, on_event)
+            self.redis_client.hset(job_key, mapping={"status": "done", "result": json.dumps(result), "finished": time.time()})
+        except Exception as e:
+            self.redis_client.hset(job_key, mapping={"status": "failed", "error": str(e), "finished": time.time()})
+        if tracer is not None:
+            self.redis_client.set(self.trace_key(job_id), json.dumps(tracer.to_chrome_trace()), ex=self.ttl)
+            self.redis_client.hset(job_key, "traced", 1)
+        self.redis_client.rpush(self.events_key(job_id), json.dumps({"type": "end"}))
+        self.redis_client.expire(job_key, self.ttl)
+        self.redis_client.expire(self.events_key(job_id), self.ttl)
+
+    def get_status(self, job_id):
+        """
+        Returns the status of a job.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            dict or None: The status, counters and result of the job, None if the job is unknown.
+        """
+        job = self.redis_client.hgetall(self.job_key(job_id))
+        if not job:
+            return None
+        status = {"id": job_id, "status": job["status"], "error": job.get("error"), "traced": "traced" in job}
+        for counter in ("total", "processed", "succeeded", "failed", "skipped"):
+            status[counter] = int(job.get(counter, 0))
+        status["result"] = json.loads(job["result"]) if "result" in job else None
+        return status
+
+    def get_events(self, job_id, start=0):
+        """
+        Returns the progress events of a job.
+
+        Args:
+            job_id (str): The ID of the job.
+            start (int, optional): The index of the first event. Defaults to 0.
+
+        Returns:
+            list: The events.
+        """
+        return [json.loads(event) for event in self.redis_client.lrange(self.events_key(job_id), start, -1)]
+
+    def get_trace(self, job_id):
+        """
+        Returns the recorded spans of a traced job.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            dict or None: The spans in the Chrome trace event format, None if the job was not traced.
+        """
+        trace = self.redis_client.get(self.trace_key(job_id))
+        return json.loads(trace) if trace is not None else None
@@ -2,6 +2,9 @@ import json
 from datetime import datetime, timedelta
 import hashlib
 import requests
+from urllib.parse import urlsplit
+from modules.metrics import timed
+from modules import tracing
 
 
 class KernelWorkflow:
@@ -16,6 +19,8 @@ class KernelWorkflow:
         with open(tpm_keys_config_path, 'r') as file:
             self.tpm_keys = json.load(file)
 
+    @timed("validation")
+    @tracing.traced("validate")
     def validate(self, record, checksum=True):
         """
         Validates the given record against the predefined key-value pairs in the configuration.
@@ -31,6 +36,7 @@ class KernelWorkflow:
         
         if record is None:
             return False
+        tracing.annotate(pid=record.get("pid"))
         try:
             result = self.check_url(record["entries"][self.tpm_keys["digitalObjectLocation"]])
             if result is False:
@@ -49,6 +55,8 @@ class KernelWorkflow:
             return False
         return True
 
+    @timed("validation")
+    @tracing.traced("validate.check_url")
     def check_url(self, url):
         """
         Checks if the given URL(s) are valid.
@@ -62,7 +70,9 @@ class KernelWorkflow:
         valid_urls = []
         for url in url:
             try:
-                response = requests.head(url["value"], timeout=5)
+                with tracing.span("validate.head", host=urlsplit(url["value"]).netloc) as span:
+                    response = requests.head(url["value"], timeout=5)
+                    span.set(status_code=response.status_code)
                 if response.status_code // 100 in {2, 3}:
                     valid_urls.append(url)
                 elif response.status_code == 405:  # only for validating an operation's availability
@@ -76,6 +86,8 @@ class KernelWorkflow:
         else:
             return False
 
+    @timed("validation")
+    @tracing.traced("validate.date")
     def date_evaluation(self, date):
         """
         Evaluates if the given date is up to date.
@@ -91,6 +103,8 @@ class KernelWorkflow:
         border = now - timedelta(days=55*365.25)
         return date > border
 
+    @timed("validation")
+    @tracing.traced("validate.license")
     def license_evaluation(self, license):
         """
         Evaluates if the given license is an open source license.
@@ -115,6 +129,8 @@ class KernelWorkflow:
         ]
         return license[0]["value"] in open_source_licenses
 
+    @timed("validation")
+    @tracing.traced("validate.checksum")
     def checksum_evaluation(self, urls, checksums):
         """
         Evaluates if the checksums of the given URLs match the provided checksums.
@@ -130,8 +146,10 @@ class KernelWorkflow:
         checksums = checksums[0]["value"]
 
         for url in urls:
-            response = requests.get(url["value"])
-            document_content = response.text
+            with tracing.span("validate.checksum_download", host=urlsplit(url["value"]).netloc) as span:
+                response = requests.get(url["value"])
+                document_content = response.text
+                span.set(status_code=response.status_code, bytes=len(response.content))
 
             for key, value in checksums.items():
                 if key == "sha256sum":
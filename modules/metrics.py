@@ -0,0 +1,238 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+# Latency buckets in seconds, from local lookups up to long running operations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def format_labels(labels):
+    """
+    Formats labels in the Prometheus text format.
+
+    Args:
+        labels (tuple): The (name, value) pairs.
+
+    Returns:
+        str: The formatted labels, an empty string if there are none.
+    """
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing value per label combination. By convention its name ends with _total.
+    """
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """
+    The distribution of observed values per label combination, in cumulative buckets.
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        self.observe_key(tuple(labels[name] for name in self.labelnames), value)
+
+    def observe_key(self, key, value):
+        """
+        Records a value for the label values in the order of the label names.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # One count per bucket plus the +Inf bucket, followed by the sum
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = [(key, list(counts)) for key, counts in self.values.items()]
+        for key, counts in values:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield self.name + "_bucket", labels + (("le", format_value(bound)),), cumulative
+            yield self.name + "_sum", labels, counts[-1]
+            yield self.name + "_count", labels, cumulative
+
+
+class GaugeFunction:
+    """
+    A value computed when the metrics are collected.
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self):
+        value = self.function()
+        if value is not None:
+            yield self.name, (), value
+
+
+class Registry:
+    """
+    Holds the metrics of the process and renders them in the Prometheus text format.
+
+    Recording a value only updates an in-memory counter, the text is built when the metrics
+    are scraped.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        Returns the counter with the given name, created if it does not exist yet.
+        """
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Returns the histogram with the given name, created if it does not exist yet.
+        """
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_function(self, name, documentation, function):
+        """
+        Returns the gauge with the given name, computed by the function when collected.
+        """
+        return self.register(GaugeFunction(name, documentation, function))
+
+    def render(self):
+        """
+        Renders all metrics.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "fdo_stage_duration_seconds", "Duration of the calls of the pipeline stages, nested calls included.", ("stage", "method"))
+STAGE_ERRORS = REGISTRY.counter(
+    "fdo_stage_errors_total", "Calls of the pipeline stages that raised an exception.", ("stage", "method"))
+
+
+def timed(stage):
+    """
+    Decorates a function to record the duration of its calls and the raised exceptions.
+
+    For generator functions the time spent producing the items is recorded once the
+    generator is exhausted or closed, excluding the time the consumer spends between items.
+
+    Args:
+        stage (str): The pipeline stage the function belongs to.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        labels = {"stage": stage, "method": function.__qualname__}
+        key = (stage, function.__qualname__)
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                elapsed = 0.0
+                start = None
+                generator = function(*args, **kwargs)
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                        elapsed += time.perf_counter() - start
+                        start = None
+                        yield item
+                except Exception:
+                    STAGE_ERRORS.inc(**labels)
+                    raise
+                finally:
+                    if start is not None:
+                        elapsed += time.perf_counter() - start
+                    generator.close()
+                    STAGE_DURATION.observe_key(key, elapsed)
+
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(**labels)
+                raise
+            finally:
+                STAGE_DURATION.observe_key(key, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
@@ -1,76 +1,575 @@
 import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack, contextmanager
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
+
+from modules.metrics import REGISTRY, timed
+from modules import tracing
+from modules import tensor_format
+
+HTTP_BYTES = REGISTRY.counter("fdo_http_bytes_total", "Bytes transferred by operation requests.", ("direction",))
+HTTP_RESPONSES = REGISTRY.counter("fdo_http_responses_total", "Responses of operation requests by status code.", ("code",))
+# Operations returning tensors answer in the raw tensor format instead of pickle, others with any type
+ACCEPT = f"{tensor_format.MEDIA_TYPE}, */*;q=0.8"
+
+
+class SpooledContent:
+    """
+    The body of a response kept in memory, or in an anonymous temporary file once it exceeds max_size.
+
+    It is passed as file content to the requests of subsequent operations, which may read it
+    concurrently.
+    """
+
+    def __init__(self, name, max_size=64 * 1024 * 1024):
+        """
+        Initializes the SpooledContent object.
+
+        Args:
+            name (str): The file name of the content.
+            max_size (int, optional): The number of bytes kept in memory. Defaults to 64 MiB.
+        """
+        self.name = name
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size)
+        self.lock = threading.Lock()
+        self.size = 0
+        self.sha256 = None
+
+    def read(self):
+        """
+        Returns the complete content.
+        """
+        with self.lock:
+            self.file.seek(0)
+            return self.file.read()
+
+    def close(self):
+        """
+        Releases the memory or the temporary file holding the content.
+        """
+        self.file.close()
+
 
 class Ops_Executor:
-    def __init__(self):
-        pass
+    def __init__(self, timeout=300, max_workers=8, per_host_limit=4, cache=None):
+        """
+        Initializes the Ops_Executor class.
 
-    def execute_http_request(self, file_name, request_string, folder_name):
+        Args:
+            timeout (float or tuple, optional): The timeout of a request in seconds, or a
+                (connect, read) tuple. Defaults to 300.
+            max_workers (int, optional): The global number of concurrent requests in batch mode. Defaults to 8.
+            per_host_limit (int, optional): The number of concurrent requests per host in batch mode. Defaults to 4.
+            cache (ExecutionCache, optional): The memo store of executed operations. Defaults to None (no caching).
+        """
+        self.timeout = timeout
+        self.cache = cache
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.session = requests.Session()
+        # urllib3 keeps one connection pool per host, each holding up to per_host_limit connections
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=per_host_limit)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Accept'] = ACCEPT
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
+        self.log_lock = threading.Lock()
+
+    def open_files(self, files, stack):
+        """
+        Opens the file references of a request specification.
+
+        Args:
+            files (dict): The file references, mapping form keys to {"path": ..., "mode": ...}
+                or to {"name": ..., "content": ...} for content held in memory.
+            stack (ExitStack): The exit stack the opened files are registered with.
+
+        Returns:
+            dict: The opened files, ready to be passed to requests.
+        """
+        opened_files = {}
+        for key, reference in files.items():
+            if "content" in reference:
+                # Content passed on from a previous operation, e.g. a SpooledContent
+                opened_files[key] = (reference.get("name", key), reference["content"])
+            else:
+                opened_files[key] = stack.enter_context(open(reference["path"], reference.get("mode", "rb")))
+        return opened_files
+
+    def reference_size(self, reference):
+        """
+        Returns the size of an uploaded file reference in bytes.
+        """
+        if "content" not in reference:
+            return os.path.getsize(reference["path"])
+        content = reference["content"]
+        if isinstance(content, (bytes, bytearray)):
+            return len(content)
+        return getattr(content, "size", 0)
+
+    def send_request(self, request_spec, stream=False):
+        """
+        Sends a request specification through the shared session.
+
+        Args:
+            request_spec (dict): The request specification created by the RecordMapper.
+            stream (bool, optional): Defer downloading the response body. Defaults to False.
+
+        Returns:
+            requests.Response: The response of the request.
+        """
+        files = request_spec.get("files") or {}
+        sent = sum(self.reference_size(reference) for reference in files.values())
+        HTTP_BYTES.inc(sent, direction="sent")
+        with tracing.span("executor.request", method=request_spec["method"], host=urlsplit(request_spec["url"]).netloc,
+                          bytes_sent=sent) as span, ExitStack() as stack:
+            response = self.session.request(
+                request_spec["method"],
+                request_spec["url"],
+                params=request_spec.get("params") or None,
+                headers=request_spec.get("headers") or None,
+                data=request_spec.get("data") or None,
+                files=self.open_files(files, stack) or None,
+                timeout=self.timeout,
+                stream=stream
+            )
+            span.set(status_code=response.status_code)
+            return response
+
+    def execute_http_request(self, file_name, request_spec, folder_name):
         """
         Executes an HTTP request and saves the response content in a specified folder.
 
         Args:
             file_name (str): The name of the file.
-            request_string (str): The HTTP request string.
+            request_spec (dict): The HTTP request specification.
             folder_name (str): The name of the folder to save the response content.
 
         Returns:
             tuple: A tuple containing the status of the request and the folder name.
         """
-        
+        result = self.execute(file_name, request_spec, folder_name)
+        return result["status"], result["folder"]
+
+    @timed("execution")
+    def execute(self, file_name, request_spec, folder_name, operation_pid=None, refresh=False):
+        """
+        Executes an HTTP request and saves the response content in a specified folder.
+
+        If a cache is configured and the operation PID is given, the result of an earlier
+        execution with the same input and request is returned without calling the operation.
+
+        Args:
+            file_name (str): The name of the file, i.e. the FDO PID in profile mode.
+            request_spec (dict): The HTTP request specification.
+            folder_name (str): The name of the folder to save the response content.
+            operation_pid (str, optional): The PID of the executed operation. Defaults to None.
+            refresh (bool, optional): Execute the operation even if a cached result exists. Defaults to False.
+
+        Returns:
+            dict: The result with the status, the HTTP status code, the folder and the path of the stored file.
+        """
+        with tracing.span("executor.execute", item=file_name, operation=operation_pid,
+                          host=urlsplit(request_spec["url"]).netloc) as span:
+            result = self.execute_cached(file_name, request_spec, folder_name, operation_pid, refresh)
+            span.set(status=result["status"], cached=result["cached"], bytes=result["size"])
+            return result
+
+    def execute_cached(self, file_name, request_spec, folder_name, operation_pid, refresh):
+        """
+        Looks up the result of a request in the cache, and executes and stores it on a miss.
+
+        Args:
+            file_name (str): The name of the file, i.e. the FDO PID in profile mode.
+            request_spec (dict): The HTTP request specification.
+            folder_name (str): The name of the folder to save the response content.
+            operation_pid (str): The PID of the executed operation, None to bypass the cache.
+            refresh (bool): Execute the operation even if a cached result exists.
+
+        Returns:
+            dict: The result with the status, the HTTP status code, the folder and the path of the stored file.
+        """
+        if self.cache is None or operation_pid is None:
+            with self.host_slot(request_spec["url"]):
+                return self.download(file_name, request_spec, folder_name)
+
+        key, input_id, spec_hash = self.cache.make_key(operation_pid, file_name, request_spec)
+        if not refresh:
+            cached = self.cache.get(key, folder_name)
+            if cached is not None:
+                return {
+                    "file_name": file_name,
+                    "url": request_spec["url"],
+                    "status_code": None,
+                    "folder": folder_name,
+                    "path": cached["path"],
+                    "size": cached["size"],
+                    "sha256": cached["sha256"],
+                    "duration": 0.0,
+                    "error": None,
+                    "cached": True,
+                    "status": 'Request successful'
+                }
+        with self.host_slot(request_spec["url"]):
+            result = self.download(file_name, request_spec, folder_name)
+        if result["status"] == 'Request successful':
+            self.cache.put(key, operation_pid, input_id, spec_hash, result["path"], result["sha256"], result["size"])
+        return result
+
+    @timed("download")
+    @tracing.traced("executor.download")
+    def download(self, file_name, request_spec, folder_name):
+        """
+        Sends an HTTP request and streams the response content into a specified folder.
+
+        Args:
+            file_name (str): The name of the file.
+            request_spec (dict): The HTTP request specification.
+            folder_name (str): The name of the folder to save the response content.
+
+        Returns:
+            dict: The result with the status, the HTTP status code, the folder and the path of the stored file.
+        """
+
         # Create the folder if it doesn't exist
         if not os.path.exists(folder_name):
-            os.makedirs(folder_name)
-        
-        request_string = request_string.replace("'", '"')
-        
-        if "open" in request_string:
-            request_string = request_string.replace('"open(', 'open(').replace(', "rb")"', ', "rb")').replace(', "r")"', ', "r")')
-        
-        print("request_string", request_string)
-        
-        # Perform the HTTP request
-        response = eval(request_string)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Save the response content in the specified folder
-            if 'Content-Disposition' in response.headers:
-                content_disposition = response.headers['Content-Disposition']
-                # Extract filename if present
-                if 'filename=' in content_disposition:
-                    filename = content_disposition.split('filename=')[1]
-                    filename = file_name.replace('/', '_') + filename.replace('"', '').replace("'", '')
-            elif 'Content-Type' in response.headers:
-                content_type = response.headers.get('Content-Type')
-
-                # Mapping of some common MIME types to file extensions
-                mime_type_to_extension = {
-                    'application/json': '.json',
-                    'application/xml': '.xml',
-                    'application/rdf+xml': '.rdf',
-                    'application/octet-stream': '.bin',  # Generic binary file
-                    'image/jpeg': '.jpg',
-                    'image/png': '.png',
-                    'text/plain': '.txt',
-                    'text/turtle': '.ttl',
-                    # Add more mappings as needed
+            os.makedirs(folder_name, exist_ok=True)
+
+        # Perform the HTTP request, the body is streamed to disk below
+        start = time.perf_counter()
+        response = self.send_request(request_spec, stream=True)
+        try:
+            result = {
+                "file_name": file_name,
+                "url": request_spec["url"],
+                "status_code": response.status_code,
+                "folder": folder_name,
+                "path": None,
+                "size": 0,
+                "sha256": None,
+                "duration": None,
+                "error": None,
+                "cached": False
+            }
+
+            # Check if the request was successful
+            if response.status_code == 200:
+                result["path"] = os.path.join(folder_name, self.get_file_name(file_name, response.headers))
+                result["size"], result["sha256"] = self.write_response(response, result["path"])
+                result["status"] = 'Request successful'
+            else:
+                result["status"] = 'Request failed'
+        finally:
+            response.close()
+        result["duration"] = round(time.perf_counter() - start, 6)
+        HTTP_RESPONSES.inc(code=str(result["status_code"]))
+        HTTP_BYTES.inc(result["size"], direction="received")
+        tracing.annotate(item=file_name, status_code=result["status_code"], bytes=result["size"])
+
+        # Store the metadata of the response in the logging file
+        self.log_result(request_spec, result)
+        return result
+
+    @timed("execution")
+    @tracing.traced("executor.fetch")
+    def fetch(self, file_name, request_spec, spool_size=64 * 1024 * 1024):
+        """
+        Sends an HTTP request and keeps the response content as SpooledContent instead of storing it.
+
+        Args:
+            file_name (str): The name of the file.
+            request_spec (dict): The HTTP request specification.
+            spool_size (int, optional): The number of bytes kept in memory before the content
+                is moved to a temporary file. Defaults to 64 MiB.
+
+        Returns:
+            dict: The result with the status, the HTTP status code and the content.
+        """
+        start = time.perf_counter()
+        with self.host_slot(request_spec["url"]):
+            response = self.send_request(request_spec, stream=True)
+            try:
+                result = {
+                    "file_name": file_name,
+                    "url": request_spec["url"],
+                    "status_code": response.status_code,
+                    "folder": None,
+                    "path": None,
+                    "content": None,
+                    "size": 0,
+                    "sha256": None,
+                    "duration": None,
+                    "error": None,
+                    "cached": False
                 }
+                if response.status_code == 200:
+                    content = SpooledContent(self.get_file_name(file_name, response.headers), spool_size)
+                    content.size, content.sha256 = self.copy_response(response, content.file)
+                    result["content"], result["size"], result["sha256"] = content, content.size, content.sha256
+                    result["status"] = 'Request successful'
+                else:
+                    result["status"] = 'Request failed'
+            finally:
+                response.close()
+        result["duration"] = round(time.perf_counter() - start, 6)
+        HTTP_RESPONSES.inc(code=str(result["status_code"]))
+        HTTP_BYTES.inc(result["size"], direction="received")
+        tracing.annotate(item=file_name, status_code=result["status_code"], bytes=result["size"])
+        self.log_result(request_spec, result)
+        return result
+
+    def log_result(self, request_spec, result):
+        """
+        Appends the metadata of a response to the logging file.
+
+        Args:
+            request_spec (dict): The HTTP request specification.
+            result (dict): The result of the request.
+        """
+        with self.log_lock, open('log.txt', 'a') as log_file:
+            log_file.write(json.dumps({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "method": request_spec["method"],
+                "url": result["url"],
+                "status_code": result["status_code"],
+                "path": result["path"],
+                "size": result["size"],
+                "sha256": result["sha256"],
+                "duration": result["duration"]
+            }) + '\n')
+
+    def get_file_name(self, file_name, headers):
+        """
+        Derives the name of the stored file from the response headers.
+
+        Args:
+            file_name (str): The name of the file.
+            headers (dict): The response headers.
+
+        Returns:
+            str: The file name including the extension.
+        """
+        filename = file_name.replace('/', '_') + '.unknown'
+        if 'Content-Disposition' in headers:
+            content_disposition = headers['Content-Disposition']
+            # Extract filename if present
+            if 'filename=' in content_disposition:
+                filename = content_disposition.split('filename=')[1]
+                filename = file_name.replace('/', '_') + filename.replace('"', '').replace("'", '')
+        elif 'Content-Type' in headers:
+            content_type = headers.get('Content-Type')
+
+            # Mapping of some common MIME types to file extensions
+            mime_type_to_extension = {
+                'application/json': '.json',
+                'application/xml': '.xml',
+                'application/rdf+xml': '.rdf',
+                'application/octet-stream': '.bin',  # Generic binary file
+                'image/jpeg': '.jpg',
+                'image/png': '.png',
+                'text/plain': '.txt',
+                'text/turtle': '.ttl',
+                # Add more mappings as needed
+            }
+
+            # Infer the file extension
+            filename = mime_type_to_extension.get(content_type, '.unknown')  # Default to '.unknown' if MIME type is not in the dictionary
+            filename = file_name.replace('/', '_') + filename.replace('"', '').replace("'", '').replace('/', '_')
+        return filename
+
+    @timed("file_write")
+    @tracing.traced("executor.write")
+    def write_response(self, response, path, chunk_size=1024 * 1024):
+        """
+        Streams the body of a response to a file.
+
+        The body is written chunk by chunk to a temporary file next to the target and
+        renamed into place once complete, so readers never see partial files and the
+        memory usage does not depend on the size of the body.
+
+        Args:
+            response (requests.Response): The streamed response.
+            path (str): The path of the file to write.
+            chunk_size (int, optional): The size of the chunks in bytes. Defaults to 1 MiB.
+
+        Returns:
+            tuple: The size of the body in bytes and its SHA-256 digest.
+        """
+        temp_file = tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.', prefix='.', suffix='.part', delete=False)
+        try:
+            with temp_file:
+                size, sha256 = self.copy_response(response, temp_file, chunk_size)
+            os.chmod(temp_file.name, 0o644)
+            os.replace(temp_file.name, path)
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+        return size, sha256
+
+    def copy_response(self, response, file, chunk_size=1024 * 1024):
+        """
+        Copies the streamed body of a response chunk by chunk into a file object.
+
+        Args:
+            response (requests.Response): The streamed response.
+            file (file object): The binary file object to write to.
+            chunk_size (int, optional): The size of the chunks in bytes. Defaults to 1 MiB.
+
+        Returns:
+            tuple: The size of the body in bytes and its SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                file.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        return size, digest.hexdigest()
 
-                # Infer the file extension
-                filename = mime_type_to_extension.get(content_type, '.unknown')  # Default to '.unknown' if MIME type is not in the dictionary
-                filename = file_name.replace('/', '_') + filename.replace('"', '').replace("'", '').replace('/', '_')
-            
-            with open(os.path.join(folder_name, filename), 'wb') as response_file:
-                response_file.write(response.content)
-            
-            # Store the response in the logging file
-            with open('log.txt', 'a') as log_file:
-                log_file.write(f'Request: {request_string}\n')
-                log_file.write(f'Response: {response.text}\n')
-                log_file.write(f'Data stored in: {folder_name}\n')
-            
-            return 'Request successful', folder_name
-        else:
-            print("failed")
-            return 'Request failed', folder_name
\ No newline at end of file
+    def host_semaphore(self, url):
+        """
+        Returns the semaphore limiting the concurrent requests to the host of a URL.
+
+        Args:
+            url (str): The URL of the request.
+
+        Returns:
+            threading.BoundedSemaphore: The semaphore of the host.
+        """
+        host = urlsplit(url).netloc
+        with self.host_semaphores_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.host_semaphores[host]
+
+    @contextmanager
+    def host_slot(self, url):
+        """
+        Holds a slot of the semaphore of the host of a URL, tracing the time spent waiting for it.
+
+        Args:
+            url (str): The URL of the request.
+        """
+        semaphore = self.host_semaphore(url)
+        with tracing.span("executor.host_wait", host=urlsplit(url).netloc):
+            semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def iter_batch(self, jobs, ordered=True, refresh=False):
+        """
+        Executes a batch of HTTP requests concurrently.
+
+        At most max_workers requests run at the same time, at most per_host_limit of them
+        against the same host, and only a bounded number of jobs is taken from the iterable
+        ahead of time, so generators of mapped requests are consumed lazily.
+
+        Args:
+            jobs (iterable): The (file_name, request_spec, folder_name) tuples to execute, optionally
+                extended by the operation PID to look up and store the results in the cache.
+            ordered (bool, optional): Yield the results in the order of the jobs instead of
+                the order of completion. Defaults to True.
+            refresh (bool, optional): Execute the operations even if cached results exist. Defaults to False.
+
+        Yields:
+            tuple: The index of the job, the job and its result dictionary. Exceptions raised
+            while executing a job are returned as result with the status 'Request failed'
+            and the exception message as 'error'.
+        """
+        jobs = iter(enumerate(jobs))
+        window = self.max_workers * 2
+        in_flight = deque()
+
+        def submit_next(pool):
+            entry = next(jobs, None)
+            if entry is None:
+                return False
+            index, job = entry
+            in_flight.append((index, job, pool.submit(tracing.bind(self.execute), *job, refresh=refresh)))
+            return True
+
+        def collect(index, job, future):
+            try:
+                return index, job, future.result()
+            except Exception as e:
+                file_name, request_spec, folder_name = job[:3]
+                return index, job, self.failed_result(file_name, request_spec, folder_name, e)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            if ordered:
+                while len(in_flight) < window and submit_next(pool):
+                    pass
+                while in_flight:
+                    index, job, future = in_flight.popleft()
+                    yield collect(index, job, future)
+                    while len(in_flight) < window and submit_next(pool):
+                        pass
+            else:
+                # Hand out finished results while further jobs are still being produced
+                exhausted = False
+                while in_flight or not exhausted:
+                    if not exhausted and len(in_flight) < window:
+                        exhausted = not submit_next(pool)
+                    else:
+                        wait([future for _, _, future in in_flight], return_when=FIRST_COMPLETED)
+                    for entry in [entry for entry in in_flight if entry[2].done()]:
+                        in_flight.remove(entry)
+                        yield collect(*entry)
+
+    def failed_result(self, file_name, request_spec, folder_name, error):
+        """
+        Builds the result of a request that raised an exception.
+
+        Args:
+            file_name (str): The name of the file.
+            request_spec (dict): The HTTP request specification.
+            folder_name (str): The name of the folder.
+            error (Exception): The raised exception.
+
+        Returns:
+            dict: The result with the status 'Request failed' and the exception message as 'error'.
+        """
+        return {
+            "file_name": file_name,
+            "url": request_spec["url"],
+            "status_code": None,
+            "folder": folder_name,
+            "path": None,
+            "size": 0,
+            "sha256": None,
+            "duration": None,
+            "cached": False,
+            "status": 'Request failed',
+            "error": str(error)
+        }
+
+    def execute_batch(self, jobs, refresh=False):
+        """
+        Executes a batch of HTTP requests concurrently.
+
+        Args:
+            jobs (iterable): The (file_name, request_spec, folder_name[, operation_pid]) tuples to execute.
+            refresh (bool, optional): Execute the operations even if cached results exist. Defaults to False.
+
+        Returns:
+            tuple: The result dictionaries in the order of the jobs and the list of failed results.
+        """
+        results = []
+        failures = []
+        for _, _, result in self.iter_batch(jobs, refresh=refresh):
+            results.append(result)
+            if result["status"] != 'Request successful':
+                failures.append(result)
+        return results, failures
@@ -0,0 +1,224 @@
+import os
+from modules.ingest_manifest import scan_directory
+from modules.metrics import timed
+from modules import tracing
+
+# FDOs excluded from the profile mode
+EXCLUDED_FDOS = {"21.11152/02652ab1-58e4-409f-bcff-c2194bf345b8"}
+
+
+class Pipeline:
+    """
+    Runs the fetch, validation, mapping and execution steps for a selection of operations.
+
+    The pipeline does not depend on Flask or Redis. Progress is reported through an optional
+    callback receiving one event dictionary per operation and per processed item. The "inputs"
+    of an operation event count its FDOs or files, and an "expanded" event adds the further
+    requests of an input whose multi-valued attributes expand into several requests.
+    """
+
+    def __init__(self, tpm_service, validator, mapper, executor, manifest=None):
+        """
+        Initializes the Pipeline object.
+
+        Args:
+            tpm_service (TPMService): The service providing the PID records.
+            validator (KernelWorkflow): The validator of the PID records.
+            mapper (RecordMapper): The mapper of records to requests.
+            executor (Ops_Executor): The executor of the mapped requests.
+            manifest (IngestManifest, optional): The record of processed local files, so attribute
+                mode only processes new or changed files. Defaults to None (all files are processed).
+        """
+        self.tpm_service = tpm_service
+        self.validator = validator
+        self.mapper = mapper
+        self.executor = executor
+        self.manifest = manifest
+
+    @timed("pipeline")
+    def run(self, mode, selection, refresh=False, on_event=None):
+        """
+        Executes the selected operations.
+
+        Args:
+            mode (str): Either "profiles" (operations on FDOs) or "attributes" (operations on local files).
+            selection (dict): Maps operation PIDs to (output type, inputs) pairs, where the inputs are
+                FDO PIDs in profile mode and a list holding the input directory in attribute mode.
+            refresh (bool, optional): Execute the operations even if cached results exist. Defaults to False.
+            on_event (callable, optional): Called with each progress event. Defaults to None.
+
+        Returns:
+            dict: The summary with the output type, the result folder and the number of
+            successful, failed and skipped items.
+        """
+        summary = {"outputType": None, "folder_name": None, "succeeded": 0, "failed": 0, "skipped": 0}
+        report = self.reporter(summary, on_event)
+
+        for op, (outputType, inputs) in selection.items():
+            with tracing.span("pipeline.operation", operation=op, output_type=outputType, mode=mode):
+                op_record = self.tpm_service.get_record(op)
+                if not self.validator.validate(op_record, checksum=False):
+                    # Handle invalid digital object
+                    report({"type": "item", "operation": op, "item": op, "status": "invalid", "error": "Invalid operation record"})
+                    continue
+                summary["outputType"] = outputType
+                summary["folder_name"] = outputType
+                # The input file of each job by job index, as items of different files can share a name
+                local_files = []
+
+                if mode == "profiles":
+                    report({"type": "operation", "operation": op, "output_type": outputType, "inputs": len(inputs)})
+                    jobs = self.get_profile_jobs(op, op_record, inputs, outputType, report)
+                elif mode == "attributes":
+                    local_dir = inputs[0]  # currently only one level of input attributes
+                    files = scan_directory(local_dir)
+                    if self.manifest is not None:
+                        files, unchanged = self.manifest.changed(op, files, refresh)
+                    else:
+                        unchanged = 0
+                    report({"type": "operation", "operation": op, "output_type": outputType, "inputs": len(files), "unchanged": unchanged})
+                    jobs = self.get_local_jobs(op, op_record, files, outputType, report, local_files)
+                else:
+                    raise ValueError(f"Unknown mode: {mode}")
+
+                failed_files = set()
+                for index, _, result in self.executor.iter_batch(jobs, ordered=False, refresh=refresh):
+                    event = self.item_event(op, result)
+                    report(event)
+                    local_file = local_files[index] if mode == "attributes" else None
+                    if self.manifest is not None and local_file is not None:
+                        # A file with any failed request is processed again by the next run
+                        if event["status"] != "success":
+                            failed_files.add(local_file.path)
+                            self.manifest.forget(op, local_file)
+                        elif local_file.path not in failed_files:
+                            self.manifest.record(op, local_file)
+        return summary
+
+    def reporter(self, summary, on_event=None):
+        """
+        Creates the callback counting the item events in a summary and passing all events on.
+
+        Args:
+            summary (dict): The summary holding the succeeded, failed and skipped counters.
+            on_event (callable, optional): Called with each progress event. Defaults to None.
+
+        Returns:
+            callable: The callback receiving the progress events.
+        """
+        def report(event):
+            if event["type"] == "item":
+                if event["status"] == "success":
+                    summary["succeeded"] += 1
+                elif event["status"] == "failed":
+                    summary["failed"] += 1
+                else:
+                    summary["skipped"] += 1
+            if on_event is not None:
+                on_event(event)
+
+        return report
+
+    def item_event(self, op, result):
+        """
+        Builds the progress event of an executed request.
+
+        Args:
+            op (str): The PID of the operation.
+            result (dict): The result returned by the executor.
+
+        Returns:
+            dict: The item event.
+        """
+        return {
+            "type": "item",
+            "operation": op,
+            "item": result["file_name"],
+            "status": "success" if result["status"] == 'Request successful' else "failed",
+            "url": result["url"],
+            "status_code": result["status_code"],
+            "path": result["path"],
+            "size": result["size"],
+            "duration": result["duration"],
+            "cached": result["cached"],
+            "error": result["error"]
+        }
+
+    def get_profile_jobs(self, op, op_record, fdos, outputType, report):
+        """
+        Lazily fetches and validates the FDOs of an operation and maps them to executor jobs.
+
+        The FDOs are processed one after another while the executor consumes the jobs, so the
+        first requests are executed before the remaining FDOs have been validated.
+
+        Args:
+            op (str): The PID of the operation.
+            op_record (dict): The operation record.
+            fdos (list): The PIDs of the FDOs.
+            outputType (str): The output type, used as folder for the results.
+            report (callable): Receives the events of skipped FDOs.
+
+        Yields:
+            tuple: The (file name, request, folder name, operation PID) tuples.
+        """
+        def valid_records():
+            for fdo in fdos:
+                if fdo in EXCLUDED_FDOS:
+                    continue
+                fdo_record = self.tpm_service.get_record(fdo)
+                if not self.validator.validate(fdo_record):
+                    # Handle invalid digital object
+                    report({"type": "item", "operation": op, "item": fdo, "status": "invalid", "error": "Invalid data record"})
+                    continue
+                yield fdo, fdo_record["entries"]
+
+        def on_missing(fdo, missing_types):
+            report({"type": "item", "operation": op, "item": fdo, "status": "missing",
+                    "error": "Missing attributes: " + ", ".join(missing_types)})
+
+        previous = None
+        for fdo, req in self.mapper.iter_many(op_record["entries"], valid_records(), on_missing=on_missing):
+            if fdo == previous:
+                # Each further request of an FDO is reported as an item of its own
+                report({"type": "expanded", "operation": op, "item": fdo, "inputs": 1})
+            previous = fdo
+            yield fdo, req, outputType, op
+
+    def get_local_jobs(self, op, op_record, files, outputType, report, sources=None):
+        """
+        Lazily maps the files of a local directory to executor jobs.
+
+        Files without a request are reported as skipped and recorded in the manifest right
+        away, so the next run does not hash them again.
+
+        Args:
+            op (str): The PID of the operation.
+            op_record (dict): The operation record.
+            files (list): The LocalFile objects of the input files.
+            outputType (str): The output type, used as folder for the results.
+            report (callable): Receives the events of expanded and skipped files.
+            sources (list, optional): Receives the LocalFile of each yielded job. Defaults to None.
+
+        Yields:
+            tuple: The (file name, request, folder name, operation PID) tuples.
+        """
+        for file in files:
+            filename, _ = os.path.splitext(file.name)
+            returned_requests = self.mapper.map_to_request(op_record["entries"], None, True, file.path, lazy=True)
+            has_requests = False
+            for req in returned_requests.get("http", []):
+                if has_requests:
+                    report({"type": "expanded", "operation": op, "item": filename, "inputs": 1})
+                has_requests = True
+                if file.sha256 is not None:
+                    # The content hash is known from the manifest, the execution cache does not read the file again
+                    for reference in (req.get("files") or {}).values():
+                        if reference.get("path") == file.path:
+                            reference["sha256"] = file.sha256
+                if sources is not None:
+                    sources.append(file)
+                yield filename, req, outputType, op
+            if not has_requests:
+                report({"type": "item", "operation": op, "item": filename, "status": "skipped", "error": "No request mapped"})
+                if self.manifest is not None:
+                    self.manifest.record(op, file)
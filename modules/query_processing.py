@@ -1,7 +1,11 @@
+from modules.metrics import timed
+
+
 class QueryProcessing:
     def __init__(self):
         pass
 
+    @timed("query_processing")
     def restructure_query_result(self, query_result):
         """
         Restructures the query result into a nested dictionary structure.
@@ -1,6 +1,11 @@
 import json
 import ast
 import os
+import itertools
+from modules.metrics import timed
+from modules import tracing
+
+
 class RecordMapper:
     def __init__(self, tpm_keys_config_path):
         """
@@ -39,7 +44,9 @@ class RecordMapper:
                             pass
         return record["entries"]
 
-    def map_to_request(self, operation_record: str, data_record: str, local_access: bool, local_file_path: str=None):
+    @timed("mapping")
+    @tracing.traced("mapper.map")
+    def map_to_request(self, operation_record: str, data_record: str, local_access: bool, local_file_path: str=None, lazy: bool=False, limit: int=None):
         """
         Map an operation record and a data record to a request.
 
@@ -48,113 +55,269 @@ class RecordMapper:
             data_record (str): The data record.
             local_access (bool): Flag indicating if local access is enabled.
             local_file_path (str, optional): The local file path. Defaults to None.
+            lazy (bool, optional): Return generators instead of lists of requests. Defaults to False.
+            limit (int, optional): The maximum number of requests per protocol. Defaults to None (no limit).
 
         Returns:
             dict: The mapped requests.
         """
+        tracing.annotate(file=local_file_path)
+        mapped_requests = {}
+        for protocol, plan in self.resolve_operation(operation_record, local_access, local_file_path).items():
+            if protocol == "http":
+                http_requests = self.iter_http_requests(plan, data_record, limit)
+                mapped_requests["http"] = http_requests if lazy else list(http_requests)
+            # Add other mappings here
+
+        return mapped_requests
+
+    @timed("mapping")
+    def map_many(self, operation_record, data_records, local_access: bool=False, limit: int=None):
+        """
+        Map one operation record to the requests of many data records.
+
+        The operation record is resolved only once and every data record is mapped against the
+        resolved plan. Data records that lack a required attribute are reported instead of
+        interrupting the batch.
+
+        Args:
+            operation_record (dict): The operation record.
+            data_records (dict): The data records, keyed by their PID.
+            local_access (bool, optional): Flag indicating if local access is enabled. Defaults to False.
+            limit (int, optional): The maximum number of requests per data record. Defaults to None (no limit).
+
+        Returns:
+            tuple: The mapped requests as {protocol: [(pid, request), ...]} and a list of
+            (pid, missing value types) for the skipped data records.
+
+        Raises:
+            ValueError: If local access is enabled, which needs a file path per data record.
+        """
+        if local_access:
+            raise ValueError("Local access needs the file path of each data record, map them with map_to_request")
+        mapped_requests = {}
+        missing = []
+        plans = self.resolve_operation(operation_record, local_access)
+        if "http" in plans:
+            plan = plans["http"]
+            value_types = self.required_value_types(plan)
+
+            http_requests = []
+            for pid, data_record in data_records.items():
+                missing_types = [value_type for value_type in value_types if value_type not in data_record]
+                if missing_types:
+                    missing.append((pid, missing_types))
+                    continue
+                for request in self.iter_http_requests(plan, data_record, limit):
+                    http_requests.append((pid, request))
+            mapped_requests["http"] = http_requests
+        # Add other mappings here
+
+        return mapped_requests, missing
+
+    @timed("mapping")
+    def iter_many(self, operation_record, data_records, local_access: bool=False, limit: int=None, on_missing=None):
+        """
+        Lazily map one operation record to the HTTP requests of a stream of data records.
+
+        In contrast to map_many, the data records are consumed one at a time, so the requests of
+        the first data records are available before the following ones have been fetched.
+
+        Args:
+            operation_record (dict): The operation record.
+            data_records (iterable): The (pid, data record) pairs.
+            local_access (bool, optional): Flag indicating if local access is enabled. Defaults to False.
+            limit (int, optional): The maximum number of requests per data record. Defaults to None (no limit).
+            on_missing (callable, optional): Called with the pid and the missing value types of
+                skipped data records. Defaults to None.
+
+        Yields:
+            tuple: The pid of the data record and the mapped request.
+
+        Raises:
+            ValueError: If local access is enabled, which needs a file path per data record.
+        """
+        if local_access:
+            raise ValueError("Local access needs the file path of each data record, map them with map_to_request")
+        plan = self.resolve_operation(operation_record, local_access).get("http")
+        if plan is None:
+            return
+        value_types = self.required_value_types(plan)
+        for pid, data_record in data_records:
+            missing_types = [value_type for value_type in value_types if value_type not in data_record]
+            if missing_types:
+                if on_missing is not None:
+                    on_missing(pid, missing_types)
+                continue
+            # The requests of one data record are mapped at once, so its span ends before they are handed out
+            with tracing.span("mapper.map", pid=pid) as span:
+                record_requests = list(self.iter_http_requests(plan, data_record, limit))
+                span.set(requests=len(record_requests))
+            for request in record_requests:
+                yield pid, request
+
+    def required_value_types(self, plan):
+        """
+        Return the value types a data record has to provide for an HTTP plan.
+
+        Args:
+            plan (dict): The HTTP plan created by resolve_http_record.
+
+        Returns:
+            list: The value types without duplicates.
+        """
+        value_types = [value_type for _, value_type in (plan["params"] or []) + (plan["data"] or [])]
+        return list(dict.fromkeys(value_types))
+
+    def resolve_operation(self, operation_record, local_access, local_file_path=None):
+        """
+        Resolve the access protocols of an operation record into request plans.
+
+        Args:
+            operation_record (dict): The operation record.
+            local_access (bool): Flag indicating if local access is enabled.
+            local_file_path (str, optional): The local file path. Defaults to None.
+
+        Returns:
+            dict: The request plans, keyed by protocol.
+        """
         if local_access is True:
             access_protocol = operation_record[self.tpm_keys["localPathAccessProtocol"]][0]["value"][self.tpm_keys["operationAccessProtocol"]]
         else:
             access_protocol = operation_record[self.tpm_keys["externalRecordDependentAccessProtocol"]][0]["value"][self.tpm_keys["operationAccessProtocol"]]
         ops_location = operation_record[self.tpm_keys["digitalObjectLocation"]][0]["value"]
-        mapped_requests = {}
+        plans = {}
 
         for protocol in access_protocol:
             if self.tpm_keys["httpProtocol"] in protocol["value"]:
-                mapped_requests["http"] = self.map_http_record(protocol["value"][self.tpm_keys["httpProtocol"]][0]["value"], data_record, ops_location, local_file_path)
+                plans["http"] = self.resolve_http_record(protocol["value"][self.tpm_keys["httpProtocol"]][0]["value"], ops_location, local_file_path)
             # Add other mappings here
 
-        return mapped_requests
+        return plans
 
-    def map_http_record(self, operation_record, data_record, ops_location, local_file_path):
+    def resolve_http_record(self, operation_record, ops_location, local_file_path):
         """
-        Map an HTTP operation record to a request.
+        Resolve the data record independent parts of an HTTP operation record.
+
+        The resulting plan holds the method, URL, headers and file references, as well as
+        the (key, value type) pairs of the parameters and data properties, which are
+        filled from a data record by iter_http_requests.
 
         Args:
             operation_record (dict): The HTTP operation record.
-            data_record (str): The data record.
             ops_location (str): The operation location.
             local_file_path (str): The local file path.
 
         Returns:
-            list: The mapped requests.
-        """
-        mapped_requests = []
-        executable = "requests." + str(operation_record[self.tpm_keys["httpMethod"]][0]["value"]).lower() + "('" + str(ops_location) + "'"
-
-        if (self.tpm_keys["httpParameter"] in operation_record) and (data_record is not None):
-            payloads = []
-            payloads_temp = []
-            for i in operation_record[self.tpm_keys["httpParameter"]]:
-                for j in data_record[i["value"][self.tpm_keys["parameterValueType"]][0]["value"]]:
-                    if len(payloads) > 1:
-                        for z in payloads_temp:
-                            z[i["value"][self.tpm_keys["parameterKey"]][0]["value"]] = j["value"]
-                    else:
-                        payload = {}
-                        payload[i["value"][self.tpm_keys["parameterKey"]][0]["value"]] = j["value"]
-                        payloads_temp.append(payload)
-                payloads = payloads_temp
-            for x in payloads:
-                executable_temp = executable + ", params=" + str(x) + ")"
-                mapped_requests.append(executable_temp)
+            dict: The resolved HTTP plan.
+        """
+        plan = {
+            "method": str(operation_record[self.tpm_keys["httpMethod"]][0]["value"]).upper(),
+            "url": str(ops_location),
+            "params": None,
+            "headers": None,
+            "data": None,
+            "files": None
+        }
+
+        if self.tpm_keys["httpParameter"] in operation_record:
+            plan["params"] = [
+                (i["value"][self.tpm_keys["parameterKey"]][0]["value"], i["value"][self.tpm_keys["parameterValueType"]][0]["value"])
+                for i in operation_record[self.tpm_keys["httpParameter"]]
+            ]
 
         if self.tpm_keys["httpHeaderProperty"] in operation_record:
             headers = {}
             for i in operation_record[self.tpm_keys["httpHeaderProperty"]]:
                 headers[str(i["value"][self.tpm_keys["headerKey"]][0]["value"])] = str(i["value"][self.tpm_keys["headerValue"]][0]["value"])
-            if len(mapped_requests) > 0:
-                executable_temp = ", headers=" + str(headers) + ")"
-                mapped_requests_temp = []
-                for y in mapped_requests:
-                    mapped_requests_temp.append(y + executable_temp)
-                mapped_requests = mapped_requests_temp
-            else:
-                executable_temp = executable + ", headers=" + str(headers) + ")"
-                mapped_requests.append(executable_temp)
-
-        if (self.tpm_keys["httpDataProperty"] in operation_record) and (data_record is not None):
-            datas = []
-            datas_temp = []
-            for i in operation_record[self.tpm_keys["httpDataProperty"]]:
-                for j in data_record[i["value"][self.tpm_keys["dataValueType"]][0]["value"]]:
-                    if len(datas) >= 1:
-                        for z in datas_temp:
-                            z[i["value"][self.tpm_keys["dataKey"]][0]["value"]] = j["value"]
-                    else:
-                        data = {}
-                        data[i["value"][self.tpm_keys["dataKey"]][0]["value"]] = j["value"]
-                        datas_temp.append(data)
-                datas = datas_temp
-            if len(mapped_requests) > 0:
-                mapped_requests_temp = []
-                for x in datas:
-                    executable_temp = ", data=" + str(x) + ")"
-                    for y in mapped_requests:
-                        mapped_requests_temp.append(y + executable_temp)
-                mapped_requests = mapped_requests_temp
-            else:
-                for x in datas:
-                    executable_temp = executable + ", data=" + str(x) + ")"
-                    mapped_requests.append(executable_temp)
+            plan["headers"] = headers
+
+        if self.tpm_keys["httpDataProperty"] in operation_record:
+            plan["data"] = [
+                (i["value"][self.tpm_keys["dataKey"]][0]["value"], i["value"][self.tpm_keys["dataValueType"]][0]["value"])
+                for i in operation_record[self.tpm_keys["httpDataProperty"]]
+            ]
 
         if self.tpm_keys["httpMultipartFormDataProperty"] in operation_record:
             files = {}
-            print(local_file_path)
             for i in operation_record[self.tpm_keys["httpMultipartFormDataProperty"]]:
                 _, file_extension = os.path.splitext(local_file_path)
                 if "txt" in file_extension:
-                    files[i["value"][self.tpm_keys["fileKey"]][0]["value"]] = f'open("{local_file_path}", "r")'
+                    files[i["value"][self.tpm_keys["fileKey"]][0]["value"]] = {"path": local_file_path, "mode": "r"}
                 else:
-                    files[i["value"][self.tpm_keys["fileKey"]][0]["value"]] = f'open("{local_file_path}", "rb")'
-            if len(mapped_requests) > 0:
-                executable_temp = f", files={files}"
-                mapped_requests_temp = []
-                for y in mapped_requests:
-                    mapped_requests_temp.append(y + executable_temp)
-                mapped_requests = mapped_requests_temp
-            else:
-                executable_temp = executable + ", files=" + str(files) + ")"
-                mapped_requests.append(executable_temp)
+                    files[i["value"][self.tpm_keys["fileKey"]][0]["value"]] = {"path": local_file_path, "mode": "rb"}
+            plan["files"] = files
 
-        return mapped_requests
+        return plan
+
+    def expand_values(self, fields, data_record):
+        """
+        Lazily expand multi-valued attributes of a data record into all value combinations.
+
+        Args:
+            fields (list): The (key, value type) pairs to fill.
+            data_record (dict): The data record providing the values for each value type.
+
+        Yields:
+            dict: One mapping of keys to values per combination.
+        """
+        keys = [key for key, _ in fields]
+        values = [[item["value"] for item in data_record[value_type]] for _, value_type in fields]
+        for combination in itertools.product(*values):
+            yield dict(zip(keys, combination))
+
+    def iter_http_requests(self, plan, data_record, limit=None):
+        """
+        Lazily generate the request specifications of a resolved HTTP plan for a data record.
+
+        Every combination of the values of multi-valued parameter and data attributes results
+        in one request, so the requests are produced one at a time instead of being materialized.
+
+        Args:
+            plan (dict): The HTTP plan created by resolve_http_record.
+            data_record (dict): The data record, or None for local access.
+            limit (int, optional): The maximum number of requests to generate. Defaults to None (no limit).
+
+        Returns:
+            iterator: The request specifications.
+        """
+        use_params = plan["params"] is not None and data_record is not None
+        use_data = plan["data"] is not None and data_record is not None
+        if not (use_params or use_data or plan["headers"] is not None or plan["files"] is not None):
+            return iter(())
+
+        def generate():
+            for data in (self.expand_values(plan["data"], data_record) if use_data else [{}]):
+                for params in (self.expand_values(plan["params"], data_record) if use_params else [{}]):
+                    yield {
+                        "method": plan["method"],
+                        "url": plan["url"],
+                        "params": params,
+                        "headers": plan["headers"] or {},
+                        "data": data,
+                        "files": plan["files"] or {}
+                    }
+
+        return itertools.islice(generate(), limit)
+
+    def map_http_record(self, operation_record, data_record, ops_location, local_file_path, limit=None):
+        """
+        Map an HTTP operation record to request specifications.
+
+        A request specification is a plain dictionary with the keys ``method``,
+        ``url``, ``params``, ``headers``, ``data`` and ``files`` that can be sent
+        directly by the Ops_Executor. File references are stored as
+        ``{"path": ..., "mode": ...}`` and are only opened when the request is sent.
+
+        Args:
+            operation_record (dict): The HTTP operation record.
+            data_record (str): The data record.
+            ops_location (str): The operation location.
+            local_file_path (str): The local file path.
+            limit (int, optional): The maximum number of requests. Defaults to None (no limit).
+
+        Returns:
+            list: The mapped request specifications.
+        """
+        plan = self.resolve_http_record(operation_record, ops_location, local_file_path)
+        return list(self.iter_http_requests(plan, data_record, limit))
@@ -1,4 +1,5 @@
 import requests
+from modules.metrics import timed
 
 class SPARQLService:
     def __init__(self, endpoint_config):
@@ -10,6 +11,7 @@ class SPARQLService:
         """
         self.endpoint = endpoint_config
 
+    @timed("sparql")
     def execute_query(self, query):
         """
         Executes a SPARQL query.
@@ -117,3 +119,44 @@ class SPARQLService:
         }}
         """
         return sparql_query
+
+    def construct_dependency_query(self, operation_names):
+        """
+        Constructs a SPARQL query to retrieve the operations required to execute the given operations.
+
+        An operation requires another operation if one of its input sets contains an attribute
+        returned by the other operation. The query follows these relations transitively and
+        returns one row per operation and required operation.
+
+        Args:
+            operation_names (str): Comma-separated names of the target operations.
+
+        Returns:
+            str: The constructed SPARQL query.
+        """
+        values_clause = ' '.join(f'"{name}"' for name in operation_names.split(','))
+
+        sparql_query = f"""
+        PREFIX fdoo: <https://anonymized.org/FDO-Graph#>
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        SELECT DISTINCT ?targetName ?operationName ?operationLabel ?outputName ?requiredOperationLabel
+        WHERE {{
+            VALUES ?targetLocalName {{ {values_clause} }}
+            ?target a fdoo:Operation .
+            BIND(REPLACE(STR(?target), "https://anonymized.org/FDO-Graph#", "") AS ?targetName)
+            FILTER(?targetLocalName IN (?targetName))
+
+            # Match the target operations and all operations they depend on
+            ?target (fdoo:requires/(fdoo:containsAttribute|^fdoo:attributeContainedIn)/(^fdoo:returns|fdoo:returnedBy))* ?operation .
+            ?operation a fdoo:Operation ; rdfs:label ?operationLabel ; fdoo:returns ?output .
+            BIND(REPLACE(STR(?operation), "https://anonymized.org/FDO-Graph#", "") AS ?operationName)
+            BIND(REPLACE(STR(?output), "https://anonymized.org/FDO-Graph#", "") AS ?outputName)
+
+            # Match the operations returning an attribute of the input sets of the operation
+            OPTIONAL {{
+            ?operation fdoo:requires/(fdoo:containsAttribute|^fdoo:attributeContainedIn)/(^fdoo:returns|fdoo:returnedBy) ?requiredOperation .
+            ?requiredOperation a fdoo:Operation ; rdfs:label ?requiredOperationLabel .
+            }}
+        }}
+        """
+        return sparql_query
@@ -0,0 +1,286 @@
+"""
+A raw wire format for tuples of tensors, e.g. the (image, label) pairs of the mri_api operations.
+
+Layout:
+
+    MAGIC (8 bytes) | header length (uint32, little endian) | JSON header | padding | data
+
+The header lists the tensors as {"name", "dtype", "shape", "offset", "nbytes"}, with the dtype
+as NumPy type string (e.g. "<f4") and the offset relative to the data section, which starts at
+the first multiple of ALIGNMENT after the header. Every tensor starts at a multiple of
+ALIGNMENT, so the data can be written straight from tensor memory and read back as views of
+a buffer or a memory-mapped file, without deserializing or copying.
+
+Pickled tuples, as written by earlier versions of the operations, are recognized by their
+first byte and still loaded.
+"""
+import io
+import json
+import mmap
+import pickle
+import struct
+
+MAGIC = b"FDOTNSR1"
+MEDIA_TYPE = "application/x-fdo-tensor"
+PICKLE_MEDIA_TYPE = "application/x-python-pickle"
+ALIGNMENT = 64
+HEADER_LENGTH = struct.Struct("<I")
+# The first byte of pickles of protocol 2 or higher
+PICKLE_PROTOCOL_PREFIX = b"\x80"
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def detect(prefix):
+    """
+    Detects the format of serialized tensors from their first bytes.
+
+    Args:
+        prefix (bytes): At least the first 8 bytes.
+
+    Returns:
+        str or None: "tensor" for the raw format, "pickle" for a pickle, None otherwise.
+    """
+    if prefix.startswith(MAGIC):
+        return "tensor"
+    if prefix.startswith(PICKLE_PROTOCOL_PREFIX):
+        return "pickle"
+    return None
+
+
+def as_array(tensor):
+    """
+    Returns a C-contiguous NumPy view of a CPU tensor, array or number, copying only if needed.
+    """
+    # NumPy is imported on first use, so the operations start without loading it
+    import numpy as np
+
+    if hasattr(tensor, "detach"):
+        tensor = tensor.detach().cpu().contiguous().numpy()
+    array = np.asarray(tensor)
+    # np.ascontiguousarray would turn scalars, e.g. labels, into arrays of shape (1,)
+    return array if array.flags.c_contiguous else np.ascontiguousarray(array)
+
+
+def array_bytes(array):
+    """
+    Returns the memory of a C-contiguous array as flat memoryview of bytes.
+    """
+    import numpy as np
+
+    return array.reshape(-1).view(np.uint8).data
+
+
+def layout(specs):
+    """
+    Places tensors in the raw format.
+
+    Args:
+        specs (list): The (name, dtype, shape) of each tensor, with a NumPy dtype.
+
+    Returns:
+        tuple: The bytes up to the data section, the header entries and the total size in bytes.
+    """
+    import numpy as np
+
+    entries = []
+    offset = 0
+    for name, dtype, shape in specs:
+        dtype = np.dtype(dtype)
+        offset = align(offset)
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        entries.append({"name": name, "dtype": dtype.str, "shape": [int(size) for size in shape], "offset": offset, "nbytes": nbytes})
+        offset += nbytes
+    header = json.dumps({"version": 1, "tensors": entries}, separators=(",", ":")).encode()
+    prefix_length = len(MAGIC) + HEADER_LENGTH.size + len(header)
+    prefix = MAGIC + HEADER_LENGTH.pack(len(header)) + header + b"\0" * (align(prefix_length) - prefix_length)
+    return prefix, entries, len(prefix) + offset
+
+
+def encode(tensors, names=None):
+    """
+    Serializes tensors into the raw format.
+
+    Args:
+        tensors (sequence): The tensors or arrays.
+        names (sequence, optional): The names of the tensors. Defaults to their positions.
+
+    Returns:
+        tuple: The chunks (the header as bytes and memoryviews of the tensor memory) and their
+        total size in bytes. The tensors must not be modified until the chunks are written.
+    """
+    arrays = [as_array(tensor) for tensor in tensors]
+    names = list(names) if names is not None else [str(index) for index in range(len(arrays))]
+    prefix, entries, size = layout([(name, array.dtype, array.shape) for name, array in zip(names, arrays)])
+    chunks = [prefix]
+    position = 0
+    for entry, array in zip(entries, arrays):
+        if entry["offset"] > position:
+            chunks.append(b"\0" * (entry["offset"] - position))
+        if array.nbytes:
+            chunks.append(array_bytes(array))
+        position = entry["offset"] + array.nbytes
+    return chunks, size
+
+
+def encode_parts(specs, parts, chunk_size=1024 * 1024):
+    """
+    Serializes tensors produced in parts into the raw format, e.g. chunks along the first
+    dimension, so the complete tensors never have to be held in memory.
+
+    Args:
+        specs (list): The (name, dtype, shape) of each tensor, with a NumPy dtype.
+        parts (list): An iterable of tensors or arrays per tensor, whose concatenation along
+            the first dimension is the tensor.
+        chunk_size (int, optional): The maximum size of a yielded bytes object. Defaults to 1 MiB.
+
+    Yields:
+        bytes: The serialized tensors.
+    """
+    prefix, entries, _ = layout(specs)
+    yield prefix
+    position = 0
+    for entry, tensor_parts in zip(entries, parts):
+        if entry["offset"] > position:
+            yield b"\0" * (entry["offset"] - position)
+        written = 0
+        for part in tensor_parts:
+            array = as_array(part)
+            if array.dtype.str != entry["dtype"]:
+                raise ValueError(f"Part of {entry['name']} has dtype {array.dtype.str} instead of {entry['dtype']}")
+            if array.nbytes:
+                yield from iter_bytes([array_bytes(array)], chunk_size)
+            written += array.nbytes
+        if written != entry["nbytes"]:
+            raise ValueError(f"The parts of {entry['name']} hold {written} instead of {entry['nbytes']} bytes")
+        position = entry["offset"] + written
+
+
+def iter_bytes(chunks, chunk_size=1024 * 1024):
+    """
+    Slices encoded chunks into bytes objects of at most chunk_size bytes, e.g. for a WSGI
+    response body, which has to consist of bytes. Only one slice is copied at a time.
+
+    Args:
+        chunks (list): The chunks returned by encode.
+        chunk_size (int, optional): The maximum size of a slice in bytes. Defaults to 1 MiB.
+
+    Yields:
+        bytes: The slices.
+    """
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            yield chunk
+            continue
+        for start in range(0, len(chunk), chunk_size):
+            yield bytes(chunk[start:start + chunk_size])
+
+
+def dumps(tensors, names=None):
+    """
+    Serializes tensors into the raw format as one bytes object.
+    """
+    chunks, _ = encode(tensors, names)
+    return b"".join(chunks)
+
+
+def decode(buffer, as_torch=True):
+    """
+    Reads tensors in the raw format as views of a buffer.
+
+    Args:
+        buffer (bytes-like): The serialized tensors. The tensors share its memory, so they are
+            only writable if the buffer is, e.g. a bytearray or a copy-on-write memory map.
+        as_torch (bool, optional): Return torch tensors instead of NumPy arrays. Defaults to True.
+
+    Returns:
+        tuple: The tensors.
+    """
+    import numpy as np
+
+    view = memoryview(buffer)
+    if bytes(view[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not in the raw tensor format")
+    header_start = len(MAGIC) + HEADER_LENGTH.size
+    (header_length,) = HEADER_LENGTH.unpack_from(view, len(MAGIC))
+    header = json.loads(bytes(view[header_start:header_start + header_length]))
+    data_start = align(header_start + header_length)
+    arrays = []
+    for entry in header["tensors"]:
+        dtype = np.dtype(entry["dtype"])
+        count = entry["nbytes"] // dtype.itemsize
+        array = np.frombuffer(view, dtype=dtype, count=count, offset=data_start + entry["offset"]).reshape(entry["shape"])
+        arrays.append(array)
+    if as_torch:
+        import torch
+        if not view.readonly:
+            return tuple(torch.from_numpy(array) for array in arrays)
+        # torch requires writable memory to share it
+        return tuple(torch.from_numpy(array.copy()) for array in arrays)
+    return tuple(arrays)
+
+
+def read_buffer(stream):
+    """
+    Returns the content of a file object from its current position as buffer, without copying
+    it if possible.
+
+    In-memory streams expose their buffer and files are memory-mapped copy-on-write, so the
+    decoded tensors are writable while the pages are only read when they are accessed.
+    """
+    start = stream.tell()
+    getbuffer = getattr(stream, "getbuffer", None)
+    if getbuffer is not None:
+        return getbuffer()[start:]
+    try:
+        return memoryview(mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_COPY))[start:]
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        stream.seek(start)
+        return bytearray(stream.read())
+
+
+def load_stream(stream, as_torch=True):
+    """
+    Loads tensors from a seekable file object in the raw format or as pickle.
+
+    Pickles can execute code when loaded, only load them from trusted sources.
+
+    Args:
+        stream (file object): The serialized tensors, opened in binary mode.
+        as_torch (bool, optional): Return torch tensors instead of NumPy arrays. Only applies
+            to the raw format. Defaults to True.
+
+    Returns:
+        tuple: The tensors.
+    """
+    start = stream.tell()
+    prefix = stream.read(len(MAGIC))
+    stream.seek(start)
+    if detect(prefix) == "tensor":
+        return decode(read_buffer(stream), as_torch)
+    return pickle.load(stream)
+
+
+def load(path, use_mmap=True, as_torch=True):
+    """
+    Loads tensors from a file in the raw format or as pickle.
+
+    Args:
+        path (str): The path of the file.
+        use_mmap (bool, optional): Memory-map raw files instead of reading them, so only the
+            accessed parts are read from disk. Defaults to True.
+        as_torch (bool, optional): Return torch tensors instead of NumPy arrays. Defaults to True.
+
+    Returns:
+        tuple: The tensors.
+    """
+    with open(path, "rb") as file:
+        if detect(file.read(len(MAGIC))) != "tensor":
+            file.seek(0)
+            return pickle.load(file)
+        file.seek(0)
+        # The mapping stays valid after the file is closed
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY) if use_mmap else bytearray(file.read())
+    return decode(buffer, as_torch)
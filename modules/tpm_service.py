@@ -1,7 +1,9 @@
 import requests
-import paramiko
 import json
 import os
+import threading
+from modules.metrics import timed
+from modules import tracing
 
 
 class TPMService:
@@ -19,29 +21,63 @@ class TPMService:
                 - local_records_dir (str): Path to the local records directory.
                 - ssh_key (str): Path to the SSH private key file.
                 - password (str): Password for the SSH private key.
-                - address (str): Address of the TPM service.
+                - address (str): Address of the TPM service, empty if the PID endpoint is reachable without SSH.
                 - username (str): Username for the SSH connection.
                 - pid_enpoint (str): Endpoint for retrieving records by PID.
         """
+        self.config = config
         self.local_records = config["local_records"]
+        self.ssh_client = None
+        self.connection_lock = threading.Lock()
         if self.local_records:
             filename = config["local_records_dir"]
             wd = os.getcwd()
             combined_path = os.path.join(wd, filename)
             self.local_records_dir = os.path.abspath(combined_path)
         else:
-            ssh_key = paramiko.RSAKey.from_private_key_file(config["ssh_key"], password=config["password"])
-            self.ssh_client = paramiko.SSHClient()
-            self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.ssh_client.connect(config["address"], username=config["username"], pkey=ssh_key)
+            # The SSH connection is opened on the first remote request, see connect
             self.pid_enpoint = config["pid_enpoint"]
-            self.ssh_client.invoke_shell()
+
+    def connect(self):
+        """
+        Opens the SSH connection to the TPM service if an address is configured and it is not open yet.
+
+        Returns:
+            paramiko.SSHClient or None: The connected SSH client, None without an address.
+        """
+        if not self.config.get("address"):
+            return None
+        with self.connection_lock:
+            if self.ssh_client is None:
+                self.ssh_client = self.open_ssh_client()
+        return self.ssh_client
+
+    @tracing.traced("tpm.connect")
+    def open_ssh_client(self):
+        """
+        Opens an SSH connection with the configured key and address.
+
+        Returns:
+            paramiko.SSHClient: The connected SSH client.
+        """
+        # paramiko is only needed in remote mode and slow to import
+        import paramiko
+
+        ssh_key = paramiko.RSAKey.from_private_key_file(self.config["ssh_key"], password=self.config["password"])
+        ssh_client = paramiko.SSHClient()
+        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh_client.connect(self.config["address"], username=self.config["username"], pkey=ssh_key)
+        ssh_client.invoke_shell()
+        return ssh_client
 
     def close_connection(self):
         """
-        Closes the SSH connection.
+        Closes the SSH connection if it was opened.
         """
-        self.ssh_client.close()
+        with self.connection_lock:
+            if self.ssh_client is not None:
+                self.ssh_client.close()
+                self.ssh_client = None
 
     def is_dict_string(self, s):
         """
@@ -80,6 +116,8 @@ class TPMService:
                     self.convert_string_to_dict(data[i])
         return data
 
+    @timed("tpm_fetch")
+    @tracing.traced("tpm.get_record")
     def get_record(self, pid):
         """
         Retrieves a record by PID.
@@ -90,7 +128,9 @@ class TPMService:
         Returns:
             dict or None: The record as a dictionary if found, None otherwise.
         """
+        tracing.annotate(pid=pid)
         if self.local_records is False:
+            self.connect()
             url = self.pid_enpoint + pid
             headers = {
                 "accept": "application/json"
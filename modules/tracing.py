@@ -0,0 +1,191 @@
+import contextlib
+import contextvars
+import functools
+import itertools
+import os
+import threading
+import time
+
+# The tracer of the current job and the innermost open span, None if tracing is off
+current_tracer = contextvars.ContextVar("fdo_tracer", default=None)
+current_span = contextvars.ContextVar("fdo_span", default=None)
+
+
+class Span:
+    """
+    A timed section of a traced run with its attributes, e.g. the PID, the operation or the URL host.
+    """
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.id = next(tracer.ids)
+        self.parent = None
+        self.start = None
+        self.token = None
+
+    def set(self, **attributes):
+        """
+        Adds attributes known only once the span is running, e.g. the number of received bytes.
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = current_span.get()
+        self.parent = parent.id if parent is not None else None
+        self.token = current_span.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter_ns()
+        current_span.reset(self.token)
+        if exc is not None:
+            self.attributes["error"] = repr(exc)
+        self.tracer.record(self, end)
+        return False
+
+
+class NoopSpan:
+    """
+    Stands in for a span while tracing is off, so instrumented code costs a context variable lookup.
+    """
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    """
+    Collects the spans of one traced run, e.g. a job, across all threads it uses.
+    """
+
+    def __init__(self, name="trace"):
+        """
+        Initializes the Tracer object.
+
+        Args:
+            name (str, optional): The name of the traced process in the timeline. Defaults to "trace".
+        """
+        self.name = name
+        self.events = []
+        self.threads = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter_ns()
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Traces the spans opened in the current context until the block is left.
+        """
+        token = current_tracer.set(self)
+        try:
+            yield self
+        finally:
+            current_tracer.reset(token)
+
+    def record(self, span, end):
+        thread = threading.current_thread()
+        event = {
+            "name": span.name,
+            "cat": span.name.split(".", 1)[0],
+            "ph": "X",
+            "ts": (span.start - self.origin) / 1000,
+            "dur": (end - span.start) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": dict(span.attributes, span_id=span.id, parent_id=span.parent)
+        }
+        with self.lock:
+            self.events.append(event)
+            self.threads.setdefault(thread.ident, thread.name)
+
+    def to_chrome_trace(self):
+        """
+        Exports the recorded spans as timeline.
+
+        Returns:
+            dict: The spans in the Chrome trace event format, as loaded by chrome://tracing or Perfetto.
+        """
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+            threads = dict(self.threads)
+        metadata = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0, "args": {"name": self.name}}]
+        metadata.extend({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                        for tid, name in threads.items())
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+
+def span(name, **attributes):
+    """
+    Opens a span in the trace of the current context.
+
+    Args:
+        name (str): The name of the span, prefixed by its category, e.g. "executor.download".
+        **attributes: The attributes of the span.
+
+    Returns:
+        Span or NoopSpan: The context manager of the span, a no-op if tracing is off.
+    """
+    tracer = current_tracer.get()
+    if tracer is None:
+        return NOOP_SPAN
+    return Span(tracer, name, attributes)
+
+
+def annotate(**attributes):
+    """
+    Adds attributes to the innermost open span of the current context, if tracing is on.
+    """
+    open_span = current_span.get()
+    if open_span is not None:
+        open_span.set(**attributes)
+
+
+def traced(name):
+    """
+    Decorates a function to run each call in a span.
+
+    Args:
+        name (str): The name of the span.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = current_tracer.get()
+            if tracer is None:
+                return function(*args, **kwargs)
+            with Span(tracer, name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def bind(function):
+    """
+    Binds a function to a copy of the current context, so its spans are recorded in the current
+    trace when it runs in a worker thread.
+
+    Args:
+        function (callable): The function submitted to a thread pool.
+
+    Returns:
+        callable: The function running in the copied context.
+    """
+    return functools.partial(contextvars.copy_context().run, function)
@@ -0,0 +1,227 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from modules.pipeline import Pipeline
+from modules.metrics import timed
+from modules import tracing
+
+
+class WorkflowRunner(Pipeline):
+    """
+    Runs chains of operations, where the output of an operation is the input of the operations requiring it.
+
+    The operations form a DAG derived from the fdoo:returns and fdoo:requires relations of the
+    FDO graph. Intermediate outputs are passed to the following operations as SpooledContent,
+    held in memory up to spool_size bytes, instead of being written to the result folders and
+    uploaded again from there. Each output is handed on as soon as it is available, so the
+    independent branches of the DAG and the steps of different FDOs run concurrently.
+    """
+
+    def __init__(self, tpm_service, validator, mapper, executor, spool_size=64 * 1024 * 1024):
+        """
+        Initializes the WorkflowRunner object.
+
+        Args:
+            tpm_service (TPMService): The service providing the PID records.
+            validator (KernelWorkflow): The validator of the PID records.
+            mapper (RecordMapper): The mapper of records to requests.
+            executor (Ops_Executor): The executor of the mapped requests.
+            spool_size (int, optional): The number of bytes of an intermediate output kept in
+                memory before it is moved to a temporary file. Defaults to 64 MiB.
+        """
+        super().__init__(tpm_service, validator, mapper, executor)
+        self.spool_size = spool_size
+
+    @staticmethod
+    def build_dag(query_results):
+        """
+        Builds the DAG of operations from the results of SPARQLService.construct_dependency_query.
+
+        Input sets list alternative attributes, so an operation may require several operations of
+        the same chain, e.g. both the DICOM conversion and the normalization for a resize. Such
+        requirements are reduced to the operation furthest down the chain, so every operation
+        consumes the most processed output.
+
+        Args:
+            query_results (dict): The SPARQL query results.
+
+        Returns:
+            dict: Maps operation PIDs to their name, output type, the PIDs of the required
+            operations and whether the operation is a target of the workflow.
+
+        Raises:
+            ValueError: If the operations depend on each other cyclically.
+        """
+        dag = {}
+        for binding in query_results["results"]["bindings"]:
+            pid = binding["operationLabel"]["value"]
+            node = dag.setdefault(pid, {
+                "name": binding["operationName"]["value"],
+                "output": binding["outputName"]["value"],
+                "requires": set(),
+                "target": False
+            })
+            if "requiredOperationLabel" in binding and binding["requiredOperationLabel"]["value"] != pid:
+                node["requires"].add(binding["requiredOperationLabel"]["value"])
+            if binding["targetName"]["value"] == node["name"]:
+                node["target"] = True
+
+        ancestors = {}
+
+        def get_ancestors(pid, visiting):
+            if pid not in ancestors:
+                if pid in visiting:
+                    raise ValueError(f"Cyclic dependency between the operations {', '.join(visiting)}")
+                visiting = visiting + [pid]
+                found = set()
+                for required in dag[pid]["requires"]:
+                    if required in dag:
+                        found |= {required} | get_ancestors(required, visiting)
+                ancestors[pid] = found
+            return ancestors[pid]
+
+        for pid in dag:
+            get_ancestors(pid, [])
+        for node in dag.values():
+            requires = [required for required in node["requires"] if required in dag]
+            node["requires"] = sorted(required for required in requires
+                                      if not any(required in ancestors[other] for other in requires))
+        return dag
+
+    @timed("pipeline")
+    def run_workflow(self, dag, fdos, refresh=False, on_event=None):
+        """
+        Executes a DAG of operations on FDOs.
+
+        The operations without requirements are executed on the FDOs, all other operations on
+        the outputs of the operations they require. Only the outputs of the target operations and
+        of the last operations of each chain are stored in their output type folders.
+
+        Args:
+            dag (dict): The DAG created by build_dag.
+            fdos (list): The PIDs of the FDOs.
+            refresh (bool, optional): Execute the stored operations even if cached results exist. Defaults to False.
+            on_event (callable, optional): Called with each progress event. Defaults to None.
+
+        Returns:
+            dict: The summary with the result folders of the stored operations and the number of
+            successful, failed and skipped items.
+        """
+        summary = {"folders": {}, "succeeded": 0, "failed": 0, "skipped": 0}
+        report = self.reporter(summary, on_event)
+        children = {pid: [child for child, node in dag.items() if pid in node["requires"]] for pid in dag}
+        stored = {pid for pid, node in dag.items() if node["target"] or not children[pid]}
+
+        records = {}
+        for pid in dag:
+            record = self.tpm_service.get_record(pid)
+            if not self.validator.validate(record, checksum=False):
+                # Handle invalid digital object
+                report({"type": "item", "operation": pid, "item": pid, "status": "invalid", "error": "Invalid operation record"})
+                continue
+            records[pid] = record
+            if pid in stored:
+                summary["folders"][pid] = dag[pid]["output"]
+
+        paths = {}
+
+        def count_paths(pid):
+            # Every FDO reaches an operation once per chain leading to it
+            if pid not in paths:
+                paths[pid] = sum(count_paths(required) for required in dag[pid]["requires"]) if dag[pid]["requires"] else 1
+            return paths[pid]
+
+        for pid in records:
+            report({"type": "operation", "operation": pid, "output_type": dag[pid]["output"], "inputs": len(fdos) * count_paths(pid)})
+
+        def get_root_tasks():
+            for pid in records:
+                if not dag[pid]["requires"]:
+                    for job in self.get_profile_jobs(pid, records[pid], fdos, dag[pid]["output"], report):
+                        yield pid, job, None
+
+        root_tasks = get_root_tasks()
+        pending = deque()
+        in_flight = {}
+        references = {}
+        window = self.executor.max_workers * 2
+
+        def submit(pool, pid, job):
+            file_name, request_spec, folder_name, _ = job
+            if pid in stored:
+                return pool.submit(tracing.bind(self.executor.execute), file_name, request_spec, folder_name, pid, refresh=refresh)
+            return pool.submit(tracing.bind(self.executor.fetch), file_name, request_spec, self.spool_size)
+
+        def release(content):
+            if content is not None:
+                references[content] -= 1
+                if references[content] == 0:
+                    del references[content]
+                    content.close()
+
+        with ThreadPoolExecutor(max_workers=self.executor.max_workers) as pool:
+            while True:
+                # Chained steps go first, so intermediate outputs are released early
+                while len(in_flight) < window:
+                    task = pending.popleft() if pending else next(root_tasks, None)
+                    if task is None:
+                        break
+                    in_flight[submit(pool, task[0], task[1])] = task
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pid, job, source = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = self.executor.failed_result(job[0], job[1], job[2], e)
+                    report(self.item_event(pid, result))
+                    release(source)
+                    if result["status"] != 'Request successful':
+                        continue
+                    tasks = []
+                    for child in children[pid]:
+                        if child in records:
+                            tasks.extend((child, chained_job, result.get("content")) for chained_job in
+                                         self.get_chained_jobs(child, records[child], result, dag[child]["output"], report))
+                    if result.get("content") is not None:
+                        references[result["content"]] = len(tasks)
+                        if not tasks:
+                            del references[result["content"]]
+                            result["content"].close()
+                    pending.extend(tasks)
+        return summary
+
+    def get_chained_jobs(self, op, op_record, result, outputType, report):
+        """
+        Maps the output of a previous operation to executor jobs of an operation.
+
+        Outputs held in memory are uploaded from there, stored outputs from their path.
+
+        Args:
+            op (str): The PID of the operation.
+            op_record (dict): The operation record.
+            result (dict): The result of the previous operation.
+            outputType (str): The output type, used as folder for the results.
+            report (callable): Receives the events of skipped outputs.
+
+        Returns:
+            list: The (file name, request, folder name, operation PID) tuples.
+        """
+        content = result.get("content")
+        file_path = content.name if content is not None else result["path"]
+        filename, _ = os.path.splitext(os.path.basename(file_path))
+        try:
+            mapped_requests = list(self.mapper.map_to_request(op_record["entries"], None, True, file_path, lazy=True).get("http", []))
+        except (KeyError, IndexError) as e:
+            report({"type": "item", "operation": op, "item": filename, "status": "invalid",
+                    "error": f"Operation does not accept local inputs: {e}"})
+            return []
+        jobs = []
+        for req in mapped_requests:
+            if content is not None:
+                req["files"] = {key: {"name": content.name, "content": content} for key in req["files"]}
+            jobs.append((filename, req, outputType, op))
+        return jobs
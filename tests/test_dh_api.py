@@ -1,8 +1,27 @@
+import io
+import logging
+import os
+import subprocess
+import sys
+import threading
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
+from tempfile import TemporaryDirectory
+from werkzeug.datastructures import FileStorage
 from flask import Flask
+from example_operations import dh_api
 from example_operations.dh_api import get_total_term_count, download_rdf_content, convert_to_skos_rdfxml, skos_rdf_validate, search_skohub
 
+
+def crash_skos_job(file_name):
+    os._exit(1)
+
+
+def read_skos_job(file_name):
+    with open(file_name) as file:
+        return file.read()
+
+
 class TestApp(unittest.TestCase):
 
     def setUp(self):
@@ -32,14 +51,130 @@ class TestApp(unittest.TestCase):
         with patch('skosify.skosify') as mock_skosify:
             mock_skosify.return_value.serialize.return_value = None
             result = skos_rdf_validate("rdfxml_file.rdf")
+            self.assertEqual(result, "")
+            mock_skosify.side_effect = SystemExit(1)
+            result = skos_rdf_validate("rdfxml_file.rdf")
             self.assertIsNone(result)
 
+    def test_skos_verify_accepts_clean_vocabulary(self):
+        client = dh_api.app.test_client()
+        with patch.object(dh_api, 'SKOS_WORKERS', 0), patch.object(dh_api, '_skos_memo', dh_api.OrderedDict()), \
+                patch('skosify.skosify'):
+            response = client.post('/skos_verify', data={'vocabulary_id': (io.BytesIO(b"<rdf:RDF/>"), 'vocabulary.rdf')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["warnings"], "")
+
     def test_search_skohub(self):
         with patch('requests.get') as mock_get:
             mock_get.return_value.json.return_value = {"prefLabel": "English"}
             result = search_skohub("http://example.com")
             self.assertEqual(result, "English")
 
+    def test_stream_rdf_content_caches_and_revalidates(self):
+        def mock_get(url, headers=None, **kwargs):
+            response = MagicMock()
+            if headers.get('If-None-Match') == '"v1"':
+                response.status_code = 304
+            else:
+                response.status_code = 200
+                response.headers = {'ETag': '"v1"'}
+                response.iter_content.return_value = iter([b"RDF ", b"", b"Content"])
+            return response
+
+        with TemporaryDirectory() as temp_dir, patch.object(dh_api, '_vocabulary_cache', dh_api.VocabularyCache(temp_dir)), \
+                patch('requests.get', side_effect=mock_get) as mock_requests:
+            chunks, mime_type = dh_api.stream_rdf_content("http://example.com/", "vocabulary_id")
+            self.assertEqual((list(chunks), mime_type), ([b"RDF ", b"Content"], "application/rdf+xml"))
+
+            chunks, mime_type = dh_api.stream_rdf_content("http://example.com/", "vocabulary_id")
+            self.assertEqual(b"".join(chunks), b"RDF Content")
+            chunks.close()
+            self.assertEqual(mock_requests.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+            self.assertEqual(download_rdf_content("http://example.com/", "vocabulary_id"), (b"RDF Content", "application/rdf+xml"))
+
+    def test_capture_logs_per_thread(self):
+        outputs = {}
+        barrier = threading.Barrier(2)
+
+        def job(name):
+            with dh_api.capture_logs() as logs:
+                barrier.wait()
+                logging.warning("finding of %s", name)
+                barrier.wait()
+            outputs[name] = logs.getvalue()
+
+        threads = [threading.Thread(target=job, args=(name,)) for name in ("a", "b")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(outputs, {"a": "finding of a\n", "b": "finding of b\n"})
+
+    def test_import_leaves_root_logger_unchanged(self):
+        # A fresh interpreter, as the test runner configures the root logger itself
+        output = subprocess.run([sys.executable, "-c", "import logging; from example_operations import dh_api; "
+                                 "print(logging.getLogger().level, logging.getLogger().handlers)"],
+                                check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), f"{logging.WARNING} []")
+
+    def test_skosify_results_are_memoized_by_content(self):
+        client = dh_api.app.test_client()
+        with patch.object(dh_api, 'SKOS_WORKERS', 0), patch.object(dh_api, '_skos_memo', dh_api.OrderedDict()), \
+                patch('skosify.skosify') as mock_skosify:
+            mock_skosify.return_value.serialize.return_value = "RDF/XML Content"
+            for content in (b"<a> <b> <c> .", b"<a> <b> <c> .", b"<a> <b> <d> ."):
+                response = client.post('/convert_turtle_to_rdfxml', data={'vocabulary_id': (io.BytesIO(content), 'vocabulary.ttl')})
+                self.assertEqual(response.data, b"RDF/XML Content")
+        self.assertEqual(mock_skosify.call_count, 2)
+
+    def test_skos_pool_recovers_from_crashed_worker(self):
+        with patch.object(dh_api, 'SKOS_WORKERS', 1), patch.object(dh_api, '_skos_pool', None), \
+                patch.object(dh_api, '_skos_memo', dh_api.OrderedDict()):
+            with self.assertRaises(dh_api.BrokenProcessPool):
+                dh_api.run_skos_job(crash_skos_job, FileStorage(io.BytesIO(b"<a> <b> <c> .")), '.ttl')
+            self.assertIsNone(dh_api._skos_pool)
+            result = dh_api.run_skos_job(read_skos_job, FileStorage(io.BytesIO(b"<a> <b> <c> .")), '.ttl')
+            self.assertEqual(result, "<a> <b> <c> .")
+            dh_api._skos_pool.shutdown()
+
+    def test_count_concepts_in_small_chunks(self):
+        turtle = """@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+@prefix ex: <http://example.com/> .
+# A comment with skos:Concept
+ex:a a skos:Concept ; skos:prefLabel "A \\"a\\""@en, '''A
+a'''@de .
+ex:b a skos:ConceptScheme ; skos:hasTopConcept ex:a .
+<http://example.com/c> skos:narrower [ a skos:Concept ] ; a skos:Concept .
+ex:a a skos:Concept ; skos:notation "1"^^ex:type .
+""".encode()
+        rdfxml = b"""<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:skos="http://www.w3.org/2004/02/skos/core#">
+  <skos:Concept rdf:about="http://example.com/a"><skos:prefLabel xml:lang="en">A</skos:prefLabel></skos:Concept>
+  <rdf:Description rdf:about="http://example.com/b">
+    <rdf:type rdf:resource="http://www.w3.org/2004/02/skos/core#Concept"/>
+    <skos:prefLabel xml:lang="fr">B</skos:prefLabel>
+    <skos:narrower><skos:Concept rdf:about="http://example.com/a"/></skos:narrower>
+  </rdf:Description>
+</rdf:RDF>"""
+        for content, expected in ((turtle, {"concepts": 3, "languages": ["de", "en"]}),
+                                  (rdfxml, {"concepts": 2, "languages": ["en", "fr"]})):
+            for size in (1, 5, len(content)):
+                chunks = (content[start:start + size] for start in range(0, len(content), size))
+                self.assertEqual(dh_api.count_concepts(chunks), expected)
+
+    def test_total_term_count_of_cached_vocabulary(self):
+        content = b"<http://example.com/a> a <http://www.w3.org/2004/02/skos/core#Concept> ."
+        client = dh_api.app.test_client()
+        with TemporaryDirectory() as temp_dir, patch.object(dh_api, '_vocabulary_cache', dh_api.VocabularyCache(temp_dir)), \
+                patch('requests.get') as mock_requests:
+            cache = dh_api.vocabulary_cache()
+            cache.put(cache.key("http://example.com", "vocabulary_id", "turtle"), content, {})
+            response = client.post('/total_term_count', data={'base_url': "http://example.com", 'vocabulary_id': "vocabulary_id"})
+        self.assertEqual(response.data, b"The total 'count' value from 'http://example.com' is: 1 terms")
+        self.assertEqual(response.headers['Languages'], "")
+        mock_requests.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
 
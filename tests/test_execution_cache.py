@@ -0,0 +1,54 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from modules.execution_cache import ExecutionCache
+
+
+class TestExecutionCache(unittest.TestCase):
+
+    def test_make_key_uses_content_hash_of_local_files(self):
+        with TemporaryDirectory() as temp_dir:
+            cache = ExecutionCache(os.path.join(temp_dir, "cache"))
+            first_path = os.path.join(temp_dir, "a.pkl")
+            second_path = os.path.join(temp_dir, "b.pkl")
+            for path in (first_path, second_path):
+                with open(path, 'wb') as file:
+                    file.write(b'tensor')
+            first_spec = {"method": "POST", "url": "http://op", "files": {"tensor": {"path": first_path, "mode": "rb"}}}
+            second_spec = {"method": "POST", "url": "http://op", "files": {"tensor": {"path": second_path, "mode": "rb"}}}
+            first_key = cache.make_key("op", "a", first_spec)[0]
+            self.assertEqual(first_key, cache.make_key("op", "b", second_spec)[0])
+            self.assertNotEqual(first_key, cache.make_key("other_op", "a", first_spec)[0])
+
+    def test_identical_outputs_are_stored_once(self):
+        with TemporaryDirectory() as temp_dir:
+            cache = ExecutionCache(os.path.join(temp_dir, "cache"))
+            folder = os.path.join(temp_dir, "results")
+            os.makedirs(folder)
+            for name in ("first.json", "second.json"):
+                with open(os.path.join(folder, name), 'wb') as file:
+                    file.write(b'{}')
+            digest = ExecutionCache.file_digest(os.path.join(folder, "first.json"))
+            cache.put("key1", "op", "fdo1", "spec", os.path.join(folder, "first.json"), digest, 2)
+            cache.put("key2", "op", "fdo2", "spec", os.path.join(folder, "second.json"), digest, 2)
+            self.assertEqual(os.listdir(os.path.join(cache.objects_dir, digest[:2])), [digest])
+
+            hit = cache.get("key2", os.path.join(temp_dir, "elsewhere"))
+            self.assertEqual(hit["path"], os.path.join(temp_dir, "elsewhere", "second.json"))
+            self.assertIsNone(cache.get("unknown", folder))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_make_key_uses_content_hash_of_content_references(self):
+        with TemporaryDirectory() as temp_dir:
+            cache = ExecutionCache(os.path.join(temp_dir, "cache"))
+            path = os.path.join(temp_dir, "a.pkl")
+            with open(path, 'wb') as file:
+                file.write(b'tensor')
+            file_spec = {"method": "POST", "url": "http://op", "files": {"tensor": {"path": path, "mode": "rb"}}}
+            content_spec = {"method": "POST", "url": "http://op", "files": {"tensor": {"name": "a.pkl", "content": b'tensor'}}}
+            self.assertEqual(cache.make_key("op", "a", file_spec)[1], cache.make_key("op", "a", content_spec)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+from tempfile import TemporaryDirectory
+
+import fdo_batch
+from fdo_batch import StageTimer, build_selection, workflow_fdos
+
+
+class TestFdoBatch(unittest.TestCase):
+
+    def test_build_selection_profiles_merges_fdos(self):
+        structured_data = {
+            "Profile_A": {"FDO_Ops_count": {"21.11152/op": {"vocabulary_count": {"label": ["fdo1", "fdo2"]}}}},
+            "Profile_B": {"FDO_Ops_count": {"21.11152/op": {"vocabulary_count": {"label": ["fdo2", "fdo3"]}}},
+                          "FDO_Ops_other": {"21.11152/other": {"domain": {"label": ["fdo1"]}}}}
+        }
+        selection = build_selection("profiles", structured_data, operations=["FDO_Ops_count"])
+        self.assertEqual(selection, {"21.11152/op": ("vocabulary_count", ["fdo1", "fdo2", "fdo3"])})
+
+    def test_build_selection_attributes_uses_local_folders(self):
+        structured_data = {
+            "labelled_image_tensor": {"FDO_Ops_resize": {"21.11152/resize": {"labelled_image_tensor_size_256": ["label"]}}},
+            "missing_attribute": {"FDO_Ops_resize": {"21.11152/resize": {"labelled_image_tensor_size_256": ["label"]}}}
+        }
+        with TemporaryDirectory() as temp_dir:
+            os.mkdir(os.path.join(temp_dir, "labelled_image_tensor"))
+            selection = build_selection("attributes", structured_data, temp_dir)
+            self.assertEqual(selection, {"21.11152/resize": ("labelled_image_tensor_size_256", [os.path.join(temp_dir, "labelled_image_tensor")])})
+
+    def test_workflow_fdos_selects_fdos_of_first_operations(self):
+        dag = {"21.11152/dicom": {"requires": []}, "21.11152/resize": {"requires": ["21.11152/dicom"]}}
+        structured_data = {
+            "Profile_A": {"FDO_Ops_dicom": {"21.11152/dicom": {"tensor": {"label": ["fdo1", "fdo2"]}}},
+                          "FDO_Ops_resize": {"21.11152/resize": {"resized": {"label": ["fdo3"]}}}},
+            "Profile_B": {"FDO_Ops_dicom": {"21.11152/dicom": {"tensor": {"label": ["fdo2", "fdo4"]}}}}
+        }
+        self.assertEqual(workflow_fdos(dag, structured_data), ["fdo1", "fdo2", "fdo4"])
+
+    def test_main_runs_workflow(self):
+        dependency_results = {"results": {"bindings": [
+            {"targetName": {"value": "resize"}, "operationName": {"value": "dicom"},
+             "operationLabel": {"value": "op/dicom"}, "outputName": {"value": "tensor"}},
+            {"targetName": {"value": "resize"}, "operationName": {"value": "resize"},
+             "operationLabel": {"value": "op/resize"}, "outputName": {"value": "resized"},
+             "requiredOperationLabel": {"value": "op/dicom"}}
+        ]}}
+        with patch.object(fdo_batch, 'SPARQLService') as sparql_service, patch.object(fdo_batch, 'TPMService'), \
+                patch.object(fdo_batch.WorkflowRunner, 'run_workflow') as run_workflow:
+            sparql_service.return_value.execute_query.return_value = dependency_results
+            run_workflow.return_value = {"folders": {"op/resize": "resized"}, "succeeded": 2, "failed": 0, "skipped": 0}
+            self.assertEqual(fdo_batch.main(["workflow", "resize", "--fdos", "fdo1,fdo2", "--no-cache", "--no-manifest", "--json"]), 0)
+
+        sparql_service.return_value.construct_dependency_query.assert_called_once_with("resize")
+        dag, fdos = run_workflow.call_args[0]
+        self.assertEqual(dag["op/resize"]["requires"], ["op/dicom"])
+        self.assertEqual(fdos, ["fdo1", "fdo2"])
+
+    def test_stage_timer_excludes_nested_stages(self):
+        class Service:
+            def fetch(self):
+                time.sleep(0.05)
+                return 1
+
+            def produce(self, service):
+                for _ in range(2):
+                    yield service.fetch()
+
+        service = Service()
+        timer = StageTimer(["fetch", "map"])
+        timer.wrap("fetch", service, "fetch")
+        timer.wrap_generator("map", service, "produce")
+
+        self.assertEqual(list(service.produce(service)), [1, 1])
+        self.assertEqual(len(timer.stages["fetch"].latencies), 2)
+        self.assertGreaterEqual(sum(timer.stages["fetch"].latencies), 0.1)
+        self.assertLess(sum(timer.stages["map"].latencies), 0.02)
+        self.assertEqual(timer.stages["fetch"].summary(1.0)["calls"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from modules.ingest_manifest import IngestManifest, scan_directory
+
+
+def write(path, content):
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+class TestIngestManifest(unittest.TestCase):
+
+    def test_scan_directory_lists_visible_files(self):
+        with TemporaryDirectory() as temp_dir:
+            write(os.path.join(temp_dir, "b.pkl"), b'bb')
+            write(os.path.join(temp_dir, "a.pkl"), b'a')
+            write(os.path.join(temp_dir, ".a.pkl.part"), b'')
+            os.makedirs(os.path.join(temp_dir, "nested"))
+
+            files = scan_directory(temp_dir)
+
+        self.assertEqual([(file.name, file.size) for file in files], [("a.pkl", 1), ("b.pkl", 2)])
+        self.assertEqual(files[0].path, os.path.join(temp_dir, "a.pkl"))
+
+    def test_changed_selects_new_and_modified_files(self):
+        with TemporaryDirectory() as temp_dir:
+            inputs = os.path.join(temp_dir, "inputs")
+            os.makedirs(inputs)
+            for name in ("a.pkl", "b.pkl", "c.pkl"):
+                write(os.path.join(inputs, name), name.encode())
+            manifest = IngestManifest(os.path.join(temp_dir, "manifest", "manifest.sqlite"), workers=2)
+
+            selected, unchanged = manifest.changed("op", scan_directory(inputs))
+            self.assertEqual(([file.name for file in selected], unchanged), (["a.pkl", "b.pkl", "c.pkl"], 0))
+            self.assertTrue(all(file.sha256 for file in selected))
+            manifest.record("op", *selected)
+
+            # a.pkl is touched without changing its content, b.pkl is modified
+            stat = os.stat(os.path.join(inputs, "a.pkl"))
+            os.utime(os.path.join(inputs, "a.pkl"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            write(os.path.join(inputs, "b.pkl"), b'modified')
+            selected, unchanged = manifest.changed("op", scan_directory(inputs))
+            self.assertEqual(([file.name for file in selected], unchanged), (["b.pkl"], 2))
+            self.assertEqual(manifest.changed("op", scan_directory(inputs))[1], 2)
+
+            # The manifest is kept per operation and bypassed on refresh
+            self.assertEqual(len(manifest.changed("other_op", scan_directory(inputs))[0]), 3)
+            self.assertEqual(len(manifest.changed("op", scan_directory(inputs), refresh=True)[0]), 3)
+
+            manifest.forget("op", scan_directory(inputs)[0])
+            selected, unchanged = manifest.changed("op", scan_directory(inputs))
+            self.assertEqual(([file.name for file in selected], unchanged), (["a.pkl", "b.pkl"], 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import time
+import unittest
+
+from modules.job_queue import JobQueue
+from modules.tracing import span
+
+
+class FakeRedis:
+    """
+    Implements the subset of the Redis client used by the JobQueue in memory.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        values = self.data.setdefault(name, {})
+        if key is not None:
+            values[key] = str(value)
+        for key, value in (mapping or {}).items():
+            values[key] = str(value)
+
+    def set(self, name, value, ex=None):
+        self.data[name] = str(value)
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def hget(self, name, key):
+        return self.data.get(name, {}).get(key)
+
+    def hgetall(self, name):
+        return dict(self.data.get(name, {}))
+
+    def hincrby(self, name, key, amount=1):
+        values = self.data.setdefault(name, {})
+        values[key] = str(int(values.get(key, 0)) + amount)
+
+    def rpush(self, name, *values):
+        self.data.setdefault(name, []).extend(values)
+
+    def blpop(self, name, timeout=0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.data.get(name):
+                return name, self.data[name].pop(0)
+            time.sleep(0.01)
+        return None
+
+    def lrange(self, name, start, end):
+        values = self.data.get(name, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def expire(self, name, seconds):
+        pass
+
+    def delete(self, *names):
+        for name in names:
+            self.data.pop(name, None)
+
+    def sadd(self, name, *values):
+        self.data.setdefault(name, set()).update(values)
+
+    def srem(self, name, *values):
+        members = self.data.get(name, set())
+        removed = len(members & set(values))
+        members.difference_update(values)
+        return removed
+
+    def smembers(self, name):
+        return set(self.data.get(name, set()))
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_client = FakeRedis()
+
+    def test_process_records_progress_and_result(self):
+        def handler(payload, on_event):
+            on_event({"type": "operation", "operation": "op", "inputs": 2})
+            on_event({"type": "item", "operation": "op", "item": "fdo1", "status": "success"})
+            on_event({"type": "item", "operation": "op", "item": "fdo2", "status": "failed"})
+            return {"answer": payload["value"]}
+
+        queue = JobQueue(self.redis_client, handler, workers=0)
+        job_id = queue.enqueue({"value": 42})
+        self.assertEqual(queue.get_status(job_id)["status"], "queued")
+
+        queue.process(job_id)
+        status = queue.get_status(job_id)
+        self.assertEqual(status["status"], "done")
+        self.assertEqual((status["total"], status["processed"], status["succeeded"], status["failed"]), (2, 2, 1, 1))
+        self.assertEqual(status["result"], {"answer": 42})
+        self.assertEqual([event["type"] for event in queue.get_events(job_id, 1)], ["item", "item", "end"])
+
+    def test_failing_handler_marks_job_failed(self):
+        def handler(payload, on_event):
+            raise RuntimeError("TPM unreachable")
+
+        queue = JobQueue(self.redis_client, handler, workers=0)
+        job_id = queue.enqueue({})
+        queue.process(job_id)
+        status = queue.get_status(job_id)
+        self.assertEqual(status["status"], "failed")
+        self.assertEqual(status["error"], "TPM unreachable")
+
+    def test_workers_process_enqueued_jobs(self):
+        queue = JobQueue(self.redis_client, lambda payload, on_event: payload, workers=2)
+        job_id = queue.enqueue({"value": 1})
+        deadline = time.time() + 5
+        while queue.get_status(job_id)["status"] != "done" and time.time() < deadline:
+            time.sleep(0.01)
+        queue.stop()
+        self.assertEqual(queue.get_status(job_id)["result"], {"value": 1})
+
+    def test_traced_job_stores_spans(self):
+        def handler(payload, on_event):
+            with span("tpm.get_record", pid="fdo1"):
+                pass
+            return None
+
+        queue = JobQueue(self.redis_client, handler, workers=0)
+        traced_id = queue.enqueue({"trace": True})
+        untraced_id = queue.enqueue({})
+        queue.process(traced_id)
+        queue.process(untraced_id)
+
+        self.assertTrue(queue.get_status(traced_id)["traced"])
+        spans = {event["name"]: event for event in queue.get_trace(traced_id)["traceEvents"] if event["ph"] == "X"}
+        self.assertEqual(spans["tpm.get_record"]["args"]["pid"], "fdo1")
+        self.assertEqual(spans["tpm.get_record"]["args"]["parent_id"], spans["job"]["args"]["span_id"])
+        self.assertFalse(queue.get_status(untraced_id)["traced"])
+        self.assertIsNone(queue.get_trace(untraced_id))
+
+    def test_workers_take_up_jobs_queued_before_restart(self):
+        JobQueue(self.redis_client, None, workers=0).enqueue({"value": 1})
+        job_id = self.redis_client.data["fdo_jobs:queue"][0]
+        queue = JobQueue(self.redis_client, lambda payload, on_event: payload, workers=1)
+        queue.start()
+        deadline = time.time() + 5
+        while queue.get_status(job_id)["status"] != "done" and time.time() < deadline:
+            time.sleep(0.01)
+        queue.stop()
+        self.assertEqual(queue.get_status(job_id)["result"], {"value": 1})
+
+    def test_recover_requeues_jobs_with_stale_heartbeat(self):
+        queue = JobQueue(self.redis_client, None, workers=0, heartbeat_timeout=60)
+        stale_id = queue.enqueue({})
+        alive_id = queue.enqueue({})
+        self.redis_client.data["fdo_jobs:queue"].clear()
+        # Both jobs were taken by a worker, the worker of the stale job died
+        for job_id, heartbeat in ((stale_id, time.time() - 120), (alive_id, time.time())):
+            self.redis_client.hset(queue.job_key(job_id), mapping={"status": "running", "heartbeat": heartbeat, "processed": 3})
+            self.redis_client.sadd(queue.running_key(), job_id)
+            self.redis_client.rpush(queue.events_key(job_id), '{"type": "operation", "operation": "op", "inputs": 3}')
+
+        self.assertEqual(queue.recover(), [stale_id])
+        self.assertEqual(self.redis_client.data["fdo_jobs:queue"], [stale_id])
+        self.assertEqual((queue.get_status(stale_id)["status"], queue.get_status(stale_id)["processed"]), ("queued", 0))
+        self.assertEqual(queue.get_events(stale_id), [])
+        self.assertEqual(queue.get_status(alive_id)["status"], "running")
+        # A second check, e.g. by another process, does not queue the job twice
+        self.assertEqual(queue.recover(), [])
+
+    def test_unknown_job(self):
+        queue = JobQueue(self.redis_client, lambda payload, on_event: None, workers=0)
+        self.assertIsNone(queue.get_status("unknown"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from modules.metrics import Registry, STAGE_DURATION, STAGE_ERRORS, timed
+
+
+def histogram_count(histogram, **labels):
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    return samples.get((histogram.name + "_count", tuple(labels.items())), 0)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render_prometheus_text(self):
+        registry = Registry()
+        counter = registry.counter("test_bytes_total", "Transferred bytes.", ("direction",))
+        histogram = registry.histogram("test_duration_seconds", "Durations.", ("stage",), buckets=(0.1, 1.0))
+        registry.gauge_function("test_ratio", "A ratio.", lambda: 0.5)
+        counter.inc(10, direction="received")
+        counter.inc(5, direction="received")
+        histogram.observe(0.05, stage="fetch")
+        histogram.observe(2.0, stage="fetch")
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_bytes_total counter", lines)
+        self.assertIn('test_bytes_total{direction="received"} 15', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="fetch",le="0.1"} 1', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="fetch",le="1.0"} 1', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="fetch",le="+Inf"} 2', lines)
+        self.assertIn('test_duration_seconds_sum{stage="fetch"} 2.05', lines)
+        self.assertIn('test_duration_seconds_count{stage="fetch"} 2', lines)
+        self.assertIn("test_ratio 0.5", lines)
+
+    def test_timed_records_calls_and_errors(self):
+        @timed("test")
+        def fail():
+            raise ValueError("broken")
+
+        labels = {"stage": "test", "method": fail.__qualname__}
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertEqual(histogram_count(STAGE_DURATION, **labels), 1)
+        self.assertEqual(STAGE_ERRORS.value(**labels), 1)
+
+    def test_timed_generator_is_recorded_once_exhausted(self):
+        @timed("test")
+        def produce():
+            yield 1
+            yield 2
+
+        labels = {"stage": "test", "method": produce.__qualname__}
+        items = produce()
+        self.assertEqual(next(items), 1)
+        self.assertEqual(histogram_count(STAGE_DURATION, **labels), 0)
+        self.assertEqual(list(items), [2])
+        self.assertEqual(histogram_count(STAGE_DURATION, **labels), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,8 +4,14 @@ import pydicom
 import torch
 import io
 import pickle
+import json
+import os
+from unittest import mock
+from tempfile import TemporaryDirectory
 from torchvision import transforms
 from torchvision.transforms import functional as F
+from example_operations import mri_api
+from modules import tensor_format
 
 class TestMRIAPI(unittest.TestCase):
 
@@ -133,6 +139,183 @@ class TestMRIAPI(unittest.TestCase):
         self.assertIsInstance(result[0], torch.Tensor)
         self.assertIsInstance(result[1], torch.Tensor)
 
+    def test_augment_images_matches_rotate(self):
+        image_tensor = torch.randint(0, 1000, (2, 1, 9, 12), dtype=torch.int16)
+        label_tensor = torch.tensor(3)
+
+        images, labels = mri_api.augment_images(label_tensor, image_tensor, angle_count=5, chunk_size=2)
+
+        self.assertEqual(images.shape, torch.Size([5, 2, 1, 9, 12]))
+        self.assertEqual(images.dtype, torch.int16)
+        expected = torch.stack([F.rotate(image_tensor, angle.item()) for angle in torch.linspace(0, 360, 5)])
+        self.assertTrue(torch.equal(images, expected))
+        self.assertTrue(torch.equal(labels, torch.full((5,), 3)))
+
+    def test_labeled_tensor_augment_streams_chunks(self):
+        client = mri_api.app.test_client()
+        upload = tensor_format.dumps((torch.rand(1, 1, 8, 8), torch.tensor(1)))
+
+        stacked = client.post('/labeled_tensor_augment', data={'tensor': (io.BytesIO(upload), 'tensor_data.tensor'), 'angles': '6',
+                                                                'format': 'tensor'})
+        streamed = client.post('/labeled_tensor_augment', data={'tensor': (io.BytesIO(upload), 'tensor_data.tensor'), 'angles': '6',
+                                                                 'format': 'tensor', 'stream': '1', 'chunk': '4'})
+        self.assertEqual(streamed.data, stacked.data)
+        images, labels = tensor_format.load_stream(io.BytesIO(streamed.data))
+        self.assertEqual(images.shape, torch.Size([6, 1, 1, 8, 8]))
+
+        half = client.post('/labeled_tensor_augment', data={'tensor': (io.BytesIO(upload), 'tensor_data.tensor'), 'dtype': 'float16'})
+        self.assertEqual(tensor_format.load_stream(io.BytesIO(half.data))[0].dtype, torch.float16)
+        invalid = client.post('/labeled_tensor_augment', data={'tensor': (io.BytesIO(upload), 'tensor_data.tensor'), 'angles': '0'})
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_tensor_response_format(self):
+        client = mri_api.app.test_client()
+        upload = tensor_format.dumps((torch.ones(1, 4, 4), torch.tensor(1)))
+
+        response = client.post('/labeled_tensor_resize', data={'tensor': (io.BytesIO(upload), 'tensor_data.tensor')},
+                               headers={'Accept': tensor_format.MEDIA_TYPE})
+        self.assertEqual(response.mimetype, tensor_format.MEDIA_TYPE)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="tensor_data.tensor"')
+        image_tensor, label_tensor = tensor_format.load_stream(io.BytesIO(response.data))
+        self.assertEqual(image_tensor.shape, torch.Size([1, 256, 256]))
+
+        # Older clients upload and request pickles
+        upload = pickle.dumps((torch.ones(1, 4, 4), torch.tensor(1)))
+        response = client.post('/labeled_tensor_resize', data={'tensor': (io.BytesIO(upload), 'tensor_data.pkl'), 'format': 'pickle'})
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="tensor_data.pkl"')
+        image_tensor, label_tensor = pickle.loads(response.data)
+        self.assertEqual(label_tensor, torch.tensor(1))
+
+        # Clients that do not negotiate the format get pickles
+        response = client.post('/labeled_tensor_resize', data={'tensor': (io.BytesIO(upload), 'tensor_data.pkl')})
+        self.assertEqual(pickle.loads(response.data)[1], torch.tensor(1))
+
+    def test_dicom_to_labelled_tensor_batch(self):
+        client = mri_api.app.test_client()
+
+        def fetch_dicom(uri):
+            if 'missing' in uri:
+                raise mri_api.DicomSourceError('URI does not point to a DICOM file based on Content-Type')
+            return uri.encode()
+
+        def decode_dicom(content):
+            return torch.full((2, 3), len(content), dtype=torch.int16).numpy()
+
+        uris = ['https://zenodo.org/a.dcm', 'https://zenodo.org/missing.dcm', 'https://zenodo.org/bb.dcm']
+        with mock.patch.object(mri_api, 'fetch_dicom', fetch_dicom), mock.patch.object(mri_api, 'decode_dicom', decode_dicom), \
+                mock.patch.object(mri_api, 'DECODE_WORKERS', 0):
+            response = client.post('/dicom_to_labelled_tensor_batch', json={'uri': uris, 'contrast': ['T1-weighted', 'T1-weighted', 'PD-weighted']})
+            form_response = client.post('/dicom_to_labelled_tensor_batch', data={'uri': uris, 'contrast': 'T2-weighted'})
+            invalid = client.post('/dicom_to_labelled_tensor_batch', data={'uri': uris, 'contrast': ['T1-weighted', 'T2-weighted']})
+
+        self.assertEqual(response.status_code, 200)
+        images, labels = tensor_format.load_stream(io.BytesIO(response.data))
+        self.assertEqual(images.shape, torch.Size([2, 1, 2, 3]))
+        self.assertEqual(images[:, 0, 0, 0].tolist(), [len(uris[0]), len(uris[2])])
+        self.assertEqual(labels.tolist(), [1, 3])
+        self.assertEqual([item['index'] for item in json.loads(response.headers['Failed-Items'])], [1])
+        self.assertEqual(tensor_format.load_stream(io.BytesIO(form_response.data))[1].tolist(), [2, 2])
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_fetch_dicom_caches_downloads(self):
+        class FakeResponse:
+            def __init__(self, status_code, content=b''):
+                self.status_code = status_code
+                self.content = content
+                self.headers = {'Content-Type': 'application/dicom', 'ETag': '"v1"'}
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def raise_for_status(self):
+                pass
+
+        class FakeSession:
+            def __init__(self):
+                self.requests = []
+
+            def get(self, uri, headers=None, **kwargs):
+                self.requests.append((uri, headers or {}))
+                if (headers or {}).get('If-None-Match') == '"v1"':
+                    return FakeResponse(304)
+                return FakeResponse(200, uri.encode() * 10)
+
+        session = FakeSession()
+        first, second = 'https://zenodo.org/first.dcm', 'https://zenodo.org/second.dcm'
+        with TemporaryDirectory() as temp_dir:
+            cache = mri_api.DicomCache(temp_dir, max_bytes=400, max_age=3600)
+            with mock.patch.object(mri_api, 'download_session', lambda: session), mock.patch.object(mri_api, 'dicom_cache', lambda: cache):
+                self.assertEqual(mri_api.fetch_dicom(first), first.encode() * 10)
+                self.assertEqual(mri_api.fetch_dicom(first), first.encode() * 10)
+                self.assertEqual(len(session.requests), 1)
+
+                # Stale entries are revalidated with their ETag
+                cache.max_age = 0
+                self.assertEqual(mri_api.fetch_dicom(first), first.encode() * 10)
+                self.assertEqual(session.requests[-1][1], {'If-None-Match': '"v1"'})
+
+                # The second file exceeds the size limit, the least recently used first file is evicted
+                mri_api.fetch_dicom(second)
+                self.assertIsNone(cache.lookup(first))
+                self.assertIsNotNone(cache.lookup(second))
+
+                stats = mri_api.app.test_client().get('/dicom_cache_stats').get_json()
+        self.assertEqual((stats['hits'], stats['revalidated'], stats['misses']), (1, 1, 2))
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual((stats['entries'], stats['bytes']), (1, len(second) * 10))
+
+    def test_labeled_tensor_preprocess_matches_endpoints(self):
+        client = mri_api.app.test_client()
+
+        def post(path, tensors, **fields):
+            upload = tensor_format.dumps(tensors)
+            response = client.post(path, data=dict(fields, tensor=(io.BytesIO(upload), 'tensor_data.tensor')))
+            self.assertEqual(response.status_code, 200)
+            return tensor_format.load_stream(io.BytesIO(response.data))
+
+        pair = (torch.randint(0, 255, (1, 40, 30), dtype=torch.uint8), torch.tensor(2))
+        expected = post('/labeled_tensor_resize', pair)
+        expected = post('/labeled_tensor_normalize', expected)
+        expected = post('/labeled_tensor_augment', expected, angles='5')
+
+        fused = post('/labeled_tensor_preprocess', pair, steps='resize,normalize,augment', angles='5')
+        streamed = post('/labeled_tensor_preprocess', pair, steps='resize,normalize,augment', angles='5', stream='1', chunk='2')
+        for result in (fused, streamed):
+            self.assertTrue(torch.equal(result[0], expected[0]))
+            self.assertTrue(torch.equal(result[1], expected[1]))
+
+        self.assertEqual(post('/labeled_tensor_preprocess', pair, steps='resize', size='16x8')[0].shape, torch.Size([1, 16, 8]))
+        upload = tensor_format.dumps(pair)
+        invalid = client.post('/labeled_tensor_preprocess', data={'tensor': (io.BytesIO(upload), 'tensor_data.tensor'), 'steps': 'resize,crop'})
+        self.assertEqual(invalid.status_code, 400)
+
+    def test_transforms_run_in_worker_processes(self):
+        client = mri_api.app.test_client()
+        pair = (torch.randint(0, 255, (1, 40, 30), dtype=torch.uint8), torch.tensor(2))
+
+        def post(path, **fields):
+            upload = tensor_format.dumps(pair)
+            response = client.post(path, data=dict(fields, tensor=(io.BytesIO(upload), 'tensor_data.tensor')))
+            self.assertEqual(response.status_code, 200)
+            return tensor_format.load_stream(io.BytesIO(response.data))
+
+        expected = [post('/labeled_tensor_resize'), post('/labeled_tensor_preprocess', steps='resize,normalize,augment', angles='3')]
+        with TemporaryDirectory() as temp_dir, mock.patch.object(mri_api, 'TRANSFORM_WORKERS', 1), \
+                mock.patch.object(mri_api, 'SHARED_MEMORY_DIR', temp_dir):
+            try:
+                pooled = [post('/labeled_tensor_resize'), post('/labeled_tensor_preprocess', steps='resize,normalize,augment', angles='3')]
+                self.assertIsNotNone(mri_api._transform_pool)
+                self.assertEqual(os.listdir(temp_dir), [])
+            finally:
+                if mri_api._transform_pool is not None:
+                    mri_api.reset_transform_pool(mri_api._transform_pool)
+        for result, expected_result in zip(pooled, expected):
+            self.assertTrue(torch.equal(result[0], expected_result[0]))
+            self.assertTrue(torch.equal(result[1], expected_result[1]))
+
 if __name__ == '__main__':
     unittest.main()
 
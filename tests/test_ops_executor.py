@@ -1,10 +1,16 @@
 import os
+import json
+import hashlib
+import threading
+import time
 import requests
 import unittest
 from unittest.mock import patch
 from tempfile import TemporaryDirectory
 
 from modules.ops_executor import Ops_Executor
+from modules.execution_cache import ExecutionCache
+from modules.metrics import STAGE_DURATION
 
 
 class TestOpsExecutor(unittest.TestCase):
@@ -14,10 +20,10 @@ class TestOpsExecutor(unittest.TestCase):
     def test_execute_http_request_success(self):
         with TemporaryDirectory() as temp_dir:
             file_name = "test_file"
-            request_string = 'requests.get("https://example.com")'
+            request_spec = {"method": "GET", "url": "https://example.com"}
             folder_name = temp_dir
 
-            status, folder = self.executor.execute_http_request(file_name, request_string, folder_name)
+            status, folder = self.executor.execute_http_request(file_name, request_spec, folder_name)
 
             self.assertEqual(status, "Request successful")
             self.assertEqual(folder, folder_name)
@@ -28,10 +34,10 @@ class TestOpsExecutor(unittest.TestCase):
     def test_execute_http_request_failure(self):
         with TemporaryDirectory() as temp_dir:
             file_name = "test_file"
-            request_string = 'requests.get("https://nonexistent-url.com")'
+            request_spec = {"method": "GET", "url": "https://nonexistent-url.com"}
             folder_name = temp_dir
 
-            status, folder = self.executor.execute_http_request(file_name, request_string, folder_name)
+            status, folder = self.executor.execute_http_request(file_name, request_spec, folder_name)
 
             self.assertEqual(status, "Request failed")
             self.assertEqual(folder, folder_name)
@@ -39,17 +45,17 @@ class TestOpsExecutor(unittest.TestCase):
     def test_execute_http_request_with_content_disposition(self):
         with TemporaryDirectory() as temp_dir:
             file_name = "test_file"
-            request_string = 'requests.get("https://example.com")'
+            request_spec = {"method": "GET", "url": "https://example.com"}
             folder_name = temp_dir
 
             # Mock the response headers
             headers = {'Content-Disposition': 'attachment; filename="example.txt"'}
-            with patch('requests.get') as mock_get:
+            with patch.object(self.executor.session, 'request') as mock_get:
                 mock_get.return_value.status_code = 200
                 mock_get.return_value.headers = headers
-                mock_get.return_value.content = b'Test content'
+                mock_get.return_value.iter_content.return_value = [b'Test content']
 
-                status, folder = self.executor.execute_http_request(file_name, request_string, folder_name)
+                status, folder = self.executor.execute_http_request(file_name, request_spec, folder_name)
 
                 self.assertEqual(status, "Request successful")
                 self.assertEqual(folder, folder_name)
@@ -60,17 +66,17 @@ class TestOpsExecutor(unittest.TestCase):
     def test_execute_http_request_with_content_type(self):
         with TemporaryDirectory() as temp_dir:
             file_name = "test_file"
-            request_string = 'requests.get("https://example.com")'
+            request_spec = {"method": "GET", "url": "https://example.com"}
             folder_name = temp_dir
 
             # Mock the response headers
             headers = {'Content-Type': 'application/json'}
-            with patch('requests.get') as mock_get:
+            with patch.object(self.executor.session, 'request') as mock_get:
                 mock_get.return_value.status_code = 200
                 mock_get.return_value.headers = headers
-                mock_get.return_value.content = b'Test content'
+                mock_get.return_value.iter_content.return_value = [b'Test content']
 
-                status, folder = self.executor.execute_http_request(file_name, request_string, folder_name)
+                status, folder = self.executor.execute_http_request(file_name, request_spec, folder_name)
 
                 self.assertEqual(status, "Request successful")
                 self.assertEqual(folder, folder_name)
@@ -78,6 +84,176 @@ class TestOpsExecutor(unittest.TestCase):
                 # Check if the file was created with the correct extension
                 self.assertTrue(os.path.exists(os.path.join(folder_name, file_name + ".json")))
 
+    def test_execute_streams_response_to_file_and_logs_metadata(self):
+        with TemporaryDirectory() as temp_dir:
+            cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                request_spec = {"method": "GET", "url": "https://example.com"}
+                with patch.object(self.executor.session, 'request') as mock_request:
+                    mock_request.return_value.status_code = 200
+                    mock_request.return_value.headers = {'Content-Type': 'application/octet-stream'}
+                    mock_request.return_value.iter_content.return_value = [b'abc', b'', b'def']
+                    result = self.executor.execute("test_file", request_spec, "results")
+                    self.assertTrue(mock_request.call_args[1]["stream"])
+
+                self.assertEqual(result["path"], os.path.join("results", "test_file.bin"))
+                self.assertEqual(result["size"], 6)
+                self.assertEqual(result["sha256"], hashlib.sha256(b'abcdef').hexdigest())
+                with open(result["path"], 'rb') as stored_file:
+                    self.assertEqual(stored_file.read(), b'abcdef')
+                self.assertEqual(os.listdir("results"), ["test_file.bin"])
+                with open('log.txt') as log_file:
+                    entry = json.loads(log_file.read())
+                self.assertEqual(entry["size"], 6)
+                self.assertEqual(entry["sha256"], result["sha256"])
+                self.assertNotIn("Response", entry)
+            finally:
+                os.chdir(cwd)
+
+    def test_execute_is_timed_once_per_request(self):
+        def stage_count(stage):
+            return sum(value for name, labels, value in STAGE_DURATION.samples()
+                       if name.endswith("_count") and ("stage", stage) in labels)
+
+        executions, downloads = stage_count("execution"), stage_count("download")
+        with TemporaryDirectory() as temp_dir:
+            cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                with patch.object(self.executor.session, 'request') as mock_request:
+                    mock_request.return_value.status_code = 200
+                    mock_request.return_value.headers = {'Content-Type': 'application/octet-stream'}
+                    mock_request.return_value.iter_content.return_value = [b'abc']
+                    self.executor.execute("test_file", {"method": "GET", "url": "https://example.com"}, "results")
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(stage_count("execution") - executions, 1)
+        self.assertEqual(stage_count("download") - downloads, 1)
+
+    def test_execute_returns_cached_result_without_request(self):
+        with TemporaryDirectory() as temp_dir:
+            cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                executor = Ops_Executor(cache=ExecutionCache("cache"))
+                request_spec = {"method": "POST", "url": "https://example.com/op", "data": {"uri": "https://zenodo.org/1"}}
+                with patch.object(executor.session, 'request') as mock_request:
+                    mock_request.return_value.status_code = 200
+                    mock_request.return_value.headers = {'Content-Type': 'application/json'}
+                    mock_request.return_value.iter_content.return_value = [b'{}']
+                    first = executor.execute("21.11152/fdo", request_spec, "results", operation_pid="21.11152/op")
+                    os.remove(first["path"])
+                    second = executor.execute("21.11152/fdo", request_spec, "results", operation_pid="21.11152/op")
+                    self.assertEqual(mock_request.call_count, 1)
+                    executor.execute("21.11152/fdo", request_spec, "results", operation_pid="21.11152/op", refresh=True)
+                    self.assertEqual(mock_request.call_count, 2)
+
+                self.assertFalse(first["cached"])
+                self.assertTrue(second["cached"])
+                self.assertEqual(second["path"], first["path"])
+                self.assertEqual(second["sha256"], first["sha256"])
+                with open(second["path"], 'rb') as stored_file:
+                    self.assertEqual(stored_file.read(), b'{}')
+            finally:
+                os.chdir(cwd)
+
+    def test_send_request_opens_file_references(self):
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "input.bin")
+            with open(file_path, 'wb') as input_file:
+                input_file.write(b'payload')
+            request_spec = {"method": "POST", "url": "https://example.com", "data": {"key": "it's"},
+                            "files": {"tensor": {"path": file_path, "mode": "rb"}}}
+            with patch.object(self.executor.session, 'request') as mock_request:
+                self.executor.send_request(request_spec)
+                args, kwargs = mock_request.call_args
+                self.assertEqual(args, ("POST", "https://example.com"))
+                self.assertEqual(kwargs["data"], {"key": "it's"})
+                self.assertTrue(kwargs["files"]["tensor"].closed)
+
+    def test_requests_accept_raw_tensor_format(self):
+        # Operations returning tensors answer in the raw format instead of the pickle default
+        prepared = self.executor.session.prepare_request(requests.Request("POST", "https://example.com", headers={"X-Key": "value"}))
+        self.assertTrue(prepared.headers["Accept"].startswith("application/x-fdo-tensor"))
+        self.assertEqual(prepared.headers["X-Key"], "value")
+
+    def test_fetch_keeps_content_for_chained_requests(self):
+        with TemporaryDirectory() as temp_dir:
+            cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                with patch.object(self.executor.session, 'request') as mock_request:
+                    mock_request.return_value.status_code = 200
+                    mock_request.return_value.headers = {'Content-Type': 'application/octet-stream'}
+                    mock_request.return_value.iter_content.return_value = [b'ten', b'sor']
+                    result = self.executor.fetch("21.11152/abc", {"method": "GET", "url": "https://example.com"})
+
+                    content = result["content"]
+                    self.assertEqual(content.name, "21.11152_abc.bin")
+                    self.assertEqual(content.read(), b'tensor')
+                    self.assertEqual(result["sha256"], hashlib.sha256(b'tensor').hexdigest())
+                    self.executor.send_request({"method": "POST", "url": "https://example.com/op",
+                                                "files": {"tensor": {"name": content.name, "content": content}}})
+                    self.assertEqual(mock_request.call_args[1]["files"], {"tensor": ("21.11152_abc.bin", content)})
+                self.assertEqual(os.listdir("."), ["log.txt"])
+            finally:
+                os.chdir(cwd)
+
+    def test_execute_batch_keeps_order_and_collects_failures(self):
+        executor = Ops_Executor(max_workers=4, per_host_limit=2)
+        jobs = [("file_%d" % i, {"method": "GET", "url": "http://host%d.example.com" % (i % 2)}, "folder") for i in range(10)]
+
+        def execute(file_name, request_spec, folder_name, refresh=False):
+            if file_name == "file_3":
+                raise requests.ConnectionError("connection refused")
+            return {"file_name": file_name, "url": request_spec["url"], "status_code": 200, "folder": folder_name,
+                    "path": None, "error": None, "status": "Request successful"}
+
+        with patch.object(executor, 'execute', side_effect=execute):
+            results, failures = executor.execute_batch(jobs)
+
+        self.assertEqual([result["file_name"] for result in results], ["file_%d" % i for i in range(10)])
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0]["file_name"], "file_3")
+        self.assertEqual(failures[0]["error"], "connection refused")
+
+    def test_iter_batch_respects_per_host_limit(self):
+        executor = Ops_Executor(max_workers=8, per_host_limit=2)
+        lock = threading.Lock()
+        running = {"current": 0, "peak": 0}
+
+        def download(file_name, request_spec, folder_name):
+            with lock:
+                running["current"] += 1
+                running["peak"] = max(running["peak"], running["current"])
+            time.sleep(0.01)
+            with lock:
+                running["current"] -= 1
+            return {"status": "Request successful"}
+
+        jobs = [("file_%d" % i, {"method": "GET", "url": "http://example.com/op"}, "folder") for i in range(12)]
+        with patch.object(executor, 'download', side_effect=download):
+            list(executor.iter_batch(jobs, ordered=False))
+        self.assertLessEqual(running["peak"], 2)
+
+    def test_iter_batch_unordered_yields_before_jobs_are_exhausted(self):
+        executor = Ops_Executor(max_workers=2)
+        produced = []
+
+        def jobs():
+            for i in range(50):
+                produced.append(i)
+                time.sleep(0.005)
+                yield ("file_%d" % i, {"method": "GET", "url": "http://example.com/op"}, "folder")
+
+        with patch.object(executor, 'execute', return_value={"status": "Request successful"}):
+            results = executor.iter_batch(jobs(), ordered=False)
+            next(results)
+            self.assertLess(len(produced), 50)
+            self.assertEqual(len(list(results)), 49)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
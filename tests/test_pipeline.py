@@ -0,0 +1,136 @@
+import os
+import unittest
+from unittest.mock import MagicMock
+from tempfile import TemporaryDirectory
+
+from modules.ingest_manifest import IngestManifest
+from modules.pipeline import Pipeline
+
+
+def make_result(file_name, status='Request successful'):
+    return {"file_name": file_name, "url": "http://example.com/op", "status_code": 200, "path": None, "size": 0,
+            "duration": 0.1, "cached": False, "error": None, "status": status}
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tpm_service = MagicMock()
+        self.tpm_service.get_record.side_effect = lambda pid: {"pid": pid, "entries": {"pid": pid}}
+        self.validator = MagicMock()
+        self.mapper = MagicMock()
+        self.executor = MagicMock()
+        self.executor.iter_batch.side_effect = lambda jobs, ordered, refresh: (
+            (index, job, make_result(job[0], 'Request failed' if job[0] == "fdo2" else 'Request successful'))
+            for index, job in enumerate(jobs)
+        )
+        self.pipeline = Pipeline(self.tpm_service, self.validator, self.mapper, self.executor)
+
+    def test_run_profiles(self):
+        self.validator.validate.side_effect = lambda record, checksum=True: record["pid"] != "fdo3"
+
+        def iter_many(record, data_records, on_missing):
+            for pid, entries in data_records:
+                if pid == "fdo4":
+                    on_missing(pid, ["type"])
+                else:
+                    yield pid, {}
+
+        self.mapper.iter_many.side_effect = iter_many
+        events = []
+
+        summary = self.pipeline.run("profiles", {"op": ["Output", ["fdo1", "fdo2", "fdo3", "fdo4"]]}, on_event=events.append)
+
+        self.assertEqual(summary, {"outputType": "Output", "folder_name": "Output", "succeeded": 1, "failed": 1, "skipped": 2})
+        self.assertEqual(events[0], {"type": "operation", "operation": "op", "output_type": "Output", "inputs": 4})
+        # Results are reported while the remaining FDOs are still being fetched
+        self.assertEqual([(event["item"], event["status"]) for event in events[1:]],
+                         [("fdo1", "success"), ("fdo2", "failed"), ("fdo3", "invalid"), ("fdo4", "missing")])
+
+    def test_run_profiles_counts_expanded_requests(self):
+        self.validator.validate.return_value = True
+        # Two values of a multi-valued attribute map fdo1 to two requests
+        self.mapper.iter_many.side_effect = lambda record, data_records, on_missing: iter(
+            [("fdo1", {}), ("fdo1", {}), ("fdo2", {})])
+        events = []
+
+        self.pipeline.run("profiles", {"op": ["Output", ["fdo1", "fdo2"]]}, on_event=events.append)
+
+        total = sum(event["inputs"] for event in events if event["type"] in ("operation", "expanded"))
+        self.assertEqual(total, 3)
+        self.assertEqual(len([event for event in events if event["type"] == "item"]), total)
+
+    def test_run_attributes(self):
+        self.validator.validate.return_value = True
+        self.mapper.map_to_request.side_effect = lambda record, data, local, path, lazy: {"http": iter([{"path": path}])}
+        with TemporaryDirectory() as temp_dir:
+            for name in ("a.pkl", "b.pkl"):
+                open(os.path.join(temp_dir, name), 'wb').close()
+            summary = self.pipeline.run("attributes", {"op": ("Output", [temp_dir])}, refresh=True)
+
+        self.assertEqual(summary["succeeded"], 2)
+        self.assertTrue(self.executor.iter_batch.call_args[1]["refresh"])
+
+    def test_run_attributes_processes_only_new_files(self):
+        self.validator.validate.return_value = True
+        self.mapper.map_to_request.side_effect = lambda record, data, local, path, lazy: {
+            "http": iter([{"files": {"tensor": {"path": path, "mode": "rb"}}}])}
+        executed = []
+        self.executor.iter_batch.side_effect = lambda jobs, ordered, refresh: (
+            (index, job, make_result(job[0], 'Request failed' if job[0] == "b" else 'Request successful'))
+            for index, job in enumerate(jobs) if not executed.append(job)
+        )
+        with TemporaryDirectory() as temp_dir:
+            input_dir = os.path.join(temp_dir, "inputs")
+            os.makedirs(input_dir)
+            for name in ("a.pkl", "b.pkl"):
+                with open(os.path.join(input_dir, name), 'wb') as file:
+                    file.write(name.encode())
+            self.pipeline.manifest = IngestManifest(os.path.join(temp_dir, "manifest.sqlite"))
+            self.pipeline.run("attributes", {"op": ("Output", [input_dir])})
+            # The content hash of the manifest is passed on to the execution cache
+            self.assertEqual(len(executed[0][1]["files"]["tensor"]["sha256"]), 64)
+
+            with open(os.path.join(input_dir, "c.pkl"), 'wb') as file:
+                file.write(b'c')
+            events = []
+            summary = self.pipeline.run("attributes", {"op": ("Output", [input_dir])}, on_event=events.append)
+
+        # a.pkl was processed, the failed b.pkl and the new c.pkl are processed again
+        self.assertEqual(events[0]["unchanged"], 1)
+        self.assertEqual(sorted(event["item"] for event in events[1:]), ["b", "c"])
+        self.assertEqual((summary["succeeded"], summary["failed"]), (1, 1))
+
+    def test_run_attributes_tracks_files_by_path(self):
+        self.validator.validate.return_value = True
+        # a.dcm and a.pkl share the item name, notes.txt produces no request
+        self.mapper.map_to_request.side_effect = lambda record, data, local, path, lazy: {
+            "http": iter([] if path.endswith(".txt") else [{"path": path}])}
+        self.executor.iter_batch.side_effect = lambda jobs, ordered, refresh: (
+            (index, job, make_result(job[0], 'Request failed' if job[1]["path"].endswith(".dcm") else 'Request successful'))
+            for index, job in enumerate(jobs)
+        )
+        with TemporaryDirectory() as temp_dir:
+            input_dir = os.path.join(temp_dir, "inputs")
+            os.makedirs(input_dir)
+            for name in ("a.dcm", "a.pkl", "notes.txt"):
+                with open(os.path.join(input_dir, name), 'wb') as file:
+                    file.write(name.encode())
+            self.pipeline.manifest = IngestManifest(os.path.join(temp_dir, "manifest.sqlite"))
+            self.pipeline.run("attributes", {"op": ("Output", [input_dir])})
+            events = []
+            self.pipeline.run("attributes", {"op": ("Output", [input_dir])}, on_event=events.append)
+
+        # Only the failed a.dcm is processed again
+        self.assertEqual(events[0]["unchanged"], 2)
+        self.assertEqual([event["status"] for event in events[1:]], ["failed"])
+
+    def test_run_skips_invalid_operation(self):
+        self.validator.validate.return_value = False
+        summary = self.pipeline.run("profiles", {"op": ("Output", ["fdo1"])})
+        self.assertEqual(summary["skipped"], 1)
+        self.executor.iter_batch.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
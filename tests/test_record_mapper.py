@@ -45,15 +45,118 @@ class TestRecordMapper(unittest.TestCase):
         local_file_path = "/path/to/file.txt"
         expected_result = {
             "http": [
-                "requests.get('http://example.com', params={}, headers={}, files={})"
+                {"method": "GET", "url": "http://example.com", "params": {}, "headers": {}, "data": {},
+                 "files": {}}
             ]
         }
         mapper = RecordMapper("tpm_keys_config.json")
         result = mapper.map_to_request(operation_record, data_record, local_access, local_file_path)
         self.assertEqual(result, expected_result)
 
-    # Add more tests here
+    def test_map_http_record_data_values_with_quotes(self):
+        mapper = RecordMapper("configs/tpm_keys_config_path.json")
+        keys = mapper.tpm_keys
+        operation_record = {
+            keys["httpMethod"]: [{"value": "POST"}],
+            keys["httpDataProperty"]: [
+                {"value": {keys["dataKey"]: [{"value": "vocabulary_id"}], keys["dataValueType"]: [{"value": "vocabularyId"}]}}
+            ]
+        }
+        data_record = {"vocabularyId": [{"value": "O'Reilly \"vocab\""}]}
+        result = mapper.map_http_record(operation_record, data_record, "http://example.com/op", None)
+        self.assertEqual(result, [{
+            "method": "POST", "url": "http://example.com/op", "params": {}, "headers": {},
+            "data": {"vocabulary_id": "O'Reilly \"vocab\""}, "files": {}
+        }])
+
+    def test_map_http_record_file_reference(self):
+        mapper = RecordMapper("configs/tpm_keys_config_path.json")
+        keys = mapper.tpm_keys
+        operation_record = {
+            keys["httpMethod"]: [{"value": "POST"}],
+            keys["httpMultipartFormDataProperty"]: [{"value": {keys["fileKey"]: [{"value": "tensor"}]}}]
+        }
+        result = mapper.map_http_record(operation_record, None, "http://example.com/op", "/tmp/tensor_data.pkl")
+        self.assertEqual(result[0]["files"], {"tensor": {"path": "/tmp/tensor_data.pkl", "mode": "rb"}})
+
+    def test_iter_http_requests_expands_multi_valued_attributes_lazily(self):
+        mapper = RecordMapper("configs/tpm_keys_config_path.json")
+        plan = {"method": "POST", "url": "http://example.com/op", "params": None, "headers": None,
+                "data": [("base_url", "location"), ("language", "language")], "files": None}
+        data_record = {"location": [{"value": "a"}, {"value": "b"}], "language": [{"value": "en"}, {"value": "fr"}]}
+        requests = mapper.iter_http_requests(plan, data_record)
+        self.assertFalse(isinstance(requests, list))
+        self.assertEqual([r["data"] for r in requests], [
+            {"base_url": "a", "language": "en"}, {"base_url": "a", "language": "fr"},
+            {"base_url": "b", "language": "en"}, {"base_url": "b", "language": "fr"}
+        ])
+        self.assertEqual(len(list(mapper.iter_http_requests(plan, data_record, limit=3))), 3)
+
+    def test_map_many_reports_missing_attributes(self):
+        mapper = RecordMapper("configs/tpm_keys_config_path.json")
+        keys = mapper.tpm_keys
+        http_record = {
+            keys["httpMethod"]: [{"value": "POST"}],
+            keys["httpDataProperty"]: [
+                {"value": {keys["dataKey"]: [{"value": "vocabulary_id"}], keys["dataValueType"]: [{"value": "vocabularyId"}]}}
+            ]
+        }
+        operation_record = {
+            keys["externalRecordDependentAccessProtocol"]: [{"value": {keys["operationAccessProtocol"]: [
+                {"value": {keys["httpProtocol"]: [{"value": http_record}]}}
+            ]}}],
+            keys["digitalObjectLocation"]: [{"value": "http://example.com/op"}]
+        }
+        data_records = {
+            "pid/1": {"vocabularyId": [{"value": "ADM"}]},
+            "pid/2": {},
+            "pid/3": {"vocabularyId": [{"value": "BIO"}, {"value": "CHE"}]}
+        }
+        mapped_requests, missing = mapper.map_many(operation_record, data_records)
+        self.assertEqual([(pid, r["data"]) for pid, r in mapped_requests["http"]], [
+            ("pid/1", {"vocabulary_id": "ADM"}), ("pid/3", {"vocabulary_id": "BIO"}), ("pid/3", {"vocabulary_id": "CHE"})
+        ])
+        self.assertEqual(missing, [("pid/2", ["vocabularyId"])])
+
+    def test_iter_many_consumes_data_records_lazily(self):
+        mapper = RecordMapper("configs/tpm_keys_config_path.json")
+        keys = mapper.tpm_keys
+        http_record = {
+            keys["httpMethod"]: [{"value": "POST"}],
+            keys["httpDataProperty"]: [
+                {"value": {keys["dataKey"]: [{"value": "vocabulary_id"}], keys["dataValueType"]: [{"value": "vocabularyId"}]}}
+            ]
+        }
+        operation_record = {
+            keys["externalRecordDependentAccessProtocol"]: [{"value": {keys["operationAccessProtocol"]: [
+                {"value": {keys["httpProtocol"]: [{"value": http_record}]}}
+            ]}}],
+            keys["digitalObjectLocation"]: [{"value": "http://example.com/op"}]
+        }
+        fetched = []
+
+        def data_records():
+            for pid, record in (("pid/1", {"vocabularyId": [{"value": "ADM"}]}), ("pid/2", {}),
+                                ("pid/3", {"vocabularyId": [{"value": "BIO"}]})):
+                fetched.append(pid)
+                yield pid, record
+
+        missing = []
+        requests = mapper.iter_many(operation_record, data_records(), on_missing=lambda pid, types: missing.append((pid, types)))
+        pid, request = next(requests)
+        self.assertEqual((pid, request["data"]), ("pid/1", {"vocabulary_id": "ADM"}))
+        self.assertEqual(fetched, ["pid/1"])
+        self.assertEqual([pid for pid, _ in requests], ["pid/3"])
+        self.assertEqual(missing, [("pid/2", ["vocabularyId"])])
+
 
 if __name__ == "__main__":
     unittest.main()
 
+
+    def test_map_many_rejects_local_access(self):
+        mapper = RecordMapper("configs/tpm_keys_config_path.json")
+        with self.assertRaises(ValueError):
+            mapper.map_many({}, {"pid/1": {}}, local_access=True)
+        with self.assertRaises(ValueError):
+            next(mapper.iter_many({}, iter([("pid/1", {})]), local_access=True))
@@ -0,0 +1,88 @@
+import io
+import os
+import pickle
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import torch
+
+from modules import tensor_format
+
+
+class TestTensorFormat(unittest.TestCase):
+
+    def test_round_trip_keeps_dtype_shape_and_values(self):
+        image = torch.arange(12, dtype=torch.int16).reshape(3, 4).T  # not contiguous
+        label = torch.tensor(2)
+        data = tensor_format.dumps((image, label, torch.zeros(0)))
+
+        self.assertEqual(tensor_format.detect(data), "tensor")
+        loaded_image, loaded_label, empty = tensor_format.load_stream(io.BytesIO(data))
+        self.assertTrue(torch.equal(loaded_image, image))
+        self.assertEqual(loaded_image.dtype, torch.int16)
+        self.assertEqual(loaded_label.shape, torch.Size([]))
+        self.assertEqual(empty.numel(), 0)
+
+    def test_tensors_are_aligned_views_of_the_buffer(self):
+        buffer = bytearray(tensor_format.dumps((np.ones((2, 3), dtype=np.float32), np.arange(5))))
+        image, label = tensor_format.decode(buffer, as_torch=False)
+        base = np.frombuffer(buffer, dtype=np.uint8).ctypes.data
+        self.assertEqual([(array.ctypes.data - base) % tensor_format.ALIGNMENT for array in (image, label)], [0, 0])
+        buffer[-8:] = np.int64(7).tobytes()
+        self.assertEqual(label[-1], 7)
+
+    def test_encode_parts_matches_encode(self):
+        image = torch.rand(5, 3, 3)
+        label = torch.arange(5)
+        specs = [("image", np.float32, image.shape), ("label", np.int64, label.shape)]
+
+        streamed = b"".join(tensor_format.encode_parts(specs, [image.split(2), [label]], chunk_size=16))
+
+        self.assertEqual(streamed, tensor_format.dumps((image, label), names=("image", "label")))
+        self.assertEqual(len(streamed), tensor_format.layout(specs)[2])
+        with self.assertRaises(ValueError):
+            list(tensor_format.encode_parts(specs, [image[:4].split(2), [label]]))
+
+    def test_load_memory_maps_files_and_reads_pickles(self):
+        pair = (torch.rand(2, 8, 8), torch.tensor(1))
+        with TemporaryDirectory() as temp_dir:
+            raw_path = os.path.join(temp_dir, "pair.tensor")
+            pickle_path = os.path.join(temp_dir, "pair.pkl")
+            with open(raw_path, 'wb') as file:
+                file.write(tensor_format.dumps(pair))
+            with open(pickle_path, 'wb') as file:
+                pickle.dump(pair, file)
+
+            for loaded in (tensor_format.load(raw_path), tensor_format.load(raw_path, use_mmap=False), tensor_format.load(pickle_path)):
+                self.assertTrue(torch.equal(loaded[0], pair[0]))
+                self.assertTrue(torch.equal(loaded[1], pair[1]))
+            # Tensors of copy-on-write mappings can be modified without changing the file
+            loaded = tensor_format.load(raw_path)
+            loaded[0].zero_()
+            self.assertEqual(loaded[0].sum(), 0)
+            self.assertTrue(torch.equal(tensor_format.load(raw_path)[0], pair[0]))
+
+    def test_load_stream_starts_at_the_stream_position(self):
+        pair = (torch.rand(2, 8, 8), torch.tensor(1))
+        prefix = b"header"
+        with TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "pair.tensor")
+            with open(path, 'wb') as file:
+                file.write(prefix + tensor_format.dumps(pair))
+            with open(path, 'rb') as file:
+                file.seek(len(prefix))
+                from_file = tensor_format.load_stream(file)
+            stream = io.BytesIO(prefix + tensor_format.dumps(pair))
+            stream.seek(len(prefix))
+            # Streams without a file descriptor fall back to reading the content
+            unmapped = io.BufferedReader(io.BytesIO(prefix + tensor_format.dumps(pair)))
+            unmapped.seek(len(prefix))
+
+            for loaded in (from_file, tensor_format.load_stream(stream), tensor_format.load_stream(unmapped)):
+                self.assertTrue(torch.equal(loaded[0], pair[0]))
+                self.assertTrue(torch.equal(loaded[1], pair[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
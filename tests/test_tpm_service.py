@@ -66,6 +66,27 @@ class TestTPMService(unittest.TestCase):
         record = self.tpm_service.get_record(pid)
         self.assertEqual(record, expected_response)
 
+    def test_remote_connection_is_opened_on_first_request(self):
+        config = dict(self.config, local_records=False)
+        with patch.object(TPMService, 'open_ssh_client') as mock_open_ssh_client:
+            tpm_service = TPMService(config)
+            mock_open_ssh_client.assert_not_called()
+            with patch('requests.get') as mock_get:
+                mock_get.return_value.json.return_value = {"pid": "12345"}
+                tpm_service.get_record("12345")
+                tpm_service.get_record("12345")
+                mock_get.assert_called_with("pid-endpoint12345", headers={"accept": "application/json"})
+            mock_open_ssh_client.assert_called_once()
+            tpm_service.close_connection()
+            mock_open_ssh_client.return_value.close.assert_called_once()
+
+    def test_remote_records_without_address_skip_ssh(self):
+        config = dict(self.config, local_records=False, address="")
+        with patch.object(TPMService, 'open_ssh_client') as mock_open_ssh_client, patch('requests.get') as mock_get:
+            mock_get.return_value.json.return_value = {"pid": "12345"}
+            self.assertEqual(TPMService(config).get_record("12345"), {"pid": "12345"})
+            mock_open_ssh_client.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
 
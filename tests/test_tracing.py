@@ -0,0 +1,67 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import tracing
+from modules.tracing import Tracer, annotate, bind, span, traced
+
+
+def complete_events(tracer):
+    return {event["name"]: event for event in tracer.to_chrome_trace()["traceEvents"] if event["ph"] == "X"}
+
+
+class TestTracing(unittest.TestCase):
+
+    def test_spans_are_noops_without_active_tracer(self):
+        with span("tpm.get_record", pid="fdo1") as inactive:
+            inactive.set(bytes=10)
+            annotate(found=True)
+        self.assertIs(inactive, tracing.NOOP_SPAN)
+        self.assertIsNone(tracing.current_span.get())
+
+    def test_nested_spans_and_attributes(self):
+        @traced("validate.date")
+        def date_evaluation():
+            annotate(valid=True)
+            return True
+
+        tracer = Tracer()
+        with tracer.activate():
+            with span("validate", pid="fdo1"):
+                self.assertTrue(date_evaluation())
+            with self.assertRaises(ValueError), span("executor.download"):
+                raise ValueError("broken")
+        events = complete_events(tracer)
+
+        self.assertEqual(events["validate"]["args"]["pid"], "fdo1")
+        self.assertIsNone(events["validate"]["args"]["parent_id"])
+        self.assertEqual(events["validate.date"]["args"]["parent_id"], events["validate"]["args"]["span_id"])
+        self.assertTrue(events["validate.date"]["args"]["valid"])
+        self.assertEqual(events["validate.date"]["cat"], "validate")
+        self.assertGreaterEqual(events["validate.date"]["ts"], events["validate"]["ts"])
+        self.assertLessEqual(events["validate.date"]["dur"], events["validate"]["dur"])
+        self.assertIn("broken", events["executor.download"]["args"]["error"])
+        self.assertIsNone(tracing.current_tracer.get())
+
+    def test_bound_functions_trace_in_worker_threads(self):
+        def execute(item):
+            with span("executor.execute", item=item):
+                return item
+
+        tracer = Tracer()
+        with tracer.activate(), span("pipeline.operation"), ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(bind(execute), item) for item in ("fdo1", "fdo2")]
+            self.assertEqual([future.result() for future in futures], ["fdo1", "fdo2"])
+        trace = tracer.to_chrome_trace()["traceEvents"]
+
+        operation = next(event for event in trace if event["name"] == "pipeline.operation")
+        executions = [event for event in trace if event["name"] == "executor.execute"]
+        self.assertEqual(sorted(event["args"]["item"] for event in executions), ["fdo1", "fdo2"])
+        for event in executions:
+            self.assertEqual(event["args"]["parent_id"], operation["args"]["span_id"])
+            self.assertNotEqual(event["tid"], operation["tid"])
+        thread_names = [event for event in trace if event["ph"] == "M" and event["name"] == "thread_name"]
+        self.assertTrue({event["tid"] for event in executions} <= {event["tid"] for event in thread_names})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import MagicMock
+
+from modules.ops_executor import SpooledContent
+from modules.workflow_runner import WorkflowRunner
+
+
+def binding(target, name, pid, output, required=None):
+    row = {"targetName": {"value": target}, "operationName": {"value": name},
+           "operationLabel": {"value": pid}, "outputName": {"value": output}}
+    if required is not None:
+        row["requiredOperationLabel"] = {"value": required}
+    return row
+
+
+class TestWorkflowRunner(unittest.TestCase):
+
+    def test_build_dag_reduces_alternative_requirements(self):
+        results = {"results": {"bindings": [
+            binding("resize", "dicom", "op/dicom", "tensor"),
+            binding("resize", "normalize", "op/normalize", "normalized", "op/dicom"),
+            binding("resize", "resize", "op/resize", "resized", "op/dicom"),
+            binding("resize", "resize", "op/resize", "resized", "op/normalize")
+        ]}}
+        dag = WorkflowRunner.build_dag(results)
+        self.assertEqual(dag["op/dicom"]["requires"], [])
+        self.assertEqual(dag["op/normalize"]["requires"], ["op/dicom"])
+        self.assertEqual(dag["op/resize"]["requires"], ["op/normalize"])
+        self.assertTrue(dag["op/resize"]["target"])
+        self.assertFalse(dag["op/normalize"]["target"])
+
+    def test_build_dag_rejects_cycles(self):
+        results = {"results": {"bindings": [
+            binding("a", "a", "op/a", "x", "op/b"),
+            binding("a", "b", "op/b", "y", "op/a")
+        ]}}
+        with self.assertRaises(ValueError):
+            WorkflowRunner.build_dag(results)
+
+    def test_run_workflow_passes_intermediate_outputs_in_memory(self):
+        tpm_service = MagicMock()
+        tpm_service.get_record.side_effect = lambda pid: {"pid": pid, "entries": {"pid": pid}}
+        validator = MagicMock()
+        validator.validate.return_value = True
+        mapper = MagicMock()
+        mapper.iter_many.side_effect = lambda record, data_records, on_missing: (
+            (pid, {"method": "GET", "url": "http://example.com/root"}) for pid, _ in data_records)
+        mapper.map_to_request.side_effect = lambda record, data, local, path, lazy: {"http": iter([
+            {"method": "POST", "url": "http://example.com/" + record["pid"], "files": {"file": {"path": path, "mode": "rb"}}}
+        ])}
+        executor = MagicMock()
+        executor.max_workers = 2
+        spools = []
+
+        def fetch(file_name, request_spec, spool_size):
+            content = SpooledContent(file_name + ".pkl")
+            content.file.write(b"tensor of " + file_name.encode())
+            spools.append(content)
+            return {"file_name": file_name, "url": request_spec["url"], "status_code": 200, "path": None,
+                    "content": content, "size": 0, "duration": 0.1, "cached": False, "error": None,
+                    "status": 'Request successful'}
+
+        uploads = []
+
+        def execute(file_name, request_spec, folder_name, operation_pid, refresh):
+            uploads.append((operation_pid, file_name, request_spec["files"]["file"]["content"].read()))
+            return {"file_name": file_name, "url": request_spec["url"], "status_code": 200, "path": folder_name + "/" + file_name,
+                    "size": 0, "duration": 0.1, "cached": False, "error": None, "status": 'Request successful'}
+
+        executor.fetch.side_effect = fetch
+        executor.execute.side_effect = execute
+        dag = {
+            "op/root": {"name": "root", "output": "Tensor", "requires": [], "target": False},
+            "op/left": {"name": "left", "output": "Left", "requires": ["op/root"], "target": True},
+            "op/right": {"name": "right", "output": "Right", "requires": ["op/root"], "target": True}
+        }
+        runner = WorkflowRunner(tpm_service, validator, mapper, executor)
+        events = []
+
+        summary = runner.run_workflow(dag, ["fdo1", "fdo2"], on_event=events.append)
+
+        self.assertEqual(summary, {"folders": {"op/left": "Left", "op/right": "Right"}, "succeeded": 6, "failed": 0, "skipped": 0})
+        self.assertEqual(executor.fetch.call_count, 2)
+        self.assertEqual(sorted(uploads), [
+            ("op/left", "fdo1", b"tensor of fdo1"), ("op/left", "fdo2", b"tensor of fdo2"),
+            ("op/right", "fdo1", b"tensor of fdo1"), ("op/right", "fdo2", b"tensor of fdo2")
+        ])
+        self.assertTrue(all(content.file.closed for content in spools))
+        self.assertEqual([event["inputs"] for event in events if event["type"] == "operation"], [2, 2, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
-from flask import Flask, render_template, request, redirect, session
+from flask import Flask, render_template, request, redirect, session, jsonify, abort, Response, stream_with_context
 import os
 import json
+import time
+import threading
 from redis import Redis
 import requests
 import ast
@@ -10,6 +12,11 @@ from modules.record_mapper import RecordMapper
 from modules.kernel_workflow import KernelWorkflow
 from modules.query_processing import QueryProcessing
 from modules.ops_executor import Ops_Executor
+from modules.execution_cache import ExecutionCache
+from modules.ingest_manifest import IngestManifest
+from modules.pipeline import Pipeline
+from modules.job_queue import JobQueue
+from modules.metrics import REGISTRY
 
 app = Flask(__name__)
 redis_client = Redis(host='localhost', port=6379, db=0, decode_responses=True)
@@ -24,12 +31,48 @@ with open(services_config, 'r') as services_config_file:
 
 app.secret_key = os.environ.get('SECRET_KEY', 'default-secret-key-for-development-only')  # you should set SECRET_KEY environment variable in production
 
-sparql_service = SPARQLService(services_config_file["graph_db"])
-tpm_service = TPMService(services_config_file["tpm"])
-executor = Ops_Executor()
 query_processing = QueryProcessing()
-validator = KernelWorkflow(tpm_keys_config_path)
-mapper = RecordMapper(tpm_keys_config_path)
+
+
+# The services are constructed on first use, so importing the application neither opens
+# connections nor fails if a service is unreachable. The lock keeps concurrent job workers
+# from constructing them twice.
+_services_lock = threading.Lock()
+_sparql_service = None
+_pipeline = None
+
+
+def get_sparql_service():
+    """
+    Get the SPARQL service.
+
+    :return: The SPARQLService.
+    """
+    global _sparql_service
+    if _sparql_service is None:
+        with _services_lock:
+            if _sparql_service is None:
+                _sparql_service = SPARQLService(services_config_file["graph_db"])
+    return _sparql_service
+
+
+def get_pipeline():
+    """
+    Get the pipeline with the TPM service, validator, mapper and executor.
+
+    :return: The Pipeline.
+    """
+    global _pipeline
+    if _pipeline is None:
+        with _services_lock:
+            if _pipeline is None:
+                tpm_service = TPMService(services_config_file["tpm"])
+                executor = Ops_Executor(cache=ExecutionCache(os.path.join(current_dir, ".execution_cache")))
+                validator = KernelWorkflow(tpm_keys_config_path)
+                mapper = RecordMapper(tpm_keys_config_path)
+                manifest = IngestManifest(os.path.join(current_dir, ".ingest_manifest", "manifest.sqlite"))
+                _pipeline = Pipeline(tpm_service, validator, mapper, executor, manifest)
+    return _pipeline
 
 
 def get_operations_for_profile(profile, data):
@@ -117,6 +160,7 @@ def execute_query():
         query_type = request.form.get('query_select')
         input_text = request.form.get('input_text')
 
+        sparql_service = get_sparql_service()
         if query_type == 'profiles':
             # Construct the SPARQL query for Query 1
             sparql_query = sparql_service.construct_query1(input_text)
@@ -149,6 +193,8 @@ def select_profiles():
         selected_profiles = request.form.getlist('selected_items')
         redis_client.set('selection', json.dumps(selected_profiles))
         session['sparql_query'] = "profiles"
+        session['refresh'] = request.form.get('refresh') == '1'
+        session['trace'] = request.form.get('trace') == '1'
         return redirect('/get_pids')
 
     # For GET request, display the hierarchical data to the user
@@ -167,67 +213,161 @@ def select_attributes():
         selected_attributes = request.form.getlist('selected_items')
         redis_client.set('selection', json.dumps(selected_attributes))
         session['sparql_query'] = "attributes"
+        session['refresh'] = request.form.get('refresh') == '1'
+        session['trace'] = request.form.get('trace') == '1'
         return redirect('/get_pids')
 
     # For GET request, display the hierarchical data to the user
     data = json.loads(redis_client.get('restructured_results'))
     return render_template('select_attributes.html', data=data)
 
+def run_job(payload, on_event):
+    """
+    Run the pipeline for a submitted job.
+
+    :param payload: The job payload with the mode, the selection and the refresh flag.
+    :param on_event: The callback receiving the progress events.
+    :return: The summary of the pipeline run.
+    """
+    return get_pipeline().run(payload["mode"], payload["selection"], payload["refresh"], on_event)
+
+
+job_queue = JobQueue(redis_client, run_job, workers=int(os.environ.get('JOB_WORKERS', 2)))
+
+
+@app.before_request
+def start_job_workers():
+    """
+    Start the job workers if they are not running yet, so jobs queued before a restart are
+    processed and jobs abandoned by a crashed worker are queued again.
+    """
+    job_queue.start()
+
+
 def timeout_handler(self, signum, frame):
         raise TimeoutError
 
 @app.route('/get_pids', methods=['GET', 'POST'])
 def get_pids():
     """
-    Get PIDs.
+    Submit the selected operations as background job.
 
-    :return: The rendered template.
+    The spans of the job are recorded if tracing was selected or the trace query parameter is 1.
+
+    :return: A redirect to the job status page.
     """
-    sparql_query = session.get('sparql_query', {})
     selected_pids = json.loads(redis_client.get('selection'))
-    data = convert_to_dict(selected_pids)
-    responses = []
-    for op, tuple_ in data.items():
-        op_record = tpm_service.get_record(op)
-        is_valid_op = validator.validate(op_record, checksum=False)
-        if not is_valid_op:
-            # Handle invalid digital object
-            continue
-        outputType = tuple_[0]
-        if sparql_query == "profiles":
-            for fdo in tuple_[1]:
-                fdo_record = tpm_service.get_record(fdo)
-                if fdo == "21.11152/02652ab1-58e4-409f-bcff-c2194bf345b8":
-                    continue
-                is_valid_data = validator.validate(fdo_record)
-                print(is_valid_data)
-                if not is_valid_data:
-                    print("not valid:",fdo)
-                    # Handle invalid digital object
-                    continue
-                returned_requests = mapper.map_to_request(op_record["entries"], fdo_record["entries"], local_access=False)
-                if list(returned_requests.keys())[0] == "http":
-                    for req in list(returned_requests.values())[0]:
-                        response, folder_name = executor.execute_http_request(fdo, req, outputType)
-                        if response == "Request failed":
-                            pass
-                        else:
-                            responses.append(response)
-        elif sparql_query == "attributes":
-            local_dir = tuple_[1][0]  # currently only one level of input attributes
-            for file in os.listdir(local_dir):
-                filepath = os.path.join(local_dir, file)
-                filename, _ = os.path.splitext(file)
-                returned_requests = mapper.map_to_request(op_record["entries"], None, True, filepath)
-                if list(returned_requests.keys())[0] == "http":
-                    for req in list(returned_requests.values())[0]:
-                        response, folder_name = executor.execute_http_request(filename, req, outputType)
-                        if response == "Request failed":
-                            pass
-                        else:
-                            responses.append(response)
-
-    return render_template('display_response.html', outputType=outputType, folder_name=folder_name, responses=responses)
+    payload = {
+        "mode": session.get('sparql_query', {}),
+        "selection": convert_to_dict(selected_pids),
+        "refresh": session.get('refresh', False),
+        "trace": session.get('trace', False) or request.args.get('trace') == '1'
+    }
+    job_id = job_queue.enqueue(payload)
+    session['job_id'] = job_id
+    return redirect(f'/jobs/{job_id}')
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Display the progress of a job, or its results once it is finished.
+
+    :param job_id: The ID of the job.
+    :return: The rendered template.
+    """
+    status = job_queue.get_status(job_id)
+    if status is None:
+        abort(404)
+    if status["status"] == "done":
+        result = status["result"]
+        return render_template('display_response.html', outputType=result["outputType"], folder_name=result["folder_name"],
+                               succeeded=result["succeeded"], failed=result["failed"], skipped=result["skipped"],
+                               job_id=job_id, traced=status["traced"])
+    return render_template('job_status.html', job_id=job_id, status=status)
+
+
+@app.route('/jobs/<job_id>/progress', methods=['GET'])
+def job_progress(job_id):
+    """
+    Return the progress of a job and the status of its items as JSON.
+
+    :param job_id: The ID of the job.
+    :return: The JSON response.
+    """
+    status = job_queue.get_status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job"}), 404
+    start = request.args.get('start', 0, type=int)
+    events = job_queue.get_events(job_id, start)
+    status["items"] = [event for event in events if event["type"] == "item"]
+    status["next"] = start + len(events)
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def job_stream(job_id):
+    """
+    Stream the progress events of a job as server-sent events.
+
+    Each event is pushed as soon as it is recorded, so the result of an item is shown as soon
+    as its request is finished. The ID of an event is its index, so reconnecting clients resume
+    after the last received event.
+
+    :param job_id: The ID of the job.
+    :return: The event stream.
+    """
+    if job_queue.get_status(job_id) is None:
+        abort(404)
+    start = request.headers.get('Last-Event-ID', -1, type=int) + 1
+    start = max(start, request.args.get('start', 0, type=int))
+
+    def generate():
+        index = start
+        last_sent = time.monotonic()
+        while True:
+            events = job_queue.get_events(job_id, index)
+            for event in events:
+                yield f"id: {index}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                index += 1
+                if event["type"] == "end":
+                    return
+            if events:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > 15:
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(0.25)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/jobs/<job_id>/trace', methods=['GET'])
+def job_trace(job_id):
+    """
+    Return the recorded spans of a traced job as timeline in the Chrome trace format.
+
+    :param job_id: The ID of the job.
+    :return: The JSON response, to be opened in chrome://tracing or Perfetto.
+    """
+    trace = job_queue.get_trace(job_id)
+    if trace is None:
+        return jsonify({"error": "No trace recorded for this job"}), 404
+    response = jsonify(trace)
+    response.headers['Content-Disposition'] = f'attachment; filename=trace-{job_id}.json'
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Expose the stage latencies, transferred bytes and cache lookups for Prometheus.
+
+    :return: The metrics in the Prometheus text format.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/end_session', methods=['GET'])